@@ -36,7 +36,7 @@ cp config/settings_postgres.py config/settings.py
 echo "✓ Settings updated (backup saved)"
 
 echo ""
-echo "Step 4: Running migrations on PostgreSQL..."
+echo "Step 4: Running migrations on PostgreSQL (including the embedding column and its HNSW index)..."
 python manage.py migrate
 echo "✓ Schema created"
 
@@ -46,30 +46,11 @@ python manage.py loaddata ../mysql_backup.json
 echo "✓ Data loaded"
 
 echo ""
-echo "Step 6: Updating models with embedding field..."
-cp videos/models.py videos/models_old_backup.py
-cp videos/models_with_embeddings.py videos/models.py
-echo "✓ Models updated (backup saved)"
-
-echo ""
-echo "Step 7: Creating migration for embedding field..."
-python manage.py makemigrations
-python manage.py migrate
-echo "✓ Embedding field added"
-
-echo ""
-echo "Step 8: Generating embeddings for existing posts..."
+echo "Step 6: Generating embeddings for existing posts..."
 echo "This may take a while depending on post count..."
 python manage.py generate_embeddings --batch_size=50
 echo "✓ Embeddings generated"
 
-echo ""
-echo "Step 9: Creating HNSW index for fast search..."
-python manage.py dbshell <<EOF
-CREATE INDEX ON videos_post USING hnsw (embedding vector_cosine_ops);
-EOF
-echo "✓ Index created"
-
 echo ""
 echo "=== Migration Complete! ==="
 echo ""
@@ -83,5 +64,4 @@ echo ""
 echo "Files backed up:"
 echo "  - mysql_backup.json (data)"
 echo "  - config/settings_mysql_backup.py (old settings)"
-echo "  - videos/models_old_backup.py (old models)"
 
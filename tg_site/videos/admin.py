@@ -1,11 +1,40 @@
 from django.contrib import admin
-from .models import Channel, Post
+from .models import Channel, EmbeddingJob, FetchJob, FetchWorker, Post
 
 
 @admin.register(Channel)
 class ChannelAdmin(admin.ModelAdmin):
-    list_display = ['username', 'title', 'created_at']
+    list_display = [
+        'username', 'title', 'created_at', 'leased_by', 'lease_expires_at',
+        'fetch_status', 'fetch_failures', 'fetch_blocked_until', 'last_fetch_error_preview',
+    ]
+    list_filter = ['fetch_status', 'search_config']
     search_fields = ['username', 'title']
+    actions = ['reset_fetch_failures']
+
+    def last_fetch_error_preview(self, obj):
+        return obj.last_fetch_error[:100]
+
+    @admin.action(description='Retry now (reset fetch failures)')
+    def reset_fetch_failures(self, request, queryset):
+        queryset.update(fetch_status='ok', fetch_failures=0, fetch_blocked_until=None)
+
+
+@admin.register(FetchWorker)
+class FetchWorkerAdmin(admin.ModelAdmin):
+    list_display = ['worker_id', 'heartbeat_at']
+
+
+@admin.register(FetchJob)
+class FetchJobAdmin(admin.ModelAdmin):
+    list_display = ['channel', 'priority', 'created_at', 'claimed_by', 'claimed_at']
+
+
+@admin.register(EmbeddingJob)
+class EmbeddingJobAdmin(admin.ModelAdmin):
+    list_display = ['post', 'queued_at', 'claimed_by', 'claimed_at', 'attempts', 'parked_at', 'last_error']
+    list_filter = [('parked_at', admin.EmptyFieldListFilter)]
+    raw_id_fields = ['post']
 
 
 @admin.register(Post)
@@ -0,0 +1,74 @@
+"""
+Per-channel circuit breaker for the fetcher.
+
+A failed poll is recorded on the Channel (fetch_failures, last_fetch_error) and
+blocks the channel for an exponentially growing backoff. Once a channel has used
+up its ERROR_BUDGET of consecutive failures, or fails in a way that will not fix
+itself (deleted, renamed, private), the circuit opens and the channel is only
+probed every CIRCUIT_OPEN_INTERVAL. A successful poll closes it again. Blocked
+channels cost no Telegram calls: the scheduler simply queues them until
+fetch_blocked_until.
+"""
+import os
+from datetime import datetime, timedelta
+
+from telethon.errors import (
+    ChannelInvalidError, ChannelPrivateError, FloodWaitError, UsernameInvalidError, UsernameNotOccupiedError,
+)
+
+from .models import Channel
+
+BACKOFF_BASE = 60  # seconds after the first failure, doubled on each further one
+BACKOFF_MAX = 3600  # seconds
+ERROR_BUDGET = int(os.getenv('CHANNEL_ERROR_BUDGET', '5'))  # consecutive failures before the circuit opens
+CIRCUIT_OPEN_INTERVAL = int(os.getenv('CIRCUIT_OPEN_INTERVAL', '86400'))  # seconds between probes of an open circuit
+
+
+class UsernameUnresolvedError(Exception):
+    """The channel's username resolves to nothing. Telethon reports this as a plain ValueError."""
+
+
+# The channel is gone or unreachable for this account; retrying sooner will not help.
+PERMANENT_ERRORS = (
+    ChannelInvalidError, ChannelPrivateError, UsernameInvalidError, UsernameNotOccupiedError, UsernameUnresolvedError,
+)
+
+
+def backoff_seconds(failures: int) -> float:
+    return min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+
+
+def blocked_seconds(channel: Channel, now: datetime) -> float:
+    """Seconds until the channel may be polled again (0 when it is not blocked)."""
+    if channel.fetch_blocked_until is None:
+        return 0.0
+    return max(0.0, (channel.fetch_blocked_until - now).total_seconds())
+
+
+def record_failure(channel: Channel, error: Exception, now: datetime) -> str:
+    """Count a failed poll and block the channel accordingly. Runs on the DB pool. Returns the new status."""
+    failures = channel.fetch_failures + 1
+    if isinstance(error, PERMANENT_ERRORS) or failures >= ERROR_BUDGET:
+        status, delay = 'open', CIRCUIT_OPEN_INTERVAL
+    else:
+        status, delay = 'backoff', backoff_seconds(failures)
+        if isinstance(error, FloodWaitError):
+            delay = max(delay, error.seconds)
+    fields = {
+        'fetch_status': status,
+        'fetch_failures': failures,
+        'last_fetch_error': f"{type(error).__name__}: {error}"[:1000],
+        'last_fetch_error_at': now,
+        'fetch_blocked_until': now + timedelta(seconds=delay),
+    }
+    Channel.objects.filter(pk=channel.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(channel, name, value)
+    return status
+
+
+def recovery_fields(channel: Channel) -> dict:
+    """Fields that close the circuit after a successful poll; empty when it was not failing."""
+    if channel.fetch_status == 'ok' and not channel.fetch_failures:
+        return {}
+    return {'fetch_status': 'ok', 'fetch_failures': 0, 'fetch_blocked_until': None}
@@ -0,0 +1,193 @@
+"""
+Embed-on-ingest queue.
+
+A trigger on videos_post (migration 0013) queues an EmbeddingJob in the same
+transaction whenever a post is inserted or its text changes, so fresh posts get
+embedded without anyone running generate_embeddings or scanning for missing
+embeddings. The trigger only queues while EmbeddingQueueState is enabled, which
+the first embedding worker to start does; `manage.py embed_queue --disable` turns
+it off again, so nothing piles up where no worker runs. Embedding workers (a thread of each fetch worker with EMBED_ON_INGEST,
+or manage.py embed_queue) claim jobs that have settled for EMBED_QUEUE_SETTLE
+seconds, newest first, with SELECT ... FOR UPDATE SKIP LOCKED, and embed each claim
+as one batch. A job claimed by a worker that died is claimable again after
+LEASE_TTL. A post edited while it is being embedded is requeued by the trigger,
+and the vector of its old text is not written. A batch the backend rejects outright
+is split in halves until the posts it fails on are isolated; a post that fails on its
+own EMBED_QUEUE_MAX_ATTEMPTS times is parked until its text changes again.
+"""
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import openai
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .leasing import LEASE_TTL
+from .metrics import FETCH_METRICS
+from .embeddings import get_backend
+from .models import EmbeddingGenerator, EmbeddingJob, EmbeddingQueueState, Post, text_embedding_key
+
+EMBED_ON_INGEST = os.getenv('EMBED_ON_INGEST', '0') == '1'  # run an embedding worker thread in each fetch worker
+EMBED_QUEUE_BATCH = int(os.getenv('EMBED_QUEUE_BATCH', '256'))  # posts claimed and embedded together
+EMBED_QUEUE_POLL_INTERVAL = 5  # seconds between checks while the queue is empty
+EMBED_QUEUE_SETTLE = 5  # seconds a job waits after its last edit, so a burst of edits is embedded once
+EMBED_QUEUE_MAX_ATTEMPTS = int(os.getenv('EMBED_QUEUE_MAX_ATTEMPTS', '3'))  # failures of a post alone before it is parked
+
+
+def set_embed_on_ingest(enabled: bool):
+    """Switch queueing by the trigger on or off; switching it off drops the jobs nobody will drain."""
+    with transaction.atomic():
+        EmbeddingQueueState.objects.update_or_create(pk=1, defaults={'enabled': enabled})
+        if not enabled:
+            EmbeddingJob.objects.all().delete()
+
+
+def claim_embedding_jobs(worker_id: str, count: int, now: datetime, settle: float = EMBED_QUEUE_SETTLE) -> list[EmbeddingJob]:
+    """Claim up to count settled jobs, most recently queued first so fresh posts overtake a backfill."""
+    if count <= 0:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE videos_embeddingjob
+            SET claimed_by = %s, claimed_at = %s
+            WHERE id IN (
+                SELECT id FROM videos_embeddingjob
+                WHERE queued_at <= %s AND (claimed_at IS NULL OR claimed_at < %s) AND parked_at IS NULL
+                ORDER BY queued_at DESC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, [worker_id, now, now - timedelta(seconds=settle), now - timedelta(seconds=LEASE_TTL), count])
+        job_ids = [row[0] for row in cursor.fetchall()]
+    return list(
+        EmbeddingJob.objects.filter(pk__in=job_ids).select_related('post')
+        .only('queued_at', 'claimed_by', 'claimed_at', 'attempts', 'post__text').order_by('-queued_at')
+    )
+
+
+def is_input_error(error: Exception) -> bool:
+    """Whether error may come from the texts themselves, so the rest of a batch could still succeed."""
+    if isinstance(error, openai.APIError):
+        return isinstance(error, (openai.BadRequestError, openai.UnprocessableEntityError))
+    # Local backends raise plain exceptions for bad input; missing setup and the DB are not the texts' fault.
+    return not isinstance(error, (ImproperlyConfigured, DatabaseError))
+
+
+def embed_jobs(jobs: list[EmbeddingJob]) -> tuple[dict[int, list | None], dict[int, Exception]]:
+    """
+    Embeddings of the jobs' posts by job pk, and the errors of jobs that could not be embedded.
+    A batch failing on an input error is halved until the posts causing it are isolated.
+    """
+    try:
+        embeddings = EmbeddingGenerator.generate_embeddings_batch([job.post.text for job in jobs])
+        return {job.pk: embedding for job, embedding in zip(jobs, embeddings)}, {}
+    except Exception as e:
+        if len(jobs) == 1 or not is_input_error(e):
+            return {}, {job.pk: e for job in jobs}
+    middle = len(jobs) // 2
+    embeddings, errors = embed_jobs(jobs[:middle])
+    more_embeddings, more_errors = embed_jobs(jobs[middle:])
+    return embeddings | more_embeddings, errors | more_errors
+
+
+def record_failures(jobs: list[EmbeddingJob], errors: dict[int, Exception], worker_id: str, now: datetime) -> int:
+    """
+    Leave failed jobs claimed, so any worker retries them once the claim expires. Jobs that
+    failed alone on an input error count an attempt and are parked after EMBED_QUEUE_MAX_ATTEMPTS.
+    Returns the number of jobs parked.
+    """
+    parked = 0
+    FETCH_METRICS.inc('tg_fetch_embedding_errors_total')
+    error = next(iter(errors.values()))
+    print(f"  ❌ Embedding {len(errors)} queued posts failed ({type(error).__name__}: {error})")
+    for job in jobs:
+        error = errors.get(job.pk)
+        if error is None or not is_input_error(error):
+            continue
+        attempts = job.attempts + 1
+        parked_at = now if attempts >= EMBED_QUEUE_MAX_ATTEMPTS else None
+        EmbeddingJob.objects.filter(pk=job.pk, claimed_by=worker_id, claimed_at=now).update(
+            attempts=F('attempts') + 1, last_error=f"{type(error).__name__}: {error}"[:1000], parked_at=parked_at,
+        )
+        if parked_at:
+            parked += 1
+            print(f"  🅿️  Parked post {job.post_id} after {attempts} failed embedding attempts ({type(error).__name__}: {error})")
+    return parked
+
+
+def embed_queued(
+    worker_id: str, batch_size: int = EMBED_QUEUE_BATCH, settle: float = EMBED_QUEUE_SETTLE, totals: Counter | None = None,
+) -> int:
+    """
+    Claim, embed and write one batch of queued posts. Returns the number of jobs claimed, and
+    adds the posts embedded and the jobs that failed or were parked to totals if given.
+    """
+    totals = Counter() if totals is None else totals
+    now = timezone.now()
+    jobs = claim_embedding_jobs(worker_id, batch_size, now, settle)
+    if not jobs:
+        return 0
+    claimed = len(jobs)
+    embeddings, errors = embed_jobs(jobs)
+    if errors:
+        totals['failed'] += len(errors)
+        totals['parked'] += record_failures(jobs, errors, worker_id, now)
+    jobs = [job for job in jobs if job.pk in embeddings]
+    if not jobs:
+        return 0  # nothing could be embedded: the caller waits before claiming more
+
+    with transaction.atomic():
+        current_texts = dict(
+            Post.objects.select_for_update().filter(pk__in=[job.post_id for job in jobs]).order_by('pk').values_list('pk', 'text')
+        )
+        # Blank texts come back as None, which clears the embedding of a post whose text was removed.
+        model = get_backend().model
+        posts = [
+            Post(pk=job.post_id, embedding=embeddings[job.pk], embedding_key=text_embedding_key(model, job.post.text) if embeddings[job.pk] else None)
+            for job in jobs
+            if current_texts.get(job.post_id) == job.post.text
+        ]
+        Post.objects.bulk_update(posts, ['embedding', 'embedding_key'], batch_size=500)
+        # Jobs requeued by an edit since the claim have lost it and stay queued.
+        EmbeddingJob.objects.filter(pk__in=[job.pk for job in jobs], claimed_by=worker_id, claimed_at=now).delete()
+
+    written_at = timezone.now()
+    queued_at = {job.post_id: job.queued_at for job in jobs}
+    totals['embedded'] += len(posts)
+    FETCH_METRICS.inc('tg_fetch_posts_embedded_total', len(posts))
+    for post in posts:
+        FETCH_METRICS.observe('tg_fetch_embedding_lag_seconds', (written_at - queued_at[post.pk]).total_seconds())
+    return claimed
+
+
+def run_embedding_worker(worker_id: str, stop: threading.Event, batch_size: int = EMBED_QUEUE_BATCH):
+    """Drain the queue until stop is set; a full batch is followed by the next one right away."""
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                claimed = embed_queued(worker_id, batch_size)
+            except Exception as e:
+                print(f"  ❌ Embedding queue error ({type(e).__name__}: {e})")
+                claimed = 0
+            if claimed < batch_size:
+                stop.wait(EMBED_QUEUE_POLL_INTERVAL)
+    finally:
+        connection.close()
+
+
+def start_embedding_worker(worker_id: str) -> threading.Event:
+    """
+    Switch queueing on and run run_embedding_worker on a daemon thread; set the returned event
+    to stop it. Raises ImproperlyConfigured up front if the embedding backend is not set up.
+    """
+    get_backend().check()
+    set_embed_on_ingest(True)
+    stop = threading.Event()
+    threading.Thread(target=run_embedding_worker, args=(worker_id, stop), name='embedding-queue', daemon=True).start()
+    return stop
@@ -0,0 +1,149 @@
+"""
+Offline stand-in for the OpenAI embeddings endpoint, enforcing a rate limit.
+
+StubEmbeddingServer answers POST /v1/embeddings like the API: deterministic
+unit vectors derived from each input's hash (float or base64 encoding), usage
+tokens estimated at one per 4 UTF-8 bytes, and x-ratelimit-* headers. Requests
+beyond rpm / tpm in a sliding minute (window) get a 429 with retry-after, so the
+EmbeddingRateLimiter can be exercised against a known quota by pointing
+OPENAI_BASE_URL at it. Used by the embedding_stub command and tests.
+"""
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .embeddings import EMBEDDING_DIMENSIONS
+
+WINDOW = 60.0  # seconds the rpm / tpm limits are counted over
+
+
+def stub_vector(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    """Deterministic unit vector for text."""
+    rng = random.Random(hashlib.sha256(text.encode('utf-8')).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def stub_tokens(text: str) -> int:
+    return max(1, len(text.encode('utf-8')) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubEmbeddingServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/v1/embeddings', '/embeddings'):
+            self.send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}}, {})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        texts = request.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        tokens = sum(stub_tokens(text) for text in texts)
+        admitted, headers = self.server.admit(tokens)
+        if not admitted:
+            error = {'message': 'Rate limit reached (stub)', 'type': 'requests', 'code': 'rate_limit_exceeded'}
+            self.send_json(429, {'error': error}, headers)
+            return
+        self.server.enter()
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            data = []
+            for index, text in enumerate(texts):
+                vector = stub_vector(text)
+                if request.get('encoding_format') == 'base64':
+                    vector = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode()
+                data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+            self.send_json(200, {
+                'object': 'list', 'data': data, 'model': request.get('model', ''),
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+            }, headers)
+        finally:
+            self.server.leave()
+
+
+class StubEmbeddingServer(ThreadingHTTPServer):
+    """Counts requests and tokens over the last window seconds; see the module docstring."""
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), rpm: int = 3000, tpm: int = 1000000, latency: float = 0.0,
+                 window: float = WINDOW, rate_headers: bool = True):
+        super().__init__(address, StubHandler)
+        self.rpm = rpm  # per window, which tests shorten
+        self.tpm = tpm
+        self.latency = latency
+        self.window_seconds = window
+        self.rate_headers = rate_headers  # False acts like a provider that only answers 429s
+        self.lock = threading.Lock()
+        self.window = deque()  # (admitted at, tokens)
+        self.served = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def admit(self, tokens: int) -> tuple[bool, dict]:
+        with self.lock:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - self.window_seconds:
+                self.window.popleft()
+            used_tokens = sum(counted for _, counted in self.window)
+            admitted = len(self.window) < self.rpm and used_tokens + tokens <= self.tpm
+            if admitted:
+                self.window.append((now, tokens))
+                self.served += 1
+                used_tokens += tokens
+            else:
+                self.throttled += 1
+            # Capacity frees up as the oldest admitted request leaves the window.
+            reset = self.window[0][0] + self.window_seconds - now if self.window else 0.0
+            headers = {} if not self.rate_headers else {
+                'x-ratelimit-limit-requests': str(self.rpm),
+                'x-ratelimit-limit-tokens': str(self.tpm),
+                'x-ratelimit-remaining-requests': str(max(0, self.rpm - len(self.window))),
+                'x-ratelimit-remaining-tokens': str(max(0, self.tpm - used_tokens)),
+                'x-ratelimit-reset-requests': f'{int(reset * 1000)}ms',
+                'x-ratelimit-reset-tokens': f'{int(reset * 1000)}ms',
+            }
+            if not admitted:
+                headers['retry-after-ms'] = str(max(1, int(reset * 1000)))
+            return admitted, headers
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='embedding-stub', daemon=True)
+        thread.start()
+        return thread
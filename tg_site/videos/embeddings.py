@@ -0,0 +1,292 @@
+"""
+Embedding backends for posts and search queries.
+
+EMBEDDING_BACKEND picks one of BACKENDS: the OpenAI API (default), a local
+sentence-transformers model, or a local ONNX export run by onnxruntime on CPU.
+Each backend declares its model name and native dimensions and encodes a whole
+list of texts per call. Post.embedding has a fixed EMBEDDING_DIMENSIONS, so
+shorter vectors are zero-padded: cosine distance is unchanged by the padding,
+and switching backends needs no schema change, only re-running
+generate_embeddings --force (vectors of different models are not comparable).
+The local backends' packages are optional and only imported when selected.
+"""
+import os
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .ratelimit import EmbeddingRateLimiter
+
+EMBEDDING_DIMENSIONS = 1536  # width of Post.embedding
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'openai')
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', '')  # empty = the backend's default model
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))  # texts per forward pass of local models
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', '')  # directory holding model.onnx and tokenizer.json
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', '0'))  # CPU threads for local models; 0 = library default
+# Input tokens packed into one OpenAI embeddings request (the API allows 300k and 2048 inputs).
+EMBEDDING_REQUEST_TOKENS = int(os.getenv('EMBEDDING_REQUEST_TOKENS', '250000'))
+
+BACKENDS = {}
+
+
+def register_backend(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def pack_requests(sizes: list[int], budget: int, max_items: int) -> list[list[int]]:
+    """
+    Split indexes of sizes, in order, into groups summing to at most budget with at most
+    max_items each (0 = no limit). An item larger than the budget gets a group of its own.
+    """
+    groups, group, total = [], [], 0
+    for index, size in enumerate(sizes):
+        if group and ((budget and total + size > budget) or (max_items and len(group) >= max_items)):
+            groups.append(group)
+            group, total = [], 0
+        group.append(index)
+        total += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def pad_embedding(vector) -> list[float]:
+    """Zero-pad a native embedding to EMBEDDING_DIMENSIONS."""
+    vector = [float(value) for value in vector]
+    if len(vector) > EMBEDDING_DIMENSIONS:
+        raise ImproperlyConfigured(
+            f"Embedding model returns {len(vector)} dimensions; Post.embedding holds {EMBEDDING_DIMENSIONS}"
+        )
+    return vector + [0.0] * (EMBEDDING_DIMENSIONS - len(vector))
+
+
+class EmbeddingBackend:
+    """Encodes texts into vectors. Subclasses set name, default_model and dimensions and implement embed()."""
+    name = ''
+    default_model = ''
+    dimensions = 0  # native size of default_model's vectors
+    request_tokens = 0  # token budget of one embed() call; 0 = one call per encode()
+    max_request_inputs = 0
+
+    def __init__(self, model: str = ''):
+        self.model = model or self.default_model
+        self.lock = threading.Lock()
+        self.tokens_used = 0  # input tokens embedded by this process, for throughput reporting
+        self.reused = 0  # texts served from the TextEmbedding store instead of embedded
+
+    def embed(self, texts: list[str], tokens: int = 0) -> list:
+        """
+        Native vectors for non-empty texts, in order. tokens is their total from prepare(), 0 when
+        the backend does not count them. Implementations call count_tokens.
+        """
+        raise NotImplementedError
+
+    def check(self):
+        """Raise ImproperlyConfigured if the backend cannot work, e.g. before a worker starts using it."""
+
+    def count_tokens(self, tokens: int):
+        with self.lock:
+            self.tokens_used += int(tokens)
+
+    def count_reused(self, texts: int):
+        with self.lock:
+            self.reused += texts
+
+    def prepare(self, texts: list[str]) -> list[tuple[str, int]]:
+        """(text as sent, its tokens) for each text; 0 tokens for blank texts and backends without a budget."""
+        return [(text, 0) for text in texts]
+
+    def pack(self, prepared: list[tuple[str, int]]) -> list[list[int]]:
+        """Indexes of prepared texts grouped into full embed() calls by their tokens; blank texts are left out."""
+        present = [index for index, (text, _) in enumerate(prepared) if text and text.strip()]
+        groups = pack_requests([prepared[index][1] for index in present], self.request_tokens, self.max_request_inputs)
+        return [[present[position] for position in group] for group in groups]
+
+    def encode(self, texts: list[str], prepared: list[tuple[str, int]] | None = None) -> list[list[float] | None]:
+        """
+        Padded embeddings for texts, in as few token-budgeted calls as possible; None for blank texts.
+        prepared is prepare(texts), when the caller has already tokenized them.
+        """
+        prepared = self.prepare(texts) if prepared is None else prepared
+        embeddings = [None] * len(texts)
+        for group in self.pack(prepared):
+            vectors = self.embed([prepared[index][0] for index in group], sum(prepared[index][1] for index in group))
+            for index, vector in zip(group, vectors):
+                embeddings[index] = pad_embedding(vector)
+        return embeddings
+
+
+@register_backend
+class OpenAIBackend(EmbeddingBackend):
+    name = 'openai'
+    default_model = 'text-embedding-3-small'
+    dimensions = 1536
+    max_tokens = 8191  # per input
+    request_tokens = EMBEDDING_REQUEST_TOKENS
+    max_request_inputs = 2048
+
+    def __init__(self, model: str = ''):
+        super().__init__(model)
+        self._client = None
+        self._encoding = None
+        self.limiter = EmbeddingRateLimiter()
+
+    def get_client(self):
+        if self._client is None:
+            from openai import OpenAI
+            # Retries are the limiter's job; the client's own would bypass its accounting.
+            # OPENAI_BASE_URL points the client elsewhere, e.g. at videos/embedding_stub.py.
+            self._client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'), max_retries=0)
+        return self._client
+
+    def check(self):
+        if not os.environ.get('OPENAI_API_KEY'):
+            raise ImproperlyConfigured("EMBEDDING_BACKEND=openai needs OPENAI_API_KEY")
+
+    def get_encoding(self):
+        if self._encoding is None:
+            import tiktoken
+            self._encoding = tiktoken.encoding_for_model(self.model)
+        return self._encoding
+
+    def prepare(self, texts):
+        """Token counts of texts, tokenized together with encode_batch, and texts truncated to max_tokens."""
+        prepared = [(text, 0) for text in texts]
+        present = [index for index, text in enumerate(texts) if text and text.strip()]
+        if present:
+            encoding = self.get_encoding()
+            encoded = encoding.encode_batch([texts[index] for index in present], disallowed_special=())
+            for index, tokens in zip(present, encoded):
+                if len(tokens) > self.max_tokens:
+                    prepared[index] = (encoding.decode(tokens[:self.max_tokens]), self.max_tokens)
+                else:
+                    prepared[index] = (texts[index], len(tokens))
+        return prepared
+
+    def embed(self, texts, tokens=0):
+        def request():
+            raw = self.get_client().embeddings.with_raw_response.create(model=self.model, input=texts)
+            response = raw.parse()
+            return response, raw.headers, response.usage.total_tokens
+
+        # Without counts from prepare(), the UTF-8 size bounds the tokens (capped, as texts are truncated).
+        estimate = tokens or sum(min(len(text.encode('utf-8')), self.max_tokens) for text in texts)
+        response = self.limiter.call(request, estimate)
+        self.count_tokens(response.usage.total_tokens)
+        return [item.embedding for item in response.data]
+
+
+@register_backend
+class SentenceTransformersBackend(EmbeddingBackend):
+    name = 'sentence-transformers'
+    default_model = 'all-MiniLM-L6-v2'
+    dimensions = 384
+
+    def __init__(self, model: str = ''):
+        super().__init__(model)
+        self._model = None
+
+    def get_model(self):
+        with self.lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImproperlyConfigured("EMBEDDING_BACKEND=sentence-transformers needs the sentence-transformers package") from e
+                if EMBEDDING_THREADS:
+                    import torch
+                    torch.set_num_threads(EMBEDDING_THREADS)
+                self._model = SentenceTransformer(self.model, device='cpu')
+                self.dimensions = self._model.get_sentence_embedding_dimension()
+        return self._model
+
+    def check(self):
+        self.get_model()
+
+    def embed(self, texts, tokens=0):
+        model = self.get_model()
+        self.count_tokens(model.tokenize(texts)['attention_mask'].sum())
+        return model.encode(
+            texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True, normalize_embeddings=True,
+        ).tolist()
+
+
+@register_backend
+class OnnxBackend(EmbeddingBackend):
+    """
+    A sentence-embedding model exported to ONNX (e.g. with optimum-cli export onnx), run on
+    CPU. Token embeddings are mean-pooled over the attention mask and L2-normalized, which
+    matches sentence-transformers for MiniLM/MPNet-style models.
+    """
+    name = 'onnx'
+    default_model = 'all-MiniLM-L6-v2'
+    dimensions = 384
+    max_tokens = 256
+
+    def __init__(self, model: str = ''):
+        super().__init__(model)
+        self._session = None
+        self._tokenizer = None
+
+    def load(self):
+        with self.lock:
+            if self._session is None:
+                try:
+                    import onnxruntime
+                    from tokenizers import Tokenizer
+                except ImportError as e:
+                    raise ImproperlyConfigured("EMBEDDING_BACKEND=onnx needs the onnxruntime and tokenizers packages") from e
+                if not EMBEDDING_ONNX_DIR:
+                    raise ImproperlyConfigured("EMBEDDING_BACKEND=onnx needs EMBEDDING_ONNX_DIR")
+                options = onnxruntime.SessionOptions()
+                if EMBEDDING_THREADS:
+                    options.intra_op_num_threads = EMBEDDING_THREADS
+                tokenizer = Tokenizer.from_file(os.path.join(EMBEDDING_ONNX_DIR, 'tokenizer.json'))
+                tokenizer.enable_truncation(self.max_tokens)
+                tokenizer.enable_padding()
+                self._tokenizer = tokenizer
+                self._session = onnxruntime.InferenceSession(
+                    os.path.join(EMBEDDING_ONNX_DIR, 'model.onnx'), options, providers=['CPUExecutionProvider'],
+                )
+        return self._session, self._tokenizer
+
+    def check(self):
+        self.load()
+
+    def embed(self, texts, tokens=0):
+        import numpy as np
+        session, tokenizer = self.load()
+        input_names = {model_input.name for model_input in session.get_inputs()}
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            encodings = tokenizer.encode_batch(texts[start:start + EMBEDDING_BATCH_SIZE])
+            feed = {
+                'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+                'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = session.run(None, {name: value for name, value in feed.items() if name in input_names})[0]
+            self.count_tokens(feed['attention_mask'].sum())
+            mask = feed['attention_mask'][:, :, None].astype(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> EmbeddingBackend:
+    """The process-wide backend selected by EMBEDDING_BACKEND / EMBEDDING_MODEL."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if EMBEDDING_BACKEND not in BACKENDS:
+                raise ImproperlyConfigured(
+                    f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; choose one of {', '.join(sorted(BACKENDS))}"
+                )
+            _backend = BACKENDS[EMBEDDING_BACKEND](EMBEDDING_MODEL)
+        return _backend
@@ -0,0 +1,919 @@
+"""
+Telegram channel fetcher used by scripts/fetch/fetch_all_tg_chanels_to_db.py.
+
+Runs on Telethon's native asyncio client: up to FETCH_CONCURRENCY channels are
+fetched at once, a FloodWaitError only pauses the channel that hit it, and all
+Django ORM work runs on a small thread pool so it never blocks the event loop.
+When each channel is polled is decided by videos/scheduler.py; which channels this
+worker polls at all is decided by its leases (videos/leasing.py). With LIVE_UPDATES,
+new and edited posts are also written as Telegram pushes them (LiveIngest). Channels
+marked for backfill (manage.py backfill_channels) get their history streamed in
+the background from spare request budget. With EMBED_ON_INGEST, a thread embeds the
+posts queued by every write (videos/embedding_queue.py).
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from django.db import close_old_connections, connection, transaction
+from telethon import TelegramClient, events
+from telethon.errors import ChannelInvalidError, ChannelPrivateError, FloodWaitError, PeerIdInvalidError
+from telethon.sessions import StringSession
+from telethon.tl.functions.messages import GetMessagesViewsRequest
+from telethon.tl.types import InputPeerChannel, Message, PeerChannel
+
+from .circuit import UsernameUnresolvedError, blocked_seconds, record_failure, recovery_fields
+from .embedding_queue import EMBED_ON_INGEST, start_embedding_worker
+from .metrics import FETCH_METRICS, METRICS_FILE, METRICS_PORT, dump_metrics, serve_metrics
+from .jobs import JOB_CONCURRENCY, JOB_POLL_INTERVAL, claim_jobs, finish_job, release_job
+from .leasing import LEASE_TTL, claim_channel, default_worker_id, retire_worker, sync_leases
+from .models import Channel, FetchJob, Post
+from .scheduler import (
+    MAX_POLL_INTERVAL, MIN_POLL_INTERVAL, REQUEST_BUDGET_PER_MINUTE, ChannelScheduler, ChannelState,
+    RequestBudget, measure_channel_activity,
+)
+
+DAYS_BACK = int(os.getenv('DAYS_BACK', '7'))
+SCHEDULER_TICK = 1  # seconds between checks for due channels
+LEASE_SYNC_INTERVAL = 60  # seconds between renewing/rebalancing channel leases
+QUEUE_LOG_INTERVAL = 60  # seconds between scheduler state / totals log lines
+FETCH_CONCURRENCY = int(os.getenv('FETCH_CONCURRENCY', '4'))  # channels fetched in parallel
+DB_WORKERS = int(os.getenv('DB_WORKERS', '4'))  # threads running ORM writes
+MAX_FLOOD_WAIT = int(os.getenv('MAX_FLOOD_WAIT', '300'))  # give up on a channel for this cycle above this
+METRICS_REFRESH_INTERVAL = int(os.getenv('METRICS_REFRESH_INTERVAL', '1800'))  # longest gap between views refreshes per channel
+FULL_SCAN_INTERVAL = int(os.getenv('FULL_SCAN_INTERVAL', '86400'))  # seconds between DAYS_BACK re-downloads (edits) per channel
+VIEWS_BATCH_SIZE = 100  # message ids per messages.getMessagesViews call (API maximum)
+ALBUM_MAX_ITEMS = 10  # Telegram caps albums at 10 messages
+LIVE_UPDATES = os.getenv('LIVE_UPDATES', '1') != '0'  # ingest NewMessage / MessageEdited events as they arrive
+LIVE_FLUSH_DELAY = 1.0  # seconds to collect a channel's events (album members arrive one by one) before writing
+BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '2'))  # channels backfilled in parallel per worker
+BACKFILL_DAYS = int(os.getenv('BACKFILL_DAYS', '0'))  # how far back a backfill goes; 0 = the whole history
+BACKFILL_WRITE_SIZE = 1000  # messages per bulk write and checkpoint
+BACKFILL_BUDGET_RESERVE = 0.5  # share of the request budget backfills leave to channel polls
+# Errors meaning a cached InputPeerChannel is no longer accepted; the username is re-resolved once.
+STALE_PEER_ERRORS = (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError)
+
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='fetch-db')
+REQUEST_BUDGET = RequestBudget(REQUEST_BUDGET_PER_MINUTE)
+
+
+def _run_with_fresh_connection(func, *args):
+    close_old_connections()
+    started = time.monotonic()
+    try:
+        return func(*args)
+    finally:
+        FETCH_METRICS.inc('tg_fetch_db_seconds_total', time.monotonic() - started, function=func.__name__)
+        close_old_connections()
+
+
+async def run_db(func, *args):
+    """Run a blocking ORM call on the DB thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, _run_with_fresh_connection, func, *args)
+
+
+async def call_telegram(channel: Channel, method: str, request_factory, budget_reserve: float = 0):
+    """
+    Await a Telegram request, sleeping out FloodWaitError for this channel only.
+    request_factory builds a fresh coroutine per attempt; each attempt spends one
+    token of the global REQUEST_BUDGET (see RequestBudget.acquire for budget_reserve)
+    and is counted under method.
+    """
+    while True:
+        await REQUEST_BUDGET.acquire(budget_reserve)
+        FETCH_METRICS.inc('tg_fetch_telegram_calls_total', method=method)
+        started = time.monotonic()
+        try:
+            return await request_factory()
+        except FloodWaitError as e:
+            if e.seconds > MAX_FLOOD_WAIT:
+                raise
+            print(f"  ⏳ FloodWait {e.seconds}s on {channel.username}")
+            FETCH_METRICS.inc('tg_fetch_flood_wait_seconds_total', e.seconds)
+            await asyncio.sleep(e.seconds)
+        finally:
+            FETCH_METRICS.inc('tg_fetch_api_seconds_total', time.monotonic() - started)
+
+
+def build_media_data(msg: Message, album_msgs: list | None = None) -> dict | None:
+    is_album = album_msgs and len(album_msgs) > 1
+    if hasattr(msg.media, "document") and msg.media.document:
+        doc = msg.media.document
+        data = {"duration": getattr(doc, "duration", None), "size": getattr(doc, "size", None)}
+    elif type(msg.media).__name__ == "MessageMediaPhoto" and is_album:
+        data = {}
+    else:
+        return None
+    if is_album:
+        album_items = []
+        video_index = 0
+        photo_index = 0
+        for m in album_msgs:
+            if hasattr(m.media, "document") and m.media.document:
+                album_items.append({"id": m.id, "type": "video", "video_index": video_index})
+                video_index += 1
+            else:
+                album_items.append({"id": m.id, "type": "photo", "photo_index": photo_index})
+                photo_index += 1
+        data["album_ids"] = [m.id for m in album_msgs]  # keep for backward compat
+        data["album_items"] = album_items
+    return data
+
+
+# Columns written by bulk_upsert_posts; embedding is owned by the embedding queue and generate_embeddings.
+UPSERT_COLUMNS = [
+    'channel_id', 'telegram_id', 'date', 'text', 'views', 'forwards', 'replies',
+    'link', 'has_media', 'media_type', 'video_data',
+]
+UPSERT_CHUNK_SIZE = 500  # rows per INSERT statement
+# Fields compared for change detection; when_updated is only bumped when one of them differs.
+TRACKED_COLUMNS = [column for column in UPSERT_COLUMNS if column not in ('channel_id', 'telegram_id')]
+
+# channel_id -> {telegram_id: fingerprint of TRACKED_COLUMNS as last written/confirmed in the DB}.
+# Lets unchanged rows skip the DB entirely; bulk_upsert_posts also compares in SQL so a cold
+# cache (after a restart) still doesn't rewrite identical rows.
+POST_FINGERPRINTS: dict[int, dict[int, int]] = defaultdict(dict)
+
+
+def post_row(msg: Message, channel: Channel, video_data, views: int) -> dict:
+    return {
+        "channel_id": channel.pk,
+        "telegram_id": msg.id,
+        "date": msg.date.astimezone(timezone.utc),
+        "text": msg.text or "",
+        "views": views,
+        "forwards": getattr(msg, "forwards", 0) or 0,
+        "replies": getattr(msg.replies, "replies", 0) if msg.replies else 0,
+        "link": f"https://t.me/{channel.username}/{msg.id}",
+        "has_media": bool(msg.media),
+        "media_type": type(msg.media).__name__ if msg.media else None,
+        "video_data": video_data,
+    }
+
+
+def message_post_row(msg: Message, channel: Channel) -> dict | None:
+    msg_views = getattr(msg, "views", 0) or 0
+    if msg_views == 1:
+        return None
+    return post_row(msg, channel, build_media_data(msg, None), msg_views)
+
+
+def album_post_row(primary_msg: Message, album_msgs: list[Message], channel: Channel) -> dict | None:
+    primary_views = getattr(primary_msg, "views", 0) or 0
+    if primary_views == 1:
+        return None
+    # Use highest view count from any album message
+    max_views = max((getattr(m, "views", 0) or 0) for m in album_msgs)
+    return post_row(primary_msg, channel, build_media_data(primary_msg, album_msgs), max_views)
+
+
+def build_post_rows(channel: Channel, messages: list[Message]) -> tuple[list[dict], dict[int, list[int]]]:
+    """
+    Group messages into standalone posts and albums.
+    Returns (rows to upsert, {primary telegram_id: secondary album telegram_ids to delete}).
+    """
+    albums: dict[int, list] = defaultdict(list)
+    rows = []
+    for msg in messages:
+        if msg.grouped_id:
+            albums[msg.grouped_id].append(msg)
+            continue
+        row = message_post_row(msg, channel)
+        if row:
+            rows.append(row)
+
+    secondary_ids_by_primary = {}
+    for group_msgs in albums.values():
+        group_msgs.sort(key=lambda m: m.id)
+        row = album_post_row(group_msgs[0], group_msgs, channel)
+        if row:
+            rows.append(row)
+            secondary_ids_by_primary[group_msgs[0].id] = [m.id for m in group_msgs[1:]]
+    return rows, secondary_ids_by_primary
+
+
+def row_fingerprint(row: dict) -> int:
+    return hash(tuple(
+        json.dumps(row[column], sort_keys=True) if column == 'video_data' else row[column]
+        for column in TRACKED_COLUMNS
+    ))
+
+
+def prune_fingerprints(channel: Channel, lowest_telegram_id: int):
+    """Forget cached posts that fell out of the fetch window."""
+    known = POST_FINGERPRINTS[channel.pk]
+    for telegram_id in [telegram_id for telegram_id in known if telegram_id < lowest_telegram_id]:
+        del known[telegram_id]
+
+
+def bulk_upsert_posts(rows: list[dict]) -> list[tuple[int, bool]]:
+    """
+    INSERT ... ON CONFLICT (channel_id, telegram_id) DO UPDATE in one statement per chunk.
+    Rows whose tracked columns already match the stored row are left untouched
+    (no new tuple, no when_updated bump) and are not returned.
+    Returns (telegram_id, created) for every row actually written.
+    """
+    # The same telegram_id twice in one statement is an error in Postgres; last one wins.
+    rows = list({(row['channel_id'], row['telegram_id']): row for row in rows}.values())
+    now = datetime.now(timezone.utc)
+    column_list = ', '.join(UPSERT_COLUMNS)
+    update_list = ', '.join(f'{column} = EXCLUDED.{column}' for column in TRACKED_COLUMNS)
+    stored_values = ', '.join(f'videos_post.{column}' for column in TRACKED_COLUMNS)
+    incoming_values = ', '.join(f'EXCLUDED.{column}' for column in TRACKED_COLUMNS)
+    row_placeholder = '(' + ', '.join('%s::jsonb' if column == 'video_data' else '%s' for column in UPSERT_COLUMNS) + ', %s, NULL)'
+
+    written = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            params = []
+            for row in chunk:
+                params.extend(
+                    json.dumps(row[column]) if column == 'video_data' and row[column] is not None else row[column]
+                    for column in UPSERT_COLUMNS
+                )
+                params.append(now)
+            # xmax = 0 only on freshly inserted tuples, which tells inserts from updates.
+            cursor.execute(f"""
+                INSERT INTO videos_post ({column_list}, when_added, when_updated)
+                VALUES {', '.join([row_placeholder] * len(chunk))}
+                ON CONFLICT (channel_id, telegram_id) DO UPDATE
+                SET {update_list}, when_updated = %s
+                WHERE ({stored_values}) IS DISTINCT FROM ({incoming_values})
+                RETURNING telegram_id, (xmax = 0) AS created
+            """, params + [now])
+            written.extend(cursor.fetchall())
+    return written
+
+
+def save_channel_messages(channel: Channel, messages: list[Message], track_fingerprints: bool = True) -> tuple[int, int, int]:
+    """
+    Write one channel's changed messages with a single upsert and album cleanup. Runs on the DB pool.
+    Returns (new_count, updated_count, unchanged_count). Backfills pass track_fingerprints=False
+    so history outside the window does not pile up in POST_FINGERPRINTS.
+    """
+    rows, secondary_ids_by_primary = build_post_rows(channel, messages)
+    known = POST_FINGERPRINTS[channel.pk]
+    fingerprints = {row['telegram_id']: row_fingerprint(row) for row in rows}
+    changed_rows = [row for row in rows if known.get(row['telegram_id']) != fingerprints[row['telegram_id']]]
+    secondary_ids = [
+        secondary_id
+        for row in changed_rows
+        for secondary_id in secondary_ids_by_primary.get(row['telegram_id'], [])
+    ]
+
+    with transaction.atomic():
+        written = bulk_upsert_posts(changed_rows)
+        deleted = 0
+        if secondary_ids:
+            deleted, _ = Post.objects.filter(channel=channel, telegram_id__in=secondary_ids).delete()
+    if track_fingerprints:
+        known.update(fingerprints)
+    if deleted:
+        print(f"  🗑️  Removed {deleted} secondary album posts from {channel.username}")
+
+    new_count = sum(1 for _, created in written if created)
+    updated_count = len(written) - new_count
+    unchanged_count = len(rows) - len(written)
+    FETCH_METRICS.inc('tg_fetch_posts_inserted_total', new_count)
+    FETCH_METRICS.inc('tg_fetch_posts_updated_total', updated_count)
+    FETCH_METRICS.inc('tg_fetch_posts_unchanged_total', unchanged_count)
+    return new_count, updated_count, unchanged_count
+
+
+def message_date(msg: Message) -> datetime:
+    return msg.date.replace(tzinfo=timezone.utc) if msg.date.tzinfo is None else msg.date
+
+
+def is_full_scan_due(channel: Channel, now: datetime, full_scan_interval: float = FULL_SCAN_INTERVAL) -> bool:
+    if channel.last_seen_telegram_id is None or channel.last_full_scan_at is None:
+        return True
+    return (now - channel.last_full_scan_at).total_seconds() >= full_scan_interval
+
+
+def is_metrics_refresh_due(channel: Channel, now: datetime, metrics_refresh_interval: float = METRICS_REFRESH_INTERVAL) -> bool:
+    if channel.last_metrics_refresh_at is None:
+        return True
+    return (now - channel.last_metrics_refresh_at).total_seconds() >= metrics_refresh_interval
+
+
+def select_new_messages(messages: list[Message], last_seen_telegram_id: int) -> list[Message]:
+    """
+    Keep messages newer than the high-water mark, plus older members of albums that
+    have new members (the incremental fetch overlaps by ALBUM_MAX_ITEMS ids so an album
+    straddling the mark is still saved whole).
+    """
+    new_group_ids = {msg.grouped_id for msg in messages if msg.id > last_seen_telegram_id and msg.grouped_id}
+    return [msg for msg in messages if msg.id > last_seen_telegram_id or msg.grouped_id in new_group_ids]
+
+
+async def iter_window(client: TelegramClient, channel: Channel, entity, since_date: datetime, min_id: int = 0,
+                      offset_id: int = 0, budget_reserve: float = 0):
+    """
+    Page newest-first through messages newer than both since_date and min_id, starting below
+    offset_id (0 = the newest message), yielding each page.
+    """
+    while True:
+        batch = await call_telegram(
+            channel, 'get_messages',
+            lambda: client.get_messages(entity, limit=100, offset_id=offset_id, min_id=min_id),
+            budget_reserve,
+        )
+        if not batch:
+            return
+        FETCH_METRICS.inc('tg_fetch_messages_scanned_total', len(batch))
+        batch_in_range = [msg for msg in batch if message_date(msg) >= since_date]
+        if batch_in_range:
+            yield batch_in_range
+        # Batches are newest first, so a short batch means we crossed since_date or min_id
+        if len(batch_in_range) < len(batch) or len(batch) < 100:
+            return
+        offset_id = batch[-1].id
+
+
+async def iter_complete_posts(pages):
+    """
+    Re-chunk newest-first pages so that no album is split between chunks: the album at the
+    end of a page may continue on the next one, so its members are held back until then.
+    """
+    held = []
+    async for page in pages:
+        messages = held + page
+        tail_group = messages[-1].grouped_id
+        held = [msg for msg in messages if tail_group and msg.grouped_id == tail_group]
+        if held:
+            messages = [msg for msg in messages if msg.grouped_id != tail_group]
+        if messages:
+            yield messages
+    if held:
+        yield held
+
+
+def stored_window_posts(channel: Channel, since_date: datetime) -> dict[int, list[int]]:
+    """{telegram_id: ids of the messages behind the post, album members included} for stored posts in the window."""
+    posts = Post.objects.filter(channel=channel, date__gte=since_date).values_list('telegram_id', 'video_data')
+    return {
+        telegram_id: (video_data or {}).get('album_ids') or [telegram_id]
+        for telegram_id, video_data in posts
+    }
+
+
+async def fetch_post_counters(
+    client: TelegramClient, channel: Channel, entity, message_ids_by_post: dict[int, list[int]],
+) -> list[tuple[int, int, int, int]]:
+    """
+    Current (telegram_id, views, forwards, replies) of stored posts from messages.getMessagesViews,
+    VIEWS_BATCH_SIZE ids per call. Albums take the highest views of their members, like
+    album_post_row. Posts Telegram reports no views for (deleted messages) are left out.
+    """
+    message_ids = sorted({message_id for ids in message_ids_by_post.values() for message_id in ids}, reverse=True)
+    views_by_id = {}
+    for start in range(0, len(message_ids), VIEWS_BATCH_SIZE):
+        batch = message_ids[start:start + VIEWS_BATCH_SIZE]
+        result = await call_telegram(
+            channel, 'get_messages_views',
+            lambda: client(GetMessagesViewsRequest(peer=entity, id=batch, increment=False)),
+        )
+        views_by_id.update(zip(batch, result.views))  # results come back in request order
+
+    counters = []
+    for telegram_id, ids in message_ids_by_post.items():
+        primary = views_by_id.get(telegram_id)
+        if primary is None or primary.views is None:
+            continue
+        views = max((views_by_id[i].views or 0) for i in ids if i in views_by_id)
+        replies = primary.replies.replies if primary.replies else 0
+        counters.append((telegram_id, views, primary.forwards or 0, replies))
+    return counters
+
+
+def update_post_counters(channel: Channel, counters: list[tuple[int, int, int, int]]) -> tuple[int, int]:
+    """
+    Write refreshed (telegram_id, views, forwards, replies) with one UPDATE ... FROM (VALUES ...)
+    per chunk, touching only views/forwards/replies of rows whose counters changed; when_updated
+    is left for content changes.
+    Runs on the DB pool. Returns (updated_count, unchanged_count).
+    """
+    updated_ids = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(counters), UPSERT_CHUNK_SIZE):
+            chunk = counters[start:start + UPSERT_CHUNK_SIZE]
+            params = []
+            for row in chunk:
+                params.extend(row)
+            params.append(channel.pk)
+            cursor.execute(f"""
+                UPDATE videos_post AS post
+                SET views = fresh.views, forwards = fresh.forwards, replies = fresh.replies
+                FROM (VALUES {', '.join(['(%s, %s, %s, %s)'] * len(chunk))}) AS fresh (telegram_id, views, forwards, replies)
+                WHERE post.channel_id = %s AND post.telegram_id = fresh.telegram_id
+                  AND (post.views, post.forwards, post.replies) IS DISTINCT FROM (fresh.views, fresh.forwards, fresh.replies)
+                RETURNING post.telegram_id
+            """, params)
+            updated_ids.extend(row[0] for row in cursor.fetchall())
+    # Cached fingerprints of these rows no longer match the DB; the next full scan re-checks them in SQL.
+    known = POST_FINGERPRINTS[channel.pk]
+    for telegram_id in updated_ids:
+        known.pop(telegram_id, None)
+
+    updated_count = len(updated_ids)
+    unchanged_count = len(counters) - updated_count
+    FETCH_METRICS.inc('tg_fetch_posts_updated_total', updated_count)
+    FETCH_METRICS.inc('tg_fetch_posts_unchanged_total', unchanged_count)
+    return updated_count, unchanged_count
+
+
+def mark_channel_synced(channel: Channel, newest_telegram_id: int | None, synced_at: datetime, full_scan: bool,
+                        metrics_refreshed: bool = False):
+    fields = {'last_synced_at': synced_at}
+    if newest_telegram_id is not None:
+        fields['last_seen_telegram_id'] = max(newest_telegram_id, channel.last_seen_telegram_id or 0)
+    if full_scan:
+        fields['last_full_scan_at'] = synced_at
+    if full_scan or metrics_refreshed:
+        fields['last_metrics_refresh_at'] = synced_at
+    fields.update(recovery_fields(channel))
+    Channel.objects.filter(pk=channel.pk).update(**fields)
+    for name, value in fields.items():
+        setattr(channel, name, value)
+
+
+def finish_channel_sync(
+    channel: Channel, oldest_telegram_id: int | None, newest_telegram_id: int | None,
+    counters: list[tuple[int, int, int, int]], synced_at: datetime, full_scan: bool, metrics_refreshed: bool,
+) -> tuple[int, int]:
+    """
+    Write refreshed counters and record the sync once every page is saved; the telegram_ids
+    bound what the pages wrote. Runs on the DB pool. Returns (updated_count, unchanged_count).
+    """
+    updated_count, unchanged_count = update_post_counters(channel, counters) if counters else (0, 0)
+    mark_channel_synced(channel, newest_telegram_id, synced_at, full_scan, metrics_refreshed)
+    if full_scan and oldest_telegram_id is not None:
+        prune_fingerprints(channel, oldest_telegram_id)
+    return updated_count, unchanged_count
+
+
+def save_channel_peer(channel: Channel, peer: InputPeerChannel | None):
+    peer_id = peer.channel_id if peer else None
+    access_hash = peer.access_hash if peer else None
+    channel.telegram_peer_id = peer_id
+    channel.telegram_access_hash = access_hash
+    Channel.objects.filter(pk=channel.pk).update(telegram_peer_id=peer_id, telegram_access_hash=access_hash)
+
+
+def cached_peer(channel: Channel) -> InputPeerChannel | None:
+    if channel.telegram_peer_id is None or channel.telegram_access_hash is None:
+        return None
+    return InputPeerChannel(channel_id=channel.telegram_peer_id, access_hash=channel.telegram_access_hash)
+
+
+async def resolve_peer(client: TelegramClient, channel: Channel):
+    """ResolveUsername round trip; the result is persisted on the channel when it is a channel peer."""
+    try:
+        peer = await call_telegram(channel, 'resolve_username', lambda: client.get_input_entity(channel.username))
+    except ValueError as e:
+        # get_input_entity turns UsernameNotOccupiedError into 'No user has "..." as username'.
+        raise UsernameUnresolvedError(str(e)) from e
+    if isinstance(peer, InputPeerChannel):
+        await run_db(save_channel_peer, channel, peer)
+    return peer
+
+
+async def check_channel(
+    client: TelegramClient, channel: Channel, since_date: datetime,
+    metrics_refresh_interval: float = METRICS_REFRESH_INTERVAL, full_scan_interval: float = FULL_SCAN_INTERVAL,
+) -> tuple[int, int, int]:
+    """
+    Check a single channel for posts in the last DAYS_BACK days.
+    Returns (new_count, updated_count, unchanged_count).
+    Normally only messages above the channel's last_seen_telegram_id are pulled (one call
+    for a quiet channel). Pages are written as they arrive, so memory does not grow with
+    the channel's volume. Every metrics_refresh_interval seconds the views, forwards and
+    replies of the stored posts in the window are refreshed via messages.getMessagesViews,
+    and every full_scan_interval seconds the whole window is re-downloaded to pick up edits.
+    The channel's peer is resolved from its username once and then reused from the DB.
+    Failures back the channel off (videos/circuit.py); a blocked channel is skipped without any request.
+    """
+    now = datetime.now(timezone.utc)
+    if blocked_seconds(channel, now):
+        return 0, 0, 0
+    try:
+        full_scan = is_full_scan_due(channel, now, full_scan_interval)
+        refresh_metrics = not full_scan and is_metrics_refresh_due(channel, now, metrics_refresh_interval)
+        message_ids_by_post = await run_db(stored_window_posts, channel, since_date) if refresh_metrics else {}
+
+        async def sync_channel(entity):
+            new_count = updated_count = unchanged_count = 0
+            oldest_id = newest_id = None  # range of telegram_ids written
+            skipped_id = None  # lowest id not stored; the high-water mark stays below it so the next poll asks again
+            min_id = 0 if full_scan else max(0, channel.last_seen_telegram_id - ALBUM_MAX_ITEMS)
+            async for messages in iter_complete_posts(iter_window(client, channel, entity, since_date, min_id)):
+                if not full_scan:
+                    messages = select_new_messages(messages, channel.last_seen_telegram_id)
+                    if not messages:
+                        continue
+                new, updated, unchanged = await run_db(save_channel_messages, channel, messages)
+                new_count += new
+                updated_count += updated
+                unchanged_count += unchanged
+                page_ids = [msg.id for msg in messages]
+                oldest_id = min(oldest_id or page_ids[0], *page_ids)
+                newest_id = max(newest_id or 0, *page_ids)
+                stored_ids = stored_telegram_ids(channel, messages)
+                skipped_ids = [telegram_id for telegram_id in page_ids if telegram_id not in stored_ids]
+                if skipped_ids:
+                    skipped_id = min(skipped_id or skipped_ids[0], *skipped_ids)
+
+            if skipped_id is not None:
+                newest_id = skipped_id - 1
+
+            counters = await fetch_post_counters(client, channel, entity, message_ids_by_post) if refresh_metrics else []
+            updated, unchanged = await run_db(
+                finish_channel_sync, channel, oldest_id, newest_id, counters, now, full_scan, refresh_metrics,
+            )
+            return new_count, updated_count + updated, unchanged_count + unchanged
+
+        peer = cached_peer(channel)
+        if peer is None:
+            return await sync_channel(await resolve_peer(client, channel))
+        try:
+            return await sync_channel(peer)
+        except STALE_PEER_ERRORS as e:
+            print(f"  🔁 Cached peer rejected for {channel.username} ({type(e).__name__}), re-resolving")
+            await run_db(save_channel_peer, channel, None)
+            return await sync_channel(await resolve_peer(client, channel))
+
+    except Exception as e:
+        status = await run_db(record_failure, channel, e, now)
+        print(
+            f"  ❌ Error checking {channel.username} ({type(e).__name__}: {e}); failure {channel.fetch_failures}, "
+            f"{'circuit open' if status == 'open' else 'backing off'} until {channel.fetch_blocked_until:%Y-%m-%d %H:%M:%S}"
+        )
+        FETCH_METRICS.inc('tg_fetch_channel_errors_total', status=status)
+        return 0, 0, 0
+
+
+async def poll_channel(client: TelegramClient, scheduler: ChannelScheduler, state: ChannelState):
+    """Check one due channel, then put it back in the queue at its new adaptive interval."""
+    channel = state.channel
+    now = datetime.now(timezone.utc)
+    started = time.monotonic()
+    activity = None
+    try:
+        await check_channel(client, channel, now - timedelta(days=DAYS_BACK), state.metrics_refresh_interval)
+        activity = await run_db(measure_channel_activity, channel, state.views_sample, now)
+    except Exception as e:
+        print(f"  ❌ Error polling {channel.username}: {e}")
+    finally:
+        elapsed = time.monotonic() - started
+        FETCH_METRICS.inc('tg_fetch_channel_polls_total')
+        FETCH_METRICS.observe('tg_fetch_channel_seconds', elapsed)
+        FETCH_METRICS.set_gauge('tg_fetch_channel_last_poll_seconds', elapsed, channel=channel.username)
+        scheduler.reschedule(state, activity, time.monotonic())
+
+
+async def run_fetch_job(client: TelegramClient, scheduler: ChannelScheduler, job: FetchJob, worker_id: str):
+    """
+    Fetch a queued channel now. A channel this worker leases, or can lease because it is free
+    (a newly added one), is polled through the scheduler so it keeps its place in the queue.
+    A channel another worker leased since the job was claimed is never polled here: the job
+    goes back to the queue for that worker.
+    """
+    channel = job.channel
+    state = scheduler.states.get(channel.pk)
+    if state is None and await run_db(claim_channel, worker_id, channel.pk, datetime.now(timezone.utc)):
+        state = scheduler.add(channel, time.monotonic())
+    if state is None:
+        await run_db(release_job, job)
+        return
+    try:
+        if scheduler.start(state):
+            await poll_channel(client, scheduler, state)
+        # Otherwise a poll of the channel is already running, which is what the job asked for.
+    finally:
+        await run_db(finish_job, job)
+
+
+def stored_telegram_ids(channel: Channel, messages: list[Message]) -> set[int]:
+    """Ids of the messages stored as posts or album members; posts with views == 1 are skipped."""
+    rows, secondary_ids_by_primary = build_post_rows(channel, messages)
+    stored_ids = {row['telegram_id'] for row in rows}
+    stored_ids.update(secondary_id for ids in secondary_ids_by_primary.values() for secondary_id in ids)
+    return stored_ids
+
+
+def contiguous_high_water_mark(last_seen_telegram_id: int, telegram_ids: list[int]) -> int:
+    """
+    Advance the high-water mark over pushed ids only while they continue it without a hole,
+    so an update that never arrived is still picked up by the next incremental poll.
+    """
+    mark = last_seen_telegram_id
+    for telegram_id in sorted(telegram_ids):
+        if telegram_id > mark + 1:
+            break
+        mark = max(mark, telegram_id)
+    return mark
+
+
+def save_pushed_messages(channel: Channel, messages: list[Message]) -> tuple[int, int, int]:
+    """Write messages from update events and advance the channel's high-water mark. Runs on the DB pool."""
+    result = save_channel_messages(channel, messages)
+    if channel.last_seen_telegram_id is None:
+        return result  # never polled: the first poll does the full window scan
+    mark = contiguous_high_water_mark(channel.last_seen_telegram_id, stored_telegram_ids(channel, messages))
+    if mark > channel.last_seen_telegram_id:
+        Channel.objects.filter(pk=channel.pk, last_seen_telegram_id__lt=mark).update(last_seen_telegram_id=mark)
+        channel.last_seen_telegram_id = mark
+    return result
+
+
+async def complete_albums(client: TelegramClient, channel: Channel, messages: list[Message]) -> list[Message]:
+    """
+    Add the missing members of pushed albums. Members arrive as separate updates and an edit
+    carries only the edited message, so the ids around them are fetched in one get_messages call.
+    """
+    album_msgs = [msg for msg in messages if msg.grouped_id]
+    if not album_msgs:
+        return messages
+    grouped_ids = {msg.grouped_id for msg in album_msgs}
+    by_id = {msg.id: msg for msg in messages}
+    nearby_ids = sorted({
+        telegram_id
+        for msg in album_msgs
+        for telegram_id in range(msg.id - ALBUM_MAX_ITEMS + 1, msg.id + ALBUM_MAX_ITEMS)
+        if telegram_id > 0 and telegram_id not in by_id
+    })
+    entity = cached_peer(channel) or await resolve_peer(client, channel)
+    fetched = await call_telegram(channel, 'get_messages', lambda: client.get_messages(entity, ids=nearby_ids))
+    for msg in fetched:
+        if msg is not None and msg.grouped_id in grouped_ids:
+            by_id[msg.id] = msg
+    return list(by_id.values())
+
+
+class LiveIngest:
+    """
+    Push ingestion: NewMessage / MessageEdited events for channels leased to this worker are
+    buffered per channel for LIVE_FLUSH_DELAY seconds, albums are completed, and the batch is
+    written like a poll's. Polls keep filling gaps (missed updates, channels the session has not
+    joined) and refreshing views; a channel that receives events is marked live and polled less.
+    """
+
+    def __init__(self, client: TelegramClient, scheduler: ChannelScheduler, flush_delay: float = LIVE_FLUSH_DELAY):
+        self.client = client
+        self.scheduler = scheduler
+        self.flush_delay = flush_delay
+        self.pending: dict[int, dict[int, Message]] = defaultdict(dict)  # channel pk -> {telegram_id: message}
+        self.flushes: dict[int, asyncio.Task] = {}
+
+    def register(self):
+        self.client.add_event_handler(self.on_message, events.NewMessage())
+        self.client.add_event_handler(self.on_message, events.MessageEdited())
+
+    async def on_message(self, event):
+        msg = event.message
+        if not isinstance(msg.peer_id, PeerChannel):
+            return
+        state = self.scheduler.state_for_peer(msg.peer_id.channel_id)
+        if state is None:
+            return  # not a channel leased to this worker
+        FETCH_METRICS.inc('tg_fetch_live_events_total', kind='edit' if msg.edit_date else 'new')
+        self.scheduler.mark_live(state, time.monotonic())
+        channel = state.channel
+        self.pending[channel.pk][msg.id] = msg  # a later edit replaces the earlier version
+        if channel.pk not in self.flushes:
+            self.flushes[channel.pk] = asyncio.create_task(self.flush_later(channel))
+
+    async def flush_later(self, channel: Channel):
+        await asyncio.sleep(self.flush_delay)
+        # Events arriving from here on start the next batch.
+        messages = list(self.pending.pop(channel.pk, {}).values())
+        del self.flushes[channel.pk]
+        since_date = datetime.now(timezone.utc) - timedelta(days=DAYS_BACK)
+        messages = [msg for msg in messages if message_date(msg) >= since_date]  # edits of older posts
+        if not messages:
+            return
+        pushed_new = [msg for msg in messages if not msg.edit_date]
+        try:
+            messages = await complete_albums(self.client, channel, messages)
+            new_count, updated_count, _ = await run_db(save_pushed_messages, channel, messages)
+        except Exception as e:
+            print(f"  ❌ Error ingesting pushed messages for {channel.username}: {e}")
+            FETCH_METRICS.inc('tg_fetch_channel_errors_total')
+            return
+        now = datetime.now(timezone.utc)
+        for msg in pushed_new:
+            FETCH_METRICS.observe('tg_fetch_live_latency_seconds', (now - message_date(msg)).total_seconds())
+        if new_count or updated_count:
+            print(f"  ⚡ {channel.username}: {new_count} new, {updated_count} updated from update events")
+
+
+def pending_backfills(channel_ids: list[int], limit: int) -> list[Channel]:
+    """Oldest backfill requests among channel_ids (this worker's leases). Runs on the DB pool."""
+    if limit <= 0:
+        return []
+    return list(
+        Channel.objects.filter(
+            pk__in=channel_ids, backfill_requested_at__isnull=False, backfill_completed_at__isnull=True,
+        ).order_by('backfill_requested_at')[:limit]
+    )
+
+
+def save_backfill_chunk(channel: Channel, messages: list[Message]) -> tuple[int, int, int]:
+    """Write a chunk of history and move the checkpoint below it in one transaction. Runs on the DB pool."""
+    oldest_telegram_id = min(msg.id for msg in messages)
+    with transaction.atomic():
+        result = save_channel_messages(channel, messages, False)
+        Channel.objects.filter(pk=channel.pk).update(backfill_oldest_telegram_id=oldest_telegram_id)
+    channel.backfill_oldest_telegram_id = oldest_telegram_id
+    return result
+
+
+def finish_backfill(channel: Channel, completed_at: datetime):
+    channel.backfill_completed_at = completed_at
+    Channel.objects.filter(pk=channel.pk).update(backfill_completed_at=completed_at)
+
+
+async def backfill_channel(client: TelegramClient, channel: Channel, backfill_days: int = BACKFILL_DAYS) -> int:
+    """
+    Stream a channel's history (or its last backfill_days days) newest-first, writing
+    BACKFILL_WRITE_SIZE messages at a time and checkpointing the lowest telegram_id written,
+    so a restarted backfill continues where it stopped. Requests only use the part of the
+    budget channel polls leave free (BACKFILL_BUDGET_RESERVE). Returns the number of new posts.
+    """
+    started_at = datetime.now(timezone.utc)
+    since_date = started_at - timedelta(days=backfill_days) if backfill_days else datetime.min.replace(tzinfo=timezone.utc)
+    entity = cached_peer(channel) or await resolve_peer(client, channel)
+    pages = iter_window(
+        client, channel, entity, since_date,
+        offset_id=channel.backfill_oldest_telegram_id or 0, budget_reserve=BACKFILL_BUDGET_RESERVE,
+    )
+    new_count = 0
+    chunk = []
+    async for messages in iter_complete_posts(pages):
+        chunk.extend(messages)
+        if len(chunk) >= BACKFILL_WRITE_SIZE:
+            new_count += (await run_db(save_backfill_chunk, channel, chunk))[0]
+            chunk = []
+            print(f"  📚 Backfill {channel.username}: {new_count} new posts, down to id {channel.backfill_oldest_telegram_id}")
+    if chunk:
+        new_count += (await run_db(save_backfill_chunk, channel, chunk))[0]
+    await run_db(finish_backfill, channel, started_at)
+    return new_count
+
+
+async def run_backfill(client: TelegramClient, channel: Channel):
+    try:
+        new_count = await backfill_channel(client, channel)
+    except Exception as e:
+        # The checkpoint is kept; the next lease sync resumes from it.
+        print(f"  ❌ Backfill of {channel.username} stopped at id {channel.backfill_oldest_telegram_id}: {e}")
+        FETCH_METRICS.inc('tg_fetch_backfill_errors_total')
+        return
+    print(f"  📚 Backfill of {channel.username} complete: {new_count} new posts")
+
+
+def summarize_period(previous_totals: dict[str, float], elapsed: float) -> tuple[str, dict[str, float]]:
+    """One log line with what the counters did since previous_totals."""
+    current_totals = FETCH_METRICS.totals()
+
+    def delta(name):
+        return current_totals.get(name, 0) - previous_totals.get(name, 0)
+
+    latency = FETCH_METRICS.histograms.get('tg_fetch_channel_seconds')
+    latency_text = f"p50 ≤{latency.percentile(0.5)}s p95 ≤{latency.percentile(0.95)}s" if latency else "-"
+    line = (
+        f"✅ Last {elapsed:.0f}s | Polls: {delta('tg_fetch_channel_polls_total'):.0f} "
+        f"(errors {delta('tg_fetch_channel_errors_total'):.0f}, latency {latency_text}) | "
+        f"API calls: {delta('tg_fetch_telegram_calls_total'):.0f} in {delta('tg_fetch_api_seconds_total'):.1f}s | "
+        f"DB: {delta('tg_fetch_db_seconds_total'):.1f}s | Flood wait: {delta('tg_fetch_flood_wait_seconds_total'):.0f}s | "
+        f"Live events: {delta('tg_fetch_live_events_total'):.0f} | "
+        f"Scanned: {delta('tg_fetch_messages_scanned_total'):.0f} | New: {delta('tg_fetch_posts_inserted_total'):.0f} | "
+        f"Updated: {delta('tg_fetch_posts_updated_total'):.0f} | Skipped unchanged: {delta('tg_fetch_posts_unchanged_total'):.0f} | "
+        f"Embedded: {delta('tg_fetch_posts_embedded_total'):.0f}"
+    )
+    return line, current_totals
+
+
+def build_client() -> TelegramClient:
+    api_id = int(os.getenv("API_ID", "0"))
+    api_hash = os.getenv("API_HASH", "")
+    if api_id == 0 or not api_hash:
+        print("❌ API_ID / API_HASH not set in environment variables")
+        sys.exit(1)
+
+    # Use session string (Railway) or session file (local)
+    session_string = os.getenv("SESSION_STRING")
+    if session_string:
+        print("🔑 Using session string from environment")
+        session = StringSession(session_string)
+    else:
+        print("🔑 Using session file (session.session)")
+        session = "session"
+    # flood_sleep_threshold=0: FloodWaitError always reaches call_telegram, which
+    # pauses only the affected channel instead of Telethon sleeping silently.
+    return TelegramClient(session, api_id, api_hash, flood_sleep_threshold=0)
+
+
+async def fetch_loop():
+    """Main fetching loop."""
+    client = build_client()
+
+    # Railway rolling deploys briefly overlap old and new containers.
+    # Wait for the old container to exit before opening a Telegram session.
+    startup_delay = int(os.getenv("STARTUP_DELAY", "20"))
+    if startup_delay > 0:
+        print(f"⏳ Startup delay {startup_delay}s (waiting for old container to exit)...")
+        await asyncio.sleep(startup_delay)
+
+    worker_id = default_worker_id()
+    print(f"🚀 Starting channel fetch service as worker {worker_id} (lease TTL {LEASE_TTL}s)...")
+    print(
+        f"⏱️  Poll interval: {MIN_POLL_INTERVAL}-{MAX_POLL_INTERVAL}s per channel | Budget: {REQUEST_BUDGET_PER_MINUTE} req/min | "
+        f"Concurrency: {FETCH_CONCURRENCY} | DB workers: {DB_WORKERS}"
+    )
+    print(
+        f"📅 Fetching last {DAYS_BACK} days (sliding window), views refresh at most every "
+        f"{METRICS_REFRESH_INTERVAL}s and full re-scan every {FULL_SCAN_INTERVAL}s per channel"
+    )
+    print("=" * 70)
+
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+        print(f"📈 Prometheus metrics on :{METRICS_PORT}")
+    if METRICS_FILE:
+        print(f"📈 JSON metrics dumped to {METRICS_FILE} every {QUEUE_LOG_INTERVAL}s")
+
+    scheduler = ChannelScheduler(metrics_refresh_interval=METRICS_REFRESH_INTERVAL)
+    if LIVE_UPDATES:
+        LiveIngest(client, scheduler).register()
+        print("⚡ Ingesting new and edited posts from Telegram update events")
+    stop_embedding = None
+    if EMBED_ON_INGEST:
+        stop_embedding = await run_db(start_embedding_worker, worker_id)
+        print("🧠 Embedding new and edited posts as they are written")
+    async with client:
+        try:
+            await run_scheduler(client, scheduler, worker_id)
+        finally:
+            if stop_embedding:
+                stop_embedding.set()
+            await run_db(retire_worker, worker_id)
+            print(f"👋 Worker {worker_id} released its channel leases")
+
+
+async def run_scheduler(client: TelegramClient, scheduler: ChannelScheduler, worker_id: str):
+    """
+    Keep this worker's leases current, start polls for channels as they fall due, run queued
+    fetch jobs and pending backfills.
+    """
+    tasks: set[asyncio.Task] = set()
+    backfills: dict[int, asyncio.Task] = {}  # channel pk -> backfill task
+    jobs: set[asyncio.Task] = set()
+    jobs_polled_at = None
+    logged_totals = FETCH_METRICS.totals()
+    leases_synced_at = None
+    logged_at = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if leases_synced_at is None or now - leases_synced_at >= LEASE_SYNC_INTERVAL:
+            busy_ids = set(scheduler.in_flight) | set(backfills)
+            channels = await run_db(sync_leases, worker_id, busy_ids, datetime.now(timezone.utc))
+            if not channels:
+                print(f"⚠️  No channels leased to worker {worker_id}")
+            scheduler.sync(channels, now)
+            leases_synced_at = now
+            idle_ids = [channel.pk for channel in channels if channel.pk not in backfills]
+            for channel in await run_db(pending_backfills, idle_ids, BACKFILL_CONCURRENCY - len(backfills)):
+                print(f"  📚 Starting backfill of {channel.username}")
+                backfills[channel.pk] = asyncio.create_task(run_backfill(client, channel))
+                backfills[channel.pk].add_done_callback(lambda _, channel_id=channel.pk: backfills.pop(channel_id, None))
+
+        if jobs_polled_at is None or now - jobs_polled_at >= JOB_POLL_INTERVAL:
+            for job in await run_db(claim_jobs, worker_id, JOB_CONCURRENCY - len(jobs), datetime.now(timezone.utc)):
+                print(f"  📥 Fetch job for {job.channel.username} (priority {job.priority})")
+                task = asyncio.create_task(run_fetch_job(client, scheduler, job, worker_id))
+                jobs.add(task)
+                task.add_done_callback(jobs.discard)
+            jobs_polled_at = now
+
+        for state in scheduler.pop_due(now, limit=FETCH_CONCURRENCY - len(tasks)):
+            task = asyncio.create_task(poll_channel(client, scheduler, state))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if now - logged_at >= QUEUE_LOG_INTERVAL:
+            print(scheduler.describe(now, REQUEST_BUDGET))
+            summary, logged_totals = summarize_period(logged_totals, now - logged_at)
+            print(summary)
+            if METRICS_FILE:
+                dump_metrics(METRICS_FILE)
+            logged_at = now
+
+        await asyncio.sleep(SCHEDULER_TICK)
@@ -0,0 +1,64 @@
+"""
+DB-backed queue of one-off channel fetches.
+
+The site enqueues a FetchJob (e.g. the first fetch of a newly added channel) and
+every fetch worker polls the table every JOB_POLL_INTERVAL seconds, claiming jobs
+with SELECT ... FOR UPDATE SKIP LOCKED so each job runs once. A job for a channel
+another worker leases is left to that worker, so a channel is never polled by two.
+Jobs are deleted when done; a job claimed by a worker that died is claimable again
+after LEASE_TTL.
+"""
+from datetime import datetime, timedelta
+
+from django.db import connection
+
+from .leasing import LEASE_TTL
+from .models import Channel, FetchJob
+
+JOB_POLL_INTERVAL = 2  # seconds between queue checks per worker
+JOB_CONCURRENCY = 2  # jobs a worker runs at once, on top of its scheduled polls
+PRIORITY_NEW_CHANNEL = 100
+
+
+def enqueue_fetch(channel: Channel, priority: int = 0) -> FetchJob:
+    """Queue a fetch of channel unless one is already waiting; a waiting job is raised to priority."""
+    job = FetchJob.objects.filter(channel=channel, claimed_at__isnull=True).first()
+    if job is None:
+        return FetchJob.objects.create(channel=channel, priority=priority)
+    if job.priority < priority:
+        job.priority = priority
+        job.save(update_fields=['priority'])
+    return job
+
+
+def claim_jobs(worker_id: str, count: int, now: datetime) -> list[FetchJob]:
+    """Claim up to count jobs, highest priority and oldest first, skipping channels leased by other workers."""
+    if count <= 0:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE videos_fetchjob
+            SET claimed_by = %s, claimed_at = %s
+            WHERE id IN (
+                SELECT id FROM videos_fetchjob job
+                WHERE (claimed_at IS NULL OR claimed_at < %s) AND NOT EXISTS (
+                    SELECT 1 FROM videos_channel channel
+                    WHERE channel.id = job.channel_id AND channel.leased_by <> %s AND channel.lease_expires_at >= %s
+                )
+                ORDER BY priority DESC, created_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, [worker_id, now, now - timedelta(seconds=LEASE_TTL), worker_id, now, count])
+        job_ids = [row[0] for row in cursor.fetchall()]
+    return list(FetchJob.objects.filter(pk__in=job_ids).select_related('channel').order_by('-priority', 'created_at'))
+
+
+def finish_job(job: FetchJob):
+    FetchJob.objects.filter(pk=job.pk).delete()
+
+
+def release_job(job: FetchJob):
+    """Put a claimed job back in the queue, e.g. for the worker that has since leased its channel."""
+    FetchJob.objects.filter(pk=job.pk, claimed_by=job.claimed_by).update(claimed_by=None, claimed_at=None)
@@ -0,0 +1,94 @@
+"""
+Channel leases for running several fetch workers side by side.
+
+Every worker heartbeats a FetchWorker row and holds a time-limited lease on its
+share of channels (Channel.leased_by / lease_expires_at). Free or expired
+channels are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so two workers never
+claim the same channel, and a crashed worker's channels are picked up by the
+others once LEASE_TTL passes.
+"""
+import math
+import os
+import socket
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Channel, FetchWorker
+
+LEASE_TTL = int(os.getenv('LEASE_TTL', '180'))  # seconds; must exceed the fetcher's lease sync interval
+
+
+def default_worker_id() -> str:
+    return os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def heartbeat(worker_id: str, now: datetime) -> int:
+    """Record this worker as alive, forget dead ones, and return the number of live workers."""
+    FetchWorker.objects.update_or_create(worker_id=worker_id, defaults={'heartbeat_at': now})
+    FetchWorker.objects.filter(heartbeat_at__lt=now - timedelta(seconds=LEASE_TTL)).delete()
+    return FetchWorker.objects.count()
+
+
+def claim_channels(worker_id: str, count: int, now: datetime) -> list[int]:
+    """Lease up to count free or expired channels to worker_id. Returns the claimed channel ids."""
+    if count <= 0:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE videos_channel
+            SET leased_by = %s, lease_expires_at = %s
+            WHERE id IN (
+                SELECT id FROM videos_channel
+                WHERE leased_by IS NULL OR lease_expires_at IS NULL OR lease_expires_at < %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, [worker_id, now + timedelta(seconds=LEASE_TTL), now, count])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def claim_channel(worker_id: str, channel_id: int, now: datetime) -> bool:
+    """Lease one specific channel to worker_id if it is free or expired."""
+    claimable = Q(leased_by__isnull=True) | Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now)
+    claimed = Channel.objects.filter(claimable, pk=channel_id).update(
+        leased_by=worker_id, lease_expires_at=now + timedelta(seconds=LEASE_TTL),
+    )
+    return claimed == 1
+
+
+def release_channels(worker_id: str, channel_ids: list[int] | None = None):
+    """Give up leases (all of this worker's when channel_ids is None)."""
+    leases = Channel.objects.filter(leased_by=worker_id)
+    if channel_ids is not None:
+        leases = leases.filter(pk__in=channel_ids)
+    leases.update(leased_by=None, lease_expires_at=None)
+
+
+def sync_leases(worker_id: str, busy_channel_ids: set[int], now: datetime) -> list[Channel]:
+    """
+    Renew this worker's leases and rebalance towards an even share of all channels:
+    claim free/expired channels when below the share, release idle extras when above it
+    (e.g. after another worker joined). busy_channel_ids are being polled right now and
+    are never released. Returns the channels this worker should poll. Runs on the DB pool.
+    """
+    live_workers = heartbeat(worker_id, now)
+    with transaction.atomic():
+        Channel.objects.filter(leased_by=worker_id).update(lease_expires_at=now + timedelta(seconds=LEASE_TTL))
+        owned_ids = list(Channel.objects.filter(leased_by=worker_id).order_by('id').values_list('id', flat=True))
+        fair_share = math.ceil(Channel.objects.count() / live_workers)
+        if len(owned_ids) < fair_share:
+            claim_channels(worker_id, fair_share - len(owned_ids), now)
+        elif len(owned_ids) > fair_share:
+            idle_ids = [channel_id for channel_id in owned_ids if channel_id not in busy_channel_ids]
+            release_channels(worker_id, idle_ids[:len(owned_ids) - fair_share])
+    return list(Channel.objects.filter(leased_by=worker_id).order_by('username'))
+
+
+def retire_worker(worker_id: str):
+    """Release every lease and the heartbeat row so other workers take over immediately."""
+    release_channels(worker_id)
+    FetchWorker.objects.filter(worker_id=worker_id).delete()
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from videos.models import Channel
+
+
+class Command(BaseCommand):
+    help = (
+        'Mark channels for a history backfill, which the running fetch workers stream in the background '
+        '(resuming from their checkpoint). Without usernames, show backfill progress.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--all', action='store_true', help='Backfill every channel')
+        parser.add_argument('--restart', action='store_true', help='Start again from the newest message')
+
+    def handle(self, *args, **options):
+        if not options['usernames'] and not options['all']:
+            self.show_progress()
+            return
+        channels = Channel.objects.all()
+        if not options['all']:
+            channels = channels.filter(username__in=[username.lstrip('@') for username in options['usernames']])
+            missing = set(username.lstrip('@') for username in options['usernames']) - set(channels.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"Unknown channels: {', '.join(sorted(missing))}")
+        fields = {'backfill_requested_at': timezone.now(), 'backfill_completed_at': None}
+        if options['restart']:
+            fields['backfill_oldest_telegram_id'] = None
+        count = channels.update(**fields)
+        self.stdout.write(self.style.SUCCESS(f"Marked {count} channels for backfill"))
+
+    def show_progress(self):
+        channels = Channel.objects.filter(backfill_requested_at__isnull=False).order_by('backfill_requested_at')
+        if not channels:
+            self.stdout.write('No backfills requested')
+        for channel in channels:
+            if channel.backfill_completed_at:
+                state = f"done {channel.backfill_completed_at:%Y-%m-%d %H:%M}"
+            elif channel.backfill_oldest_telegram_id:
+                state = f"in progress, down to id {channel.backfill_oldest_telegram_id}"
+            else:
+                state = 'pending'
+            self.stdout.write(f"{channel.username}: {state}")
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from videos import fetcher
+from videos.metrics import FETCH_METRICS
+from videos.models import Channel
+from videos.scheduler import RequestBudget
+from videos.telegram_replay import FakeTelegramClient, load_fixture_file, simulate_activity, synthetic_channel
+
+LOCAL_DB_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+
+def is_local_db() -> bool:
+    host = connection.settings_dict['HOST']
+    return host in LOCAL_DB_HOSTS or host.startswith('/')  # a path is a Unix socket
+
+
+class StatementCounter:
+    """execute_wrapper counting SQL statements on every connection, including the fetcher's DB threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark fetcher ingestion offline: full fetch cycles from fixture messages into the configured DB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channels', type=int, default=20, help='Synthetic channels to create')
+        parser.add_argument('--messages', type=int, default=500, help='Synthetic messages per channel')
+        parser.add_argument('--fixture', help='JSON fixture {username: [messages]} instead of synthetic channels')
+        parser.add_argument('--cycles', type=int, default=3)
+        parser.add_argument('--new_posts', type=int, default=5, help='New posts per channel between cycles')
+        parser.add_argument('--edits', type=int, default=2, help='Edited posts per channel between cycles')
+        parser.add_argument('--full_scans', action='store_true', help='Re-download the whole window every cycle')
+        parser.add_argument('--refresh_metrics', action='store_true', help='Refresh views of stored posts every cycle')
+        parser.add_argument('--concurrency', type=int, default=fetcher.FETCH_CONCURRENCY)
+        parser.add_argument('--keep', action='store_true', help='Keep the bench_* channels and posts afterwards')
+        parser.add_argument(
+            '--i-know-this-is-prod', action='store_true', dest='i_know_this_is_prod',
+            help='Run against a remote DB even with DEBUG off',
+        )
+
+    async def run_cycle(self, client, channels, concurrency, metrics_refresh_interval, full_scan_interval):
+        semaphore = asyncio.Semaphore(concurrency)
+        since_date = datetime.now(timezone.utc) - timedelta(days=fetcher.DAYS_BACK)
+
+        async def check(channel):
+            async with semaphore:
+                return await fetcher.check_channel(
+                    client, channel, since_date, metrics_refresh_interval, full_scan_interval,
+                )
+
+        return await asyncio.gather(*(check(channel) for channel in channels))
+
+    def handle(self, *args, **options):
+        if not (is_local_db() or settings.DEBUG or options['i_know_this_is_prod']):
+            raise CommandError(
+                f"Refusing to create and delete bench_* data in the DB at {connection.settings_dict['HOST']}: "
+                'use a local DB, set DEBUG=True, or pass --i-know-this-is-prod'
+            )
+        if options['fixture']:
+            fake_channels = load_fixture_file(options['fixture'])
+            for fake_channel in fake_channels:
+                fake_channel.username = f"bench_{fake_channel.username}"
+        else:
+            fake_channels = [
+                synthetic_channel(f"bench_{index}", 10 ** 9 + index, options['messages'])
+                for index in range(options['channels'])
+            ]
+        client = FakeTelegramClient(fake_channels)
+        channels = [Channel.objects.create(username=fake.username, title=fake.username) for fake in fake_channels]
+
+        counter = StatementCounter()
+        counter.install(connection=connection)
+        connection_created.connect(counter.install)
+        metrics_refresh_interval = 0 if options['refresh_metrics'] else fetcher.METRICS_REFRESH_INTERVAL
+        full_scan_interval = 0 if options['full_scans'] else fetcher.FULL_SCAN_INTERVAL
+        self.stdout.write(
+            f"Benchmarking {len(channels)} channels, {sum(len(c.messages) for c in fake_channels)} messages, "
+            f"{options['cycles']} cycles, concurrency {options['concurrency']}"
+        )
+        # The benchmark measures ingestion, not the production Telegram request budget.
+        request_budget, fetcher.REQUEST_BUDGET = fetcher.REQUEST_BUDGET, RequestBudget(10 ** 9)
+        try:
+            for cycle in range(1, options['cycles'] + 1):
+                totals_before = FETCH_METRICS.totals()
+                statements_before = counter.count
+                calls_before = sum(client.calls.values())
+                started = time.monotonic()
+                results = asyncio.run(self.run_cycle(
+                    client, channels, options['concurrency'], metrics_refresh_interval, full_scan_interval,
+                ))
+                elapsed = time.monotonic() - started
+                totals_after = FETCH_METRICS.totals()
+
+                scanned = totals_after.get('tg_fetch_messages_scanned_total', 0) - totals_before.get('tg_fetch_messages_scanned_total', 0)
+                db_seconds = totals_after.get('tg_fetch_db_seconds_total', 0) - totals_before.get('tg_fetch_db_seconds_total', 0)
+                statements = counter.count - statements_before
+                new_posts = sum(result[0] for result in results)
+                updated_posts = sum(result[1] for result in results)
+                unchanged_posts = sum(result[2] for result in results)
+                self.stdout.write(
+                    f"Cycle {cycle}: {elapsed:.2f}s | {scanned / elapsed if elapsed else 0:.0f} msgs/sec | "
+                    f"{statements / scanned if scanned else 0:.3f} DB statements/msg ({statements} total, {db_seconds:.2f}s) | "
+                    f"Telegram calls: {sum(client.calls.values()) - calls_before} | "
+                    f"New: {new_posts} | Updated: {updated_posts} | Unchanged: {unchanged_posts}"
+                )
+                for fake_channel in fake_channels:
+                    simulate_activity(fake_channel, new_posts=options['new_posts'], edits=options['edits'], seed=cycle)
+                for channel in channels:
+                    channel.refresh_from_db()
+        finally:
+            fetcher.REQUEST_BUDGET = request_budget
+            connection_created.disconnect(counter.install)
+            if not options['keep']:
+                Channel.objects.filter(pk__in=[channel.pk for channel in channels]).delete()
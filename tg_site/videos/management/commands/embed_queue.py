@@ -0,0 +1,50 @@
+import threading
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+
+from videos.embedding_queue import EMBED_QUEUE_BATCH, embed_queued, run_embedding_worker, set_embed_on_ingest
+from videos.leasing import default_worker_id
+from videos.models import EmbeddingJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Embed posts queued by ingestion (also done by a thread of every fetch worker with EMBED_ON_INGEST=1). '
+        'Runs until interrupted, or with --once drains the queue and exits. Posts are only queued once a worker '
+        'has run; --disable stops queueing and drops the queue.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Embed everything queued now, then exit')
+        parser.add_argument('--disable', action='store_true', help='Stop queueing posts and drop the queued ones')
+        parser.add_argument('--batch_size', type=int, default=EMBED_QUEUE_BATCH, help='Posts embedded per batch')
+
+    def handle(self, *args, **options):
+        if options['disable']:
+            set_embed_on_ingest(False)
+            self.stdout.write(self.style.SUCCESS('Done! Posts are no longer queued for embedding'))
+            return
+        queue = EmbeddingJob.objects.aggregate(
+            total=Count('id'), claimed=Count('claimed_at'), parked=Count('parked_at'), oldest=Min('queued_at'),
+        )
+        oldest = f", oldest queued {queue['oldest']:%Y-%m-%d %H:%M:%S}" if queue['oldest'] else ''
+        self.stdout.write(
+            f"{queue['total']} posts queued for embedding ({queue['claimed']} claimed, {queue['parked']} parked){oldest}"
+        )
+        worker_id = default_worker_id()
+        if options['once']:
+            totals = Counter()
+            while embed_queued(worker_id, options['batch_size'], settle=0, totals=totals):
+                pass
+            self.stdout.write(self.style.SUCCESS(
+                f"Done! Embedded {totals['embedded']} queued posts ({totals['failed']} failed, {totals['parked']} parked)"
+            ))
+            return
+        set_embed_on_ingest(True)
+        self.stdout.write(f'Embedding queued posts as worker {worker_id} (Ctrl-C to stop)')
+        try:
+            run_embedding_worker(worker_id, threading.Event(), options['batch_size'])
+        except KeyboardInterrupt:
+            pass
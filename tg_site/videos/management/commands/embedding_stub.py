@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from videos.embedding_stub import StubEmbeddingServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a rate-limited stub of the OpenAI embeddings API, for running generate_embeddings offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--rpm', type=int, default=3000, help='Requests allowed per minute')
+        parser.add_argument('--tpm', type=int, default=1000000, help='Tokens allowed per minute')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request takes')
+
+    def handle(self, *args, **options):
+        server = StubEmbeddingServer(
+            ('127.0.0.1', options['port']), rpm=options['rpm'], tpm=options['tpm'], latency=options['latency'],
+        )
+        self.stdout.write(f'Serving embeddings at {server.base_url} ({options["rpm"]} rpm, {options["tpm"]} tpm)')
+        self.stdout.write(f'Run generate_embeddings with OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=stub')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Served {server.served} requests, throttled {server.throttled}')
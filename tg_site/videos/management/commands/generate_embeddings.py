@@ -1,125 +1,190 @@
-from django.core.management.base import BaseCommand
-from videos.models import Post, EmbeddingGenerator
-from django.db.models import Q
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from videos.embeddings import get_backend
+from videos.models import EmbeddingCheckpoint, EmbeddingGenerator, EmbeddingJob, Post, text_embedding_key
+
+PROGRESS_INTERVAL = 5  # seconds between progress lines
 
 
 class Command(BaseCommand):
-    help = 'Generate embeddings for posts that dont have them'
+    help = 'Generate embeddings for posts that dont have them (all posts with --force, resuming an interrupted run)'
 
     def add_arguments(self, parser):
-        parser.add_argument('--batch_size', type=int, default=100)
+        parser.add_argument(
+            '--batch_size', type=int, default=1000,
+            help='Posts read per page; each page is packed into token-budgeted embedding requests',
+        )
         parser.add_argument('--limit', type=int, help='Limit number of posts to process')
         parser.add_argument('--force', action='store_true', help='Regenerate all embeddings')
         parser.add_argument('--threads', type=int, default=10, help='Number of concurrent threads')
-
-    def generate_embedding_for_post(self, post):
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                embedding = EmbeddingGenerator.generate_embedding(post.text)
-                return (post.id, embedding, None)
-            except Exception as e:
-                error_str = str(e).lower()
-                if 'rate' in error_str or '429' in error_str or 'quota' in error_str:
-                    wait_time = (2 ** attempt) * 2  # Exponential backoff: 2, 4, 8, 16, 32 seconds
-                    if attempt < max_retries - 1:
-                        time.sleep(wait_time)
-                        continue
-                return (post.id, None, str(e))
-
-    def process_batch(self, batch):
-        """Process a batch of posts with single API call"""
-        try:
-            texts = [post.text for post in batch]
-            embeddings = EmbeddingGenerator.generate_embeddings_batch(texts)
-            return (batch, embeddings, None)
-        except Exception as e:
-            return (batch, None, str(e))
+        parser.add_argument('--restart', action='store_true', help='With --force, ignore the checkpoint and start over')
 
     def handle(self, *args, **options):
         batch_size = options['batch_size']
         limit = options['limit']
         force = options['force']
         threads = options['threads']
+        backend = get_backend()
         
+        queryset = Post.objects.filter(text__isnull=False).exclude(text='')
+        if not force:
+            # Posts that failed stay NULL and are retried by the next run; no checkpoint needed.
+            queryset = queryset.filter(embedding__isnull=True)
+        checkpoint = None
+        start_id = 0
         if force:
-            queryset = Post.objects.filter(text__isnull=False).exclude(text='')
-        else:
-            queryset = Post.objects.filter(
-                Q(embedding__isnull=True) & Q(text__isnull=False)
-            ).exclude(text='')
+            checkpoint, _ = EmbeddingCheckpoint.objects.get_or_create(name=f'force:{backend.name}:{backend.model}')
+            if options['restart'] and checkpoint.last_post_id:
+                checkpoint.last_post_id = 0
+                checkpoint.save(update_fields=['last_post_id', 'updated_at'])
+            start_id = checkpoint.last_post_id
+            if start_id:
+                self.stdout.write(f'Resuming after post {start_id} (pass --restart to start over)')
         
+        total = queryset.filter(id__gt=start_id).count()
         if limit:
-            queryset = queryset[:limit]
-        
-        total = queryset.count()
-        self.stdout.write(f'Processing {total} posts with {threads} parallel batches of {batch_size}...')
+            total = min(total, limit)
+        self.stdout.write(f'Processing {total} posts with {backend.name} ({backend.model}), {threads} parallel requests...')
         
-        processed = 0
-        errors = 0
-        start_time = time.time()
-        
-        # Process in super-batches for threading
-        super_batch_size = batch_size * threads
-        
-        for i in range(0, total, super_batch_size):
-            super_batch_start = time.time()
-            
-            # Create sub-batches for parallel processing
-            batches = []
-            for j in range(i, min(i + super_batch_size, total), batch_size):
-                batch = list(queryset[j:j + batch_size])
-                if batch:
-                    batches.append(batch)
-            
-            self.stdout.write(f'\n=== Super-batch {i//super_batch_size + 1}: Processing {len(batches)} batches in parallel ===')
-            
-            # Process batches in parallel
-            results = []
-            with ThreadPoolExecutor(max_workers=threads) as executor:
-                futures = {executor.submit(self.process_batch, batch): batch for batch in batches}
-                
-                completed = 0
-                for future in as_completed(futures):
-                    completed += 1
-                    self.stdout.write(f'  Batch completed: {completed}/{len(batches)}')
-                    results.append(future.result())
-            
-            # Bulk update all results
-            all_posts_to_update = []
-            for batch, embeddings, error in results:
-                if error:
-                    self.stdout.write(self.style.ERROR(f'Batch error: {error}'))
-                    errors += len(batch)
-                elif embeddings:
-                    for post, embedding in zip(batch, embeddings):
-                        if embedding:
-                            post.embedding = embedding
-                            all_posts_to_update.append(post)
-            
-            if all_posts_to_update:
-                Post.objects.bulk_update(all_posts_to_update, ['embedding'], batch_size=500)
-                processed += len(all_posts_to_update)
-                self.stdout.write(f'✓ Super-batch complete: {len(all_posts_to_update)} embeddings saved')
-            
-            super_batch_time = time.time() - super_batch_start
-            elapsed = time.time() - start_time
-            posts_per_sec = processed / elapsed if elapsed > 0 else 0
-            remaining = (total - processed) / posts_per_sec if posts_per_sec > 0 else 0
-            
-            self.stdout.write(
-                f'Processed {processed}/{total} ({processed/total*100:.1f}%) | '
-                f'{posts_per_sec:.1f} posts/sec | '
-                f'Super-batch time: {super_batch_time:.1f}s | '
-                f'ETA: {remaining/60:.1f} min | '
-                f'Errors: {errors}'
-            )
+        stats = SimpleNamespace(
+            total=total, processed=0, unchanged=0, errors=0, first_failed_id=None, writer_error=None, started=time.monotonic(),
+            tokens_before=backend.tokens_used, reused_before=backend.reused, reported=time.monotonic(),
+        )
+        # Batches are read by keyset (id > last id) and embedded on the thread pool while the writer
+        # thread saves finished ones in read order; the bounded queue keeps reads from running ahead.
+        pending = queue.Queue(maxsize=threads * 2)
+        writer = threading.Thread(target=self.write_results, args=(pending, checkpoint, stats, backend), name='embedding-writer')
+        writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                try:
+                    self.produce(pool, pending, writer, stats, backend, queryset, start_id, batch_size, limit)
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+        finally:
+            self.enqueue(pending, None, writer)
+            writer.join()
+        if stats.writer_error is not None:
+            raise stats.writer_error
         
+        if checkpoint and stats.first_failed_id is None and not queryset.filter(id__gt=checkpoint.last_post_id).exists():
+            checkpoint.delete()
+        self.report(stats, backend)
+        if stats.first_failed_id is not None and checkpoint:
+            self.stdout.write(self.style.WARNING(f'Run again to resume from post {checkpoint.last_post_id}'))
         self.stdout.write(
             self.style.SUCCESS(
-                f'Done! Processed {processed} posts with {errors} errors in {elapsed/60:.1f} minutes'
+                f'Done! Processed {stats.processed} posts with {stats.errors} errors in {(time.monotonic() - stats.started) / 60:.1f} minutes '
+                f'({stats.unchanged} already current, {backend.reused - stats.reused_before} reused from duplicate texts)'
             )
         )
 
+    def produce(self, pool, pending, writer, stats, backend, queryset, start_id, batch_size, limit):
+        """Read pages, submit their embedding requests and queue them for the writer in read order."""
+        for page in self.iter_batches(queryset, start_id, batch_size, limit):
+            # Posts already embedded from the same model and (normalized) text are left as they are.
+            changed = []
+            for post in page:
+                key = text_embedding_key(backend.model, post.text)
+                if post.embedding_key != key:
+                    post.embedding_key = key
+                    changed.append(post)
+            stats.unchanged += len(page) - len(changed)
+            # Each page is tokenized once; its requests are packed by, and sent with, those counts.
+            texts = [post.text for post in changed]
+            prepared = backend.prepare(texts)
+            for group in backend.pack(prepared):
+                batch = [changed[index] for index in group]
+                future = pool.submit(
+                    EmbeddingGenerator.generate_embeddings_batch,
+                    [texts[index] for index in group], [prepared[index] for index in group],
+                )
+                self.put(pending, (batch, future, batch[-1].id), writer, stats)
+            # Moves the checkpoint past the page's trailing unchanged posts once its batches are written.
+            self.put(pending, ([], None, page[-1].id), writer, stats)
+
+    def enqueue(self, pending, item, writer) -> bool:
+        """put() that gives up once the writer thread has stopped instead of blocking on a full queue."""
+        while writer.is_alive():
+            try:
+                pending.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def put(self, pending, item, writer, stats):
+        if not self.enqueue(pending, item, writer):
+            raise stats.writer_error or RuntimeError('Embedding writer thread stopped')
+
+    def iter_batches(self, queryset, after_id, batch_size, limit):
+        read = 0
+        while not limit or read < limit:
+            size = batch_size if not limit else min(batch_size, limit - read)
+            batch = list(queryset.filter(id__gt=after_id).order_by('id').only('id', 'text', 'embedding_key')[:size])
+            if not batch:
+                return
+            yield batch
+            read += len(batch)
+            after_id = batch[-1].id
+
+    def write_results(self, pending, checkpoint, stats, backend):
+        """Writer thread: save each batch's embeddings in read order and advance the checkpoint."""
+        try:
+            while (item := pending.get()) is not None:
+                batch, future, last_post_id = item
+                try:
+                    embeddings = future.result() if future else []
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Batch error (posts {batch[0].id}-{batch[-1].id}): {e}'))
+                    stats.errors += len(batch)
+                    if stats.first_failed_id is None:
+                        stats.first_failed_id = batch[0].id
+                    continue
+                
+                posts = []
+                for post, embedding in zip(batch, embeddings):
+                    if embedding:
+                        post.embedding = embedding
+                        posts.append(post)
+                with transaction.atomic():
+                    Post.objects.bulk_update(posts, ['embedding', 'embedding_key'], batch_size=500)
+                    # The updated rows stay locked, so a queued job is only dropped if its text is the one embedded.
+                    current_texts = dict(Post.objects.filter(pk__in=[post.pk for post in posts]).values_list('pk', 'text'))
+                    EmbeddingJob.objects.filter(post_id__in=[post.pk for post in posts if current_texts.get(post.pk) == post.text]).delete()
+                    # Everything below the first failed batch is done; later batches are redone on resume.
+                    if checkpoint and stats.first_failed_id is None:
+                        checkpoint.last_post_id = last_post_id
+                        checkpoint.save(update_fields=['last_post_id', 'updated_at'])
+                stats.processed += len(posts)
+                if time.monotonic() - stats.reported >= PROGRESS_INTERVAL:
+                    self.report(stats, backend)
+                    stats.reported = time.monotonic()
+        except Exception as e:
+            # The producer sees the thread stop and re-raises this in the main thread.
+            stats.writer_error = e
+        finally:
+            connection.close()
+
+    def report(self, stats, backend):
+        elapsed = time.monotonic() - stats.started
+        done = stats.processed + stats.unchanged
+        posts_per_sec = done / elapsed if elapsed > 0 else 0
+        tokens_per_sec = (backend.tokens_used - stats.tokens_before) / elapsed if elapsed > 0 else 0
+        remaining = (stats.total - done) / posts_per_sec if posts_per_sec > 0 else 0
+        self.stdout.write(
+            f'Processed {done}/{stats.total} ({done / stats.total * 100 if stats.total else 100:.1f}%) | '
+            f'{posts_per_sec:.1f} posts/sec | '
+            f'{tokens_per_sec:.0f} tokens/sec | '
+            f'ETA: {remaining / 60:.1f} min | '
+            f'Errors: {stats.errors}'
+            + (f' | {backend.limiter.describe()}' if getattr(backend, 'limiter', None) else '')
+        )
@@ -0,0 +1,172 @@
+"""
+Counters and histograms for the fetch worker.
+
+FETCH_METRICS is filled in by videos/fetcher.py from both the event loop and the DB
+thread pool. It can be scraped in Prometheus text format (METRICS_PORT) and/or
+dumped as JSON (METRICS_FILE), and is diffed into the fetcher's periodic log summary.
+"""
+import bisect
+import json
+import os
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 = no HTTP endpoint
+METRICS_FILE = os.getenv('METRICS_FILE', '')  # empty = no JSON dump
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]  # seconds
+
+COUNTER_HELP = {
+    'tg_fetch_telegram_calls_total': 'Telegram API requests made, by method.',
+    'tg_fetch_api_seconds_total': 'Seconds spent awaiting Telegram API requests.',
+    'tg_fetch_db_seconds_total': 'Seconds spent running DB work on the fetcher thread pool, by function.',
+    'tg_fetch_flood_wait_seconds_total': 'Seconds slept because of FloodWaitError.',
+    'tg_fetch_messages_scanned_total': 'Telegram messages received in fetch windows.',
+    'tg_fetch_posts_inserted_total': 'Posts inserted.',
+    'tg_fetch_posts_updated_total': 'Posts updated because a tracked field changed.',
+    'tg_fetch_posts_unchanged_total': 'Posts skipped because nothing changed.',
+    'tg_fetch_channel_polls_total': 'Channel polls finished.',
+    'tg_fetch_channel_errors_total': 'Channel polls and pushed batches that failed.',
+    'tg_fetch_backfill_errors_total': 'History backfills interrupted by an error (resumed from their checkpoint).',
+    'tg_fetch_live_events_total': 'Telegram update events received for leased channels, by kind.',
+    'tg_fetch_posts_embedded_total': 'Queued posts embedded by this worker (videos/embedding_queue.py).',
+    'tg_fetch_embedding_errors_total': 'Batches of queued posts whose embedding failed (retried after LEASE_TTL).',
+}
+HISTOGRAM_HELP = {
+    'tg_fetch_channel_seconds': 'Wall time of one channel poll (Telegram + DB).',
+    'tg_fetch_live_latency_seconds': 'Seconds from a pushed post being published to it being written.',
+    'tg_fetch_embedding_lag_seconds': 'Seconds from a post being queued for embedding to its embedding being written.',
+}
+GAUGE_HELP = {
+    'tg_fetch_channel_last_poll_seconds': 'Wall time of the most recent poll, by channel.',
+}
+
+
+class Histogram:
+    def __init__(self, buckets: list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def percentile(self, fraction: float) -> float | None:
+        """Upper bound of the bucket holding the given fraction of observations."""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + [float('inf')], self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: dict[str, dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: dict[str, dict[tuple, float]] = defaultdict(dict)
+        self.histograms: dict[str, Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(LATENCY_BUCKETS)
+            self.histograms[name].observe(value)
+
+    def totals(self) -> dict[str, float]:
+        """Every counter summed over its labels."""
+        with self.lock:
+            return {name: sum(series.values()) for name, series in self.counters.items()}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines += [f'# HELP {name} {COUNTER_HELP.get(name, name)}', f'# TYPE {name} counter']
+                lines += [f'{name}{format_labels(labels)} {value}' for labels, value in sorted(series.items())]
+            for name, series in sorted(self.gauges.items()):
+                lines += [f'# HELP {name} {GAUGE_HELP.get(name, name)}', f'# TYPE {name} gauge']
+                lines += [f'{name}{format_labels(labels)} {value}' for labels, value in sorted(series.items())]
+            for name, histogram in sorted(self.histograms.items()):
+                lines += [f'# HELP {name} {HISTOGRAM_HELP.get(name, name)}', f'# TYPE {name} histogram']
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + ['+Inf'], histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [f'{name}_sum {histogram.total}', f'{name}_count {histogram.count}']
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self) -> dict:
+        with self.lock:
+            return {
+                'counters': {
+                    name: {format_labels(labels) or 'total': value for labels, value in series.items()}
+                    for name, series in self.counters.items()
+                },
+                'gauges': {
+                    name: {format_labels(labels) or 'value': value for labels, value in series.items()}
+                    for name, series in self.gauges.items()
+                },
+                'histograms': {
+                    name: {
+                        'count': histogram.count,
+                        'sum': histogram.total,
+                        'p50': histogram.percentile(0.5),
+                        'p95': histogram.percentile(0.95),
+                        'buckets': dict(zip([str(b) for b in histogram.buckets] + ['+Inf'], histogram.counts)),
+                    }
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+
+FETCH_METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FETCH_METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would otherwise flood the worker log
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Serve FETCH_METRICS at http://0.0.0.0:<port>/ from a daemon thread."""
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+def dump_metrics(path: str):
+    """Atomically replace path with the current metrics as JSON."""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(FETCH_METRICS.to_json(), f, indent=2, default=str)
+    os.replace(tmp_path, path)
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='last_full_scan_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_seen_telegram_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0002_channel_sync_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='telegram_access_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='telegram_peer_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
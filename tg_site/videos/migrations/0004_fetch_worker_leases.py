@@ -0,0 +1,31 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0003_channel_telegram_peer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('worker_id', models.CharField(max_length=100, unique=True)),
+                ('heartbeat_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='leased_by',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
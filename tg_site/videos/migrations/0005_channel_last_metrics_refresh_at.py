@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0004_fetch_worker_leases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='last_metrics_refresh_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0005_channel_last_metrics_refresh_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='fetch_blocked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='fetch_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='fetch_status',
+            field=models.CharField(choices=[('ok', 'OK'), ('backoff', 'Backing off'), ('open', 'Circuit open')], default='ok', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_fetch_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_fetch_error_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
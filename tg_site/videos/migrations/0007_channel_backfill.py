@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0006_channel_fetch_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='backfill_completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='backfill_oldest_telegram_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='backfill_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
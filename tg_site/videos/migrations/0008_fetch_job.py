@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0007_channel_backfill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fetch_jobs', to='videos.channel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-priority', 'created_at'], name='fetchjob_queue_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:36
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+import pgvector.django.indexes
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; posts stay writable while it builds.
+    atomic = False
+
+    dependencies = [
+        ('videos', '0008_fetch_job'),
+    ]
+
+    operations = [
+        # 0001 declared vector(384) while the model and EmbeddingGenerator use 1536. Embeddings of
+        # any other size cannot be cast (or compared with 1536-d queries); generate_embeddings
+        # recreates them.
+        migrations.RunSQL(
+            'UPDATE videos_post SET embedding = NULL WHERE embedding IS NOT NULL AND vector_dims(embedding) <> 1536',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='embedding',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=1536, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='post_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+    ]
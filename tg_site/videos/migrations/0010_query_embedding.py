@@ -0,0 +1,25 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:37
+
+from django.db import migrations, models
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0009_post_embedding_hnsw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=100)),
+                ('query', models.TextField()),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=1536)),
+                ('created_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+# Keeps videos_post.search_vector current for every writer (ORM, the fetcher's bulk upserts,
+# live ingest), and re-indexes a channel's posts when its search_config changes.
+SEARCH_VECTOR_TRIGGERS = """
+CREATE FUNCTION videos_post_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector(
+        COALESCE((SELECT search_config FROM videos_channel WHERE id = NEW.channel_id), 'simple')::regconfig,
+        COALESCE(NEW.text, '')
+    );
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER videos_post_search_vector BEFORE INSERT OR UPDATE OF text, channel_id ON videos_post
+    FOR EACH ROW EXECUTE FUNCTION videos_post_search_vector();
+
+CREATE FUNCTION videos_channel_search_config() RETURNS trigger AS $$
+BEGIN
+    UPDATE videos_post SET search_vector = to_tsvector(NEW.search_config::regconfig, COALESCE(text, ''))
+    WHERE channel_id = NEW.id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER videos_channel_search_config AFTER UPDATE OF search_config ON videos_channel
+    FOR EACH ROW WHEN (OLD.search_config IS DISTINCT FROM NEW.search_config)
+    EXECUTE FUNCTION videos_channel_search_config();
+"""
+
+DROP_SEARCH_VECTOR_TRIGGERS = """
+DROP TRIGGER videos_channel_search_config ON videos_channel;
+DROP FUNCTION videos_channel_search_config();
+DROP TRIGGER videos_post_search_vector ON videos_post;
+DROP FUNCTION videos_post_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+    # The GIN index is built with CREATE INDEX CONCURRENTLY, which cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('videos', '0010_query_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='search_config',
+            field=models.CharField(choices=[('simple', 'Any language (no stemming)'), ('arabic', 'Arabic'), ('english', 'English'), ('french', 'French'), ('german', 'German'), ('russian', 'Russian'), ('spanish', 'Spanish')], default='simple', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGERS, reverse_sql=DROP_SEARCH_VECTOR_TRIGGERS),
+        migrations.RunSQL(
+            "UPDATE videos_post SET search_vector = to_tsvector('simple', COALESCE(text, ''))",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        # The btree index from 0001 cannot serve ILIKE '%q%' and only slows down writes.
+        migrations.AlterField(
+            model_name='post',
+            name='text',
+            field=models.TextField(),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ),
+    ]
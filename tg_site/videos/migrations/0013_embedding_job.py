@@ -0,0 +1,59 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Queues every post whose text is new or changed for embedding, in the writer's transaction
+# (the fetcher's bulk upserts, live ingest, backfills, import_jsons). Edits of a post that is
+# already queued, or being embedded, only move its queued_at and drop the claim.
+QUEUE_EMBEDDING_TRIGGER = """
+CREATE FUNCTION videos_post_queue_embedding() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.text = '' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO videos_embeddingjob (post_id, queued_at) VALUES (NEW.id, now())
+    ON CONFLICT (post_id) DO UPDATE SET queued_at = EXCLUDED.queued_at, claimed_by = NULL, claimed_at = NULL;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER videos_post_queue_embedding AFTER INSERT ON videos_post
+    FOR EACH ROW EXECUTE FUNCTION videos_post_queue_embedding();
+
+CREATE TRIGGER videos_post_queue_embedding_edit AFTER UPDATE OF text ON videos_post
+    FOR EACH ROW WHEN (OLD.text IS DISTINCT FROM NEW.text)
+    EXECUTE FUNCTION videos_post_queue_embedding();
+"""
+
+DROP_QUEUE_EMBEDDING_TRIGGER = """
+DROP TRIGGER videos_post_queue_embedding_edit ON videos_post;
+DROP TRIGGER videos_post_queue_embedding ON videos_post;
+DROP FUNCTION videos_post_queue_embedding();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0012_embedding_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_by', models.CharField(blank=True, max_length=100, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='embedding_job', to='videos.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['queued_at'], name='embeddingjob_queue_idx')],
+            },
+        ),
+        migrations.RunSQL(QUEUE_EMBEDDING_TRIGGER, DROP_QUEUE_EMBEDDING_TRIGGER),
+    ]
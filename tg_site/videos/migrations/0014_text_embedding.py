@@ -0,0 +1,29 @@
+# Generated by Django 4.2.25 on 2026-10-17 17:56
+
+from django.db import migrations, models
+import pgvector.django.vector
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0013_embedding_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TextEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model', models.CharField(max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField(dimensions=1536)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='embedding_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
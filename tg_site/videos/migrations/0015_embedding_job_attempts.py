@@ -0,0 +1,58 @@
+# Generated by Django 4.2.25 on 2026-10-17 18:09
+
+from django.db import migrations, models
+
+
+# Same as in 0013, but an edit also gives a parked or failing post a fresh start.
+QUEUE_EMBEDDING_FUNCTION = """
+CREATE OR REPLACE FUNCTION videos_post_queue_embedding() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.text = '' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO videos_embeddingjob (post_id, queued_at, attempts, last_error) VALUES (NEW.id, now(), 0, '')
+    ON CONFLICT (post_id) DO UPDATE SET queued_at = EXCLUDED.queued_at, claimed_by = NULL, claimed_at = NULL,
+        attempts = 0, last_error = '', parked_at = NULL;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_QUEUE_EMBEDDING_FUNCTION = """
+CREATE OR REPLACE FUNCTION videos_post_queue_embedding() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.text = '' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO videos_embeddingjob (post_id, queued_at) VALUES (NEW.id, now())
+    ON CONFLICT (post_id) DO UPDATE SET queued_at = EXCLUDED.queued_at, claimed_by = NULL, claimed_at = NULL;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0014_text_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embeddingjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='embeddingjob',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='embeddingjob',
+            name='parked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(QUEUE_EMBEDDING_FUNCTION, PREVIOUS_QUEUE_EMBEDDING_FUNCTION),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.25 on 2026-10-17 18:30
+
+import os
+import sys
+
+import django.contrib.postgres.indexes
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+import django.db.models.functions.text
+
+
+# pg_trgm ships with Postgres' contrib modules, which minimal builds leave out. Without it the
+# migration fails, unless this is set: then it is recorded as applied without the index, and
+# substring matches scan the table until it is re-run (see docs/RAILWAY_DEPLOY.md).
+ALLOW_MISSING_PG_TRGM = os.getenv('ALLOW_MISSING_PG_TRGM', '0') == '1'
+
+
+def create_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            if not ALLOW_MISSING_PG_TRGM:
+                raise ImproperlyConfigured(
+                    'The pg_trgm extension is not available on this Postgres server. Install the contrib '
+                    'modules, or set ALLOW_MISSING_PG_TRGM=1 to migrate without the trigram index.'
+                )
+            sys.stderr.write(
+                '\n  ⚠️  pg_trgm is not available: post_text_trgm_idx was NOT built and substring search '
+                'will scan videos_post. Once the extension is installed, run\n'
+                '      python manage.py migrate videos 0015 && python manage.py migrate videos\n'
+            )
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "post_text_trgm_idx" ON "videos_post" '
+            'USING gin ((UPPER("text") gin_trgm_ops))'
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS "post_text_trgm_idx"')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('videos', '0015_embedding_job_attempts'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='post',
+                    index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('text'), name='gin_trgm_ops'), name='post_text_trgm_idx'),
+                ),
+            ],
+            database_operations=[migrations.RunPython(create_trigram_index, drop_trigram_index)],
+        ),
+    ]
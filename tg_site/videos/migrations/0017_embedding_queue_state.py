@@ -0,0 +1,59 @@
+# Generated by Django 4.2.25 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+# Same as in 0015, but nothing is queued until an embedding worker has switched the queue on.
+QUEUE_EMBEDDING_FUNCTION = """
+CREATE OR REPLACE FUNCTION videos_post_queue_embedding() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.text = '' THEN
+        RETURN NULL;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM videos_embeddingqueuestate WHERE enabled) THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO videos_embeddingjob (post_id, queued_at, attempts, last_error) VALUES (NEW.id, now(), 0, '')
+    ON CONFLICT (post_id) DO UPDATE SET queued_at = EXCLUDED.queued_at, claimed_by = NULL, claimed_at = NULL,
+        attempts = 0, last_error = '', parked_at = NULL;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_QUEUE_EMBEDDING_FUNCTION = """
+CREATE OR REPLACE FUNCTION videos_post_queue_embedding() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.text = '' THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO videos_embeddingjob (post_id, queued_at, attempts, last_error) VALUES (NEW.id, now(), 0, '')
+    ON CONFLICT (post_id) DO UPDATE SET queued_at = EXCLUDED.queued_at, claimed_by = NULL, claimed_at = NULL,
+        attempts = 0, last_error = '', parked_at = NULL;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('videos', '0016_post_text_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingQueueState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enabled', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(
+            'INSERT INTO videos_embeddingqueuestate (id, enabled, changed_at) VALUES (1, false, now())',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(QUEUE_EMBEDDING_FUNCTION, PREVIOUS_QUEUE_EMBEDDING_FUNCTION),
+    ]
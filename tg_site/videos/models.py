@@ -1,71 +1,170 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections, models, transaction
+from django.db.models import F, Q
 from django.db.models.expressions import RawSQL
-from pgvector.django import VectorField
-from openai import OpenAI
-import tiktoken
+from django.db.models.functions import Upper
+from django.db.models.sql.constants import INNER
+from pgvector.django import HnswIndex, VectorField
+import hashlib
+import operator
 import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import reduce
 
+from django.utils import timezone
 
-class EmbeddingGenerator:
-    _client = None
-    _encoding = None
+from .embeddings import EMBEDDING_DIMENSIONS, get_backend
+
+# Query embeddings are cached per process (LRU) and in the QueryEmbedding table, keyed by
+# model + normalized query, so repeated and paginated searches skip the embedding backend.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024'))  # entries per process
+QUERY_EMBEDDING_TTL = timedelta(days=int(os.getenv('QUERY_EMBEDDING_TTL_DAYS', '30')))
+# HNSW candidate list per query; raised to the query's limit (up to pgvector's maximum of 1000)
+# so a semantic search can return all the rows it asks for.
+HNSW_EF_SEARCH = int(os.getenv('HNSW_EF_SEARCH', '100'))
+HNSW_EF_SEARCH_MAX = 1000
+# pgvector >= 0.8 keeps scanning the index until enough rows pass the filters.
+HNSW_ITERATIVE_SCAN = os.getenv('HNSW_ITERATIVE_SCAN', 'strict_order')  # 'off' disables it
+HNSW_MAX_SCAN_TUPLES = int(os.getenv('HNSW_MAX_SCAN_TUPLES', '20000'))
+# Hybrid search: reciprocal rank fusion of the keyword and semantic rankings. A post's score is
+# sum(weight / (HYBRID_RRF_K + its position in that ranking)); a larger k flattens the rank curve.
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+HYBRID_SEMANTIC_WEIGHT = float(os.getenv('HYBRID_SEMANTIC_WEIGHT', '1.0'))
+HYBRID_KEYWORD_WEIGHT = float(os.getenv('HYBRID_KEYWORD_WEIGHT', '1.0'))
+# Keyword search also matches substrings through the trigram index, which needs at least 3 characters.
+TRIGRAM_MIN_LENGTH = 3
+
+
+def normalize_query(text):
+    """Unicode-normalize and collapse whitespace, so trivially different spellings share a cache entry."""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+
+def text_embedding_key(model, text):
+    """Content address of text's embedding by model: sha256 of model + normalized text."""
+    return hashlib.sha256(f"{model}\n{normalize_query(text)}".encode()).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe least-recently-used mapping holding at most maxsize entries."""
     
-    @classmethod
-    def get_client(cls):
-        if cls._client is None:
-            cls._client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-        return cls._client
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
     
-    @classmethod
-    def get_encoding(cls):
-        if cls._encoding is None:
-            cls._encoding = tiktoken.encoding_for_model("text-embedding-3-small")
-        return cls._encoding
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+    
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+QUERY_EMBEDDINGS = LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+
+
+class EmbeddingGenerator:
+    """Post and query embeddings from the configured backend (videos/embeddings.py)."""
     
     @classmethod
     def generate_embedding(cls, text):
-        if not text or not text.strip():
+        return get_backend().encode([text])[0]
+    
+    @classmethod
+    def generate_query_embedding(cls, text):
+        """generate_embedding for search queries, served from the in-process LRU or the QueryEmbedding table when cached."""
+        query = normalize_query(text)
+        if not query:
             return None
+        model = get_backend().model
+        key = text_embedding_key(model, query)
+        embedding = QUERY_EMBEDDINGS.get(key)
+        if embedding is not None:
+            return embedding
         
-        # Properly truncate by tokens, not characters
-        encoding = cls.get_encoding()
-        tokens = encoding.encode(text)
-        if len(tokens) > 8191:
-            tokens = tokens[:8191]
-            text = encoding.decode(tokens)
-        
-        client = cls.get_client()
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
+        now = timezone.now()
+        stored = QueryEmbedding.objects.filter(key=key, created_at__gte=now - QUERY_EMBEDDING_TTL).first()
+        if stored is not None:
+            embedding = [float(value) for value in stored.embedding]
+        else:
+            embedding = cls.generate_embedding(query)
+            if embedding is None:
+                return None
+            QueryEmbedding.objects.update_or_create(
+                key=key, defaults={'model': model, 'query': query, 'embedding': embedding, 'created_at': now},
+            )
+            QueryEmbedding.objects.filter(created_at__lt=now - QUERY_EMBEDDING_TTL).delete()
+        QUERY_EMBEDDINGS.put(key, embedding)
+        return embedding
     
     @classmethod
-    def generate_embeddings_batch(cls, texts):
-        """Generate embeddings for multiple texts in a single API call"""
+    def generate_embeddings_batch(cls, texts, prepared=None):
+        """
+        Embeddings for multiple texts (None for blank texts). Each distinct normalized text is taken
+        from the TextEmbedding store if it was embedded before, else embedded in token-budgeted
+        backend calls, once however often it repeats, and stored. prepared is the backend's
+        prepare(texts), when the caller has already tokenized them.
+        """
         if not texts:
             return []
-        
-        # Truncate each text properly
-        encoding = cls.get_encoding()
-        processed_texts = []
-        for text in texts:
-            if not text or not text.strip():
-                processed_texts.append("")
-            else:
-                tokens = encoding.encode(text)
-                if len(tokens) > 8191:
-                    tokens = tokens[:8191]
-                    text = encoding.decode(tokens)
-                processed_texts.append(text)
-        
-        client = cls.get_client()
-        response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=processed_texts
-        )
-        return [item.embedding for item in response.data]
+        backend = get_backend()
+        keys = [text_embedding_key(backend.model, text) if text and text.strip() else None for text in texts]
+        embeddings = {
+            key: [float(value) for value in embedding]
+            for key, embedding in TextEmbedding.objects.filter(key__in={key for key in keys if key}).values_list('key', 'embedding')
+        }
+        missing = {}  # key -> index of the first text with it
+        for index, key in enumerate(keys):
+            if key and key not in embeddings:
+                missing.setdefault(key, index)
+        if missing:
+            indexes = list(missing.values())
+            generated = dict(zip(missing, backend.encode(
+                [texts[index] for index in indexes], [prepared[index] for index in indexes] if prepared else None,
+            )))
+            TextEmbedding.objects.bulk_create(
+                [TextEmbedding(key=key, model=backend.model, embedding=embedding) for key, embedding in generated.items()],
+                ignore_conflicts=True,  # another worker stored the same text meanwhile
+            )
+            embeddings.update(generated)
+        backend.count_reused(sum(1 for key in keys if key) - len(missing))
+        return [embeddings[key] if key else None for key in keys]
+
+
+FETCH_STATUS_CHOICES = [
+    ('ok', 'OK'),
+    ('backoff', 'Backing off'),
+    ('open', 'Circuit open'),
+]
+
+# Postgres text search configurations a channel's posts can be indexed with. 'simple' only
+# lowercases words, so it suits any language without a stemmer (e.g. Hebrew).
+SEARCH_CONFIG_CHOICES = [
+    ('simple', 'Any language (no stemming)'),
+    ('arabic', 'Arabic'),
+    ('english', 'English'),
+    ('french', 'French'),
+    ('german', 'German'),
+    ('russian', 'Russian'),
+    ('spanish', 'Spanish'),
+]
 
 
 class Channel(models.Model):
@@ -73,11 +172,225 @@ class Channel(models.Model):
     title = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Fetcher high-water mark: newest telegram_id seen, and when the channel was last synced /
+    # fully re-scanned over the DAYS_BACK window / had its views, forwards and replies refreshed.
+    last_seen_telegram_id = models.IntegerField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_full_scan_at = models.DateTimeField(null=True, blank=True)
+    last_metrics_refresh_at = models.DateTimeField(null=True, blank=True)
+    # Resolved Telegram peer, reused as InputPeerChannel so the fetcher skips ResolveUsername.
+    telegram_peer_id = models.BigIntegerField(null=True, blank=True)
+    telegram_access_hash = models.BigIntegerField(null=True, blank=True)
+    # Fetch worker currently holding this channel (videos/leasing.py); free once lease_expires_at passes.
+    leased_by = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    # Fetch failure tracking (videos/circuit.py): polls are skipped until fetch_blocked_until.
+    fetch_status = models.CharField(max_length=10, choices=FETCH_STATUS_CHOICES, default='ok')
+    fetch_failures = models.PositiveIntegerField(default=0)  # consecutive
+    last_fetch_error = models.TextField(blank=True, default='')
+    last_fetch_error_at = models.DateTimeField(null=True, blank=True)
+    fetch_blocked_until = models.DateTimeField(null=True, blank=True)
+    # History backfill (fetcher sub-mode): pending while requested and not completed; resumes
+    # below backfill_oldest_telegram_id, the lowest telegram_id written so far.
+    backfill_requested_at = models.DateTimeField(null=True, blank=True)
+    backfill_oldest_telegram_id = models.IntegerField(null=True, blank=True)
+    backfill_completed_at = models.DateTimeField(null=True, blank=True)
+    # Language of the channel's posts for keyword search; changing it re-indexes them (DB trigger).
+    search_config = models.CharField(max_length=20, choices=SEARCH_CONFIG_CHOICES, default='simple')
 
     def __str__(self):
         return self.username
 
 
+class FetchWorker(models.Model):
+    """Heartbeat of a running fetch worker; live workers split channels evenly between them."""
+    worker_id = models.CharField(max_length=100, unique=True)
+    heartbeat_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.worker_id
+
+
+class FetchJob(models.Model):
+    """One-off fetch of a channel, run by the first fetch worker to claim it (videos/jobs.py)."""
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='fetch_jobs')
+    priority = models.IntegerField(default=0)  # higher runs first
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['-priority', 'created_at'], name='fetchjob_queue_idx')]
+
+    def __str__(self):
+        return f"{self.channel} (priority {self.priority})"
+
+
+_pgvector_version = None
+
+
+def pgvector_version(cursor) -> tuple[int, ...]:
+    global _pgvector_version
+    if _pgvector_version is None:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+        _pgvector_version = tuple(int(part) for part in row[0].split('.')) if row else ()
+    return _pgvector_version
+
+
+def configure_vector_search(cursor, limit: int):
+    """SET LOCAL the HNSW query settings for a search returning up to limit rows; needs a transaction."""
+    ef_search = min(max(HNSW_EF_SEARCH, limit), HNSW_EF_SEARCH_MAX)
+    cursor.execute('SELECT set_config(%s, %s, true)', ['hnsw.ef_search', str(ef_search)])
+    if HNSW_ITERATIVE_SCAN != 'off' and pgvector_version(cursor) >= (0, 8, 0):
+        cursor.execute('SELECT set_config(%s, %s, true)', ['hnsw.iterative_scan', HNSW_ITERATIVE_SCAN])
+        cursor.execute('SELECT set_config(%s, %s, true)', ['hnsw.max_scan_tuples', str(HNSW_MAX_SCAN_TUPLES)])
+
+
+class RankingJoin:
+    """
+    INNER JOIN of a subquery returning (id, score) rows onto the posts, as an entry of
+    Query.alias_map (the interface of django.db.models.sql.datastructures.Join).
+    """
+    join_type = INNER
+    nullable = False
+    filtered_relation = None
+
+    def __init__(self, sql, params, parent_alias, table_alias='ranking'):
+        self.sql = sql
+        self.params = params
+        self.parent_alias = parent_alias
+        self.table_name = self.table_alias = table_alias
+
+    def as_sql(self, compiler, connection):
+        qn = compiler.quote_name_unless_alias
+        return f"{self.join_type} ({self.sql}) {qn(self.table_alias)} ON ({qn(self.table_alias)}.id = {qn(self.parent_alias)}.id)", self.params
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            self.sql, self.params, change_map.get(self.parent_alias, self.parent_alias),
+            change_map.get(self.table_alias, self.table_alias),
+        )
+
+
+class VectorSearchQuerySet(models.QuerySet):
+    """
+    QuerySet whose SQL runs an HNSW scan for up to search_limit rows (Post.semantic_search and
+    hybrid_search). Each query it runs, such as a paginator's count and page, does so in a
+    transaction with configure_vector_search.
+    """
+    search_limit = None
+
+    def vector_search(self, limit):
+        clone = self._chain()
+        clone.search_limit = limit
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.search_limit = self.search_limit
+        return clone
+
+    def ranked_by(self, sql, params):
+        """Only the posts among the (id, score) rows of sql, best score first, annotated with it as rank."""
+        clone = self._chain()
+        alias = clone.query.join(RankingJoin(sql, params, clone.query.get_initial_alias()))
+        return clone.annotate(rank=RawSQL(f'{alias}.score', ())).order_by('-rank', '-id')
+
+    @contextmanager
+    def vector_search_settings(self):
+        if self.search_limit is None:
+            yield
+            return
+        with transaction.atomic(using=self.db), connections[self.db].cursor() as cursor:
+            configure_vector_search(cursor, self.search_limit)
+            yield
+
+    def _fetch_all(self):
+        if self._result_cache is not None:
+            return super()._fetch_all()
+        with self.vector_search_settings():
+            super()._fetch_all()
+
+    def count(self):
+        with self.vector_search_settings():
+            return super().count()
+
+    def exists(self):
+        with self.vector_search_settings():
+            return super().exists()
+
+
+class EmbeddingCheckpoint(models.Model):
+    """Progress of an interruptible generate_embeddings run: every post up to last_post_id is done."""
+    name = models.CharField(max_length=200, unique=True)  # run mode + embedding model
+    last_post_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} (up to post {self.last_post_id})"
+
+
+class TextEmbedding(models.Model):
+    """
+    Content-addressed post embeddings: reposts, album captions and texts edited back to an earlier
+    version share one row and are embedded once per model (EmbeddingGenerator.generate_embeddings_batch).
+    """
+    key = models.CharField(max_length=64, unique=True)  # text_embedding_key
+    model = models.CharField(max_length=100)
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model} {self.key[:12]}"
+
+
+class EmbeddingJob(models.Model):
+    """
+    A post whose text changed since it was embedded. Queued by a trigger on videos_post for
+    every writer while EmbeddingQueueState is enabled, one row per post however often it is
+    edited, and drained by videos/embedding_queue.py.
+    """
+    post = models.OneToOneField('Post', on_delete=models.CASCADE, related_name='embedding_job')
+    queued_at = models.DateTimeField(default=timezone.now)  # moved forward by every later edit
+    claimed_by = models.CharField(max_length=100, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # Failures of this post on its own; after EMBED_QUEUE_MAX_ATTEMPTS it is parked until its next edit.
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    parked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['queued_at'], name='embeddingjob_queue_idx')]
+
+    def __str__(self):
+        return f"post {self.post_id} (queued {self.queued_at:%Y-%m-%d %H:%M:%S})"
+
+
+class EmbeddingQueueState(models.Model):
+    """
+    Whether posts are queued for embedding as they are written (a single row). The queue trigger
+    skips every write while it is off, which it is until an embedding worker starts.
+    """
+    enabled = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"embed on ingest {'on' if self.enabled else 'off'} since {self.changed_at:%Y-%m-%d %H:%M:%S}"
+
+
+class QueryEmbedding(models.Model):
+    """Persistent tier of the search query embedding cache (EmbeddingGenerator.generate_query_embedding)."""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of model + normalized query
+    model = models.CharField(max_length=100)
+    query = models.TextField()
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.query
+
+
 class Post(models.Model):
     channel = models.ForeignKey(Channel, on_delete=models.CASCADE)
     telegram_id = models.IntegerField()
@@ -92,11 +405,24 @@ class Post(models.Model):
     video_data = models.JSONField(null=True, blank=True)
     when_added = models.DateTimeField(auto_now_add=True)
     when_updated = models.DateTimeField(null=True, blank=True)
-    embedding = VectorField(dimensions=1536, null=True, blank=True)
+    embedding = VectorField(dimensions=EMBEDDING_DIMENSIONS, null=True, blank=True)
+    # text_embedding_key of the model and text embedding was made from; a match means it is current.
+    embedding_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # to_tsvector(channel.search_config, text), maintained by a DB trigger on every write (migration 0011).
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         unique_together = [['channel', 'telegram_id']]
         ordering = ['-date']
+        indexes = [
+            HnswIndex(
+                name='post_embedding_hnsw_idx', fields=['embedding'], m=16, ef_construction=64,
+                opclasses=['vector_cosine_ops'],
+            ),
+            GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+            # icontains compiles to UPPER(text) LIKE UPPER('%q%')
+            GinIndex(OpClass(Upper('text'), name='gin_trgm_ops'), name='post_text_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.channel.username} - {self.telegram_id}"
@@ -109,6 +435,27 @@ class Post(models.Model):
         """Same as sort -viral: forwards ÷ (views + 1)."""
         return float(self.forwards) / (float(self.views) + 1.0)
 
+    @classmethod
+    def keyword_query(cls, query_text):
+        """websearch_to_tsquery of query_text in every search config in use, OR-ed into one indexable tsquery."""
+        configs = sorted(set(Channel.objects.values_list('search_config', flat=True))) or ['simple']
+        return reduce(operator.or_, (SearchQuery(query_text, config=config, search_type='websearch') for config in configs))
+    
+    @classmethod
+    def keyword_search(cls, query_text, filters=None):
+        """
+        Full-text keyword search, plus substring matches for queries of TRIGRAM_MIN_LENGTH+ characters.
+        Returns a QuerySet annotated with rank (ts_rank; 0 for substring-only matches).
+        """
+        query = cls.keyword_query(query_text)
+        condition = Q(search_vector=query)
+        if len(query_text) >= TRIGRAM_MIN_LENGTH:
+            condition |= Q(text__icontains=query_text)
+        queryset = cls.objects.filter(condition)
+        if filters:
+            queryset = queryset.filter(filters)
+        return queryset.annotate(rank=SearchRank(F('search_vector'), query))
+    
     @classmethod
     def semantic_search(cls, query_text, limit=10, filters=None):
         """
@@ -120,59 +467,66 @@ class Post(models.Model):
             filters: Optional Q object for additional filtering
         
         Returns:
-            QuerySet of Posts ordered by similarity
+            QuerySet of Posts ordered by similarity, annotated with rank (cosine similarity)
         """
-        query_embedding = EmbeddingGenerator.generate_embedding(query_text)
+        query_embedding = EmbeddingGenerator.generate_query_embedding(query_text)
         if not query_embedding:
             return cls.objects.none()
         
-        queryset = cls.objects.filter(embedding__isnull=False)
+        candidates = cls.objects.filter(embedding__isnull=False)
         if filters:
-            queryset = queryset.filter(filters)
-        
-        queryset = queryset.order_by(
+            candidates = candidates.filter(filters)
+        candidates = candidates.order_by(
             RawSQL('embedding <=> %s::vector', (str(query_embedding),))
-        )[:limit]
+        ).values('id')[:limit]
         
-        return queryset
+        # The nearest-neighbour scan is a subquery of every query the result runs, so pages
+        # re-run it (with its HNSW settings) rather than carry the ids as parameters.
+        return VectorSearchQuerySet(cls).vector_search(limit).filter(id__in=candidates).annotate(
+            rank=RawSQL('1 - (embedding <=> %s::vector)', (str(query_embedding),))
+        ).order_by('-rank', '-id')
     
     @classmethod
-    def hybrid_search(cls, query_text, keyword_filters=None, limit=10):
+    def hybrid_search(cls, query_text, filters=None, limit=10, semantic_weight=None, keyword_weight=None):
         """
-        Combine keyword search (traditional) with semantic search.
-        Returns a queryset-like list prioritizing semantic results.
+        Keyword and semantic search fused in the database with reciprocal rank fusion.
         
-        Learning: This shows how to blend old and new approaches.
+        The top limit candidates of each ranking are combined in SQL, and the limit
+        best-scoring posts are returned as a QuerySet in score order, annotated with
+        rank (the fused score). Weights default to HYBRID_*_WEIGHT.
         """
+        semantic_weight = HYBRID_SEMANTIC_WEIGHT if semantic_weight is None else semantic_weight
+        keyword_weight = HYBRID_KEYWORD_WEIGHT if keyword_weight is None else keyword_weight
         
-        # Get semantic results (highest priority)
-        semantic_results = list(cls.semantic_search(query_text, limit=limit*2))
-        
-        # Get keyword results
-        if keyword_filters:
-            keyword_results = list(cls.objects.filter(keyword_filters).distinct()[:limit*2])
+        keyword = cls.keyword_search(query_text, filters).order_by('-rank', '-date').values('id', 'rank', 'date')[:limit]
+        keyword_sql, keyword_params = keyword.query.sql_with_params()
+        query_embedding = EmbeddingGenerator.generate_query_embedding(query_text)
+        if query_embedding:
+            semantic = cls.objects.filter(embedding__isnull=False)
+            if filters:
+                semantic = semantic.filter(filters)
+            semantic = semantic.annotate(
+                distance=RawSQL('embedding <=> %s::vector', (str(query_embedding),))
+            ).order_by('distance').values('id', 'distance')[:limit]
+            semantic_sql, semantic_params = semantic.query.sql_with_params()
         else:
-            keyword_results = []
-        
-        # Combine: prioritize semantic, then add keyword results not in semantic
-        combined_ids = set()
-        combined = []
-        
-        # Add semantic results first
-        for post in semantic_results:
-            combined_ids.add(post.id)
-            combined.append(post)
+            semantic_sql, semantic_params = 'SELECT NULL::bigint AS id, NULL::float8 AS distance WHERE false', ()
         
-        # Add keyword results that aren't already in semantic results
-        for post in keyword_results:
-            if post.id not in combined_ids:
-                combined.append(post)
-                combined_ids.add(post.id)
-        
-        # Return as queryset by getting IDs and doing a single query
-        if not combined:
-            return cls.objects.none()
-        
-        post_ids = [p.id for p in combined[:limit*3]]  # Get more for filtering
-        return cls.objects.filter(id__in=post_ids)
-
+        sql = f"""
+            WITH semantic AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS position FROM ({semantic_sql}) candidates
+            ), keyword AS (
+                SELECT id, row_number() OVER (ORDER BY rank DESC, date DESC) AS position FROM ({keyword_sql}) candidates
+            )
+            SELECT id, COALESCE(%s::float8 / (%s + semantic.position), 0) + COALESCE(%s::float8 / (%s + keyword.position), 0) AS score
+            FROM semantic FULL OUTER JOIN keyword USING (id)
+            ORDER BY score DESC, id DESC
+            LIMIT %s
+        """
+        params = (
+            *semantic_params, *keyword_params,
+            semantic_weight, HYBRID_RRF_K, keyword_weight, HYBRID_RRF_K, limit,
+        )
+        # Every query the result runs, such as a paginator's count and page, joins the fused
+        # rankings once instead of carrying the ids and scores as parameters.
+        return VectorSearchQuerySet(cls).vector_search(limit).ranked_by(sql, params)
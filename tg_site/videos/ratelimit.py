@@ -0,0 +1,225 @@
+"""
+Adaptive rate limiting for embedding API requests.
+
+Every OpenAI embeddings request of a process goes through its backend's
+EmbeddingRateLimiter:
+- token buckets on requests and tokens per minute (EMBEDDING_RPM / EMBEDDING_TPM),
+  re-synced from the provider's x-ratelimit-* response headers. Those count usage of
+  the whole organisation, so several processes sharing one quota stay in step;
+- AIMD concurrency: every success adds 1/limit to the allowed in-flight requests, a
+  throttled request halves it (once per wave of requests started before the cut);
+- typed retries: 429s pause every thread until retry-after / the limit reset,
+  timeouts, connection errors and 5xx back off exponentially with jitter, and
+  anything else (bad request, auth, exhausted quota) fails at once.
+"""
+import os
+import random
+import re
+import threading
+import time
+
+import openai
+
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', '3000'))  # requests per minute
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', '1000000'))  # input tokens per minute
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '8'))  # in-flight requests per process
+MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '6'))
+RETRY_BASE = 1.0  # seconds before the first retry of a transient error, doubled on each further one
+RETRY_MAX = 60.0  # seconds
+
+THROTTLED, TRANSIENT, FATAL = 'throttled', 'transient', 'fatal'
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_SECONDS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value: str | None) -> float | None:
+    """Seconds in a rate limit reset header such as '20ms', '1s' or '6m0s'."""
+    if not value:
+        return None
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(number) * DURATION_SECONDS[unit] for number, unit in parts)
+
+
+def header_number(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, openai.RateLimitError):
+        # 429 also means a spent quota or billing limit, which waiting does not fix.
+        return FATAL if getattr(error, 'code', None) == 'insufficient_quota' else THROTTLED
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):  # includes timeouts
+        return TRANSIENT
+    if isinstance(error, openai.APIStatusError) and error.status_code in (408, 409):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_delay(error: Exception, kind: str, attempt: int) -> float:
+    """Seconds to wait before retry number attempt + 1."""
+    response = getattr(error, 'response', None)
+    headers = response.headers if response is not None else {}
+    if kind == THROTTLED:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        hinted = [
+            parse_duration(headers.get(name))
+            for name in ('retry-after', 'x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')
+        ]
+        hinted = [seconds for seconds in hinted if seconds is not None]
+        if hinted:
+            return max(hinted)
+    return min(RETRY_BASE * 2 ** attempt, RETRY_MAX) * random.uniform(0.5, 1.0)
+
+
+class RateBucket:
+    """Token bucket holding up to per_minute units, refilled continuously. Not locked; see EmbeddingRateLimiter."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.level = float(per_minute)
+        self.refilled_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.per_minute, self.level + (now - self.refilled_at) * self.per_minute / 60)
+        self.refilled_at = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken; more than a full bucket only waits for a full one."""
+        self.refill(now)
+        needed = min(amount, self.per_minute)
+        return 0.0 if self.level >= needed else (needed - self.level) * 60 / self.per_minute
+
+    def take(self, amount: float):
+        self.level -= amount  # may go negative: the debt delays later requests
+
+    def sync(self, limit: float | None, remaining: float | None, now: float):
+        """Adopt the provider's view: its limit, and no more than what it says remains."""
+        self.refill(now)
+        if limit:
+            self.per_minute = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class AIMDLimit:
+    """Concurrency limit with additive increase on success and multiplicative decrease on throttling."""
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.decreased_at = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to pass to release()."""
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started_at: float, throttled: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                # Requests started before the last cut were sent at the old rate; count them once.
+                if started_at >= self.decreased_at:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.decreased_at = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class EmbeddingRateLimiter:
+    """Shared by all threads of a process; see the module docstring."""
+
+    def __init__(self, requests_per_minute: int = EMBEDDING_RPM, tokens_per_minute: int = EMBEDDING_TPM,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY, max_retries: int = MAX_RETRIES):
+        self.requests = RateBucket(requests_per_minute)
+        self.tokens = RateBucket(tokens_per_minute)
+        self.concurrency = AIMDLimit(max_concurrency)
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.retried = 0
+
+    def reserve(self, tokens: int):
+        """Block until the buckets allow one request of tokens, then take them."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(
+                    self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now), self.paused_until - now,
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+            time.sleep(wait)
+
+    def settle(self, estimated_tokens: int, used_tokens: int | None, headers):
+        """Correct the token bucket by the request's real usage and re-sync with the provider's counters."""
+        with self.lock:
+            now = time.monotonic()
+            if used_tokens is not None:
+                self.tokens.take(used_tokens - estimated_tokens)
+            if headers:
+                for bucket, kind in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+                    bucket.sync(
+                        header_number(headers.get(f'x-ratelimit-limit-{kind}')),
+                        header_number(headers.get(f'x-ratelimit-remaining-{kind}')),
+                        now,
+                    )
+
+    def call(self, request, estimated_tokens: int):
+        """
+        Run request() -> (result, headers, used_tokens) within the limits, retrying by error type.
+        estimated_tokens must not undercount, or the bucket lets too much through before settling.
+        """
+        attempt = 0
+        while True:
+            self.reserve(estimated_tokens)
+            started_at = self.concurrency.acquire()
+            try:
+                result, headers, used_tokens = request()
+            except Exception as error:
+                kind = classify_error(error)
+                self.concurrency.release(started_at, throttled=kind == THROTTLED)
+                self.settle(estimated_tokens, 0, None)  # nothing was embedded
+                if kind == THROTTLED:
+                    with self.lock:
+                        self.throttled += 1
+                if kind == FATAL or attempt >= self.max_retries:
+                    raise
+                delay = retry_delay(error, kind, attempt)
+                with self.lock:
+                    self.retried += 1
+                    if kind == THROTTLED:
+                        # Everyone waits out a 429; otherwise the other threads keep hitting it.
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                if kind == TRANSIENT:
+                    time.sleep(delay)
+                attempt += 1
+                continue
+            self.concurrency.release(started_at)
+            self.settle(estimated_tokens, used_tokens, headers)
+            return result
+
+    def describe(self) -> str:
+        return (
+            f"concurrency {self.concurrency.limit:.1f}/{self.concurrency.maximum}, "
+            f"{self.throttled} throttled, {self.retried} retried"
+        )
@@ -0,0 +1,242 @@
+"""
+Adaptive per-channel polling schedule for the fetcher (videos/fetcher.py).
+
+Each channel sits in a priority queue keyed by its next due time. After a poll the
+interval is re-derived from how often the channel posts and how fast views are
+growing on its recent posts, clamped to [MIN_POLL_INTERVAL, MAX_POLL_INTERVAL]; channels whose new posts arrive as
+update events are only polled to refresh views, until no event has come for LIVE_IDLE_TIMEOUT. Telegram calls across all channels
+share one RequestBudget. Channels blocked by their circuit breaker (videos/circuit.py)
+stay queued until the block ends.
+"""
+import asyncio
+import heapq
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Count, Max, Min, Sum
+
+from .circuit import blocked_seconds
+from .models import Channel, Post
+
+MIN_POLL_INTERVAL = int(os.getenv('MIN_POLL_INTERVAL', '60'))  # seconds
+MAX_POLL_INTERVAL = int(os.getenv('MAX_POLL_INTERVAL', '3600'))  # seconds
+MIN_METRICS_REFRESH_INTERVAL = int(os.getenv('MIN_METRICS_REFRESH_INTERVAL', '300'))  # fastest views refresh per channel
+REQUEST_BUDGET_PER_MINUTE = int(os.getenv('REQUEST_BUDGET_PER_MINUTE', '120'))  # Telegram calls, all channels
+ACTIVITY_WINDOW = timedelta(hours=48)  # recent posts used to measure posting rate and views growth
+NEW_POSTS_PER_POLL = 1.0  # poll about once per expected new post
+VIEWS_GROWTH_PER_POLL = 0.05  # refresh views once they have likely grown by 5%
+# A live channel without update events for this long is polled for new posts again: the session
+# may have left it, or Telegram stopped pushing its updates.
+LIVE_IDLE_TIMEOUT = 6 * 3600  # seconds
+
+
+class RequestBudget:
+    """Token bucket shared by every Telegram call: at most per_minute calls per rolling minute."""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.refilled_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self.refilled_at) * self.per_minute / 60)
+        self.refilled_at = now
+
+    async def acquire(self, reserve: float = 0):
+        """
+        Take one token. Low-priority callers pass reserve, the share of the bucket they must
+        leave untouched, so they only use capacity the channel polls are not using.
+        """
+        needed = 1 + reserve * self.per_minute
+        while True:
+            self.refill()
+            if self.tokens >= needed:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((needed - self.tokens) * 60 / self.per_minute)
+
+
+@dataclass
+class ViewsSample:
+    """Summed views over a fixed range of telegram_ids, so later samples compare the same posts."""
+    first_telegram_id: int
+    last_telegram_id: int
+    views: int
+    taken_at: datetime
+
+
+@dataclass
+class ChannelActivity:
+    posts_per_hour: float
+    views_growth_per_hour: float | None  # relative growth; None when this poll gave no new evidence
+    views_sample: ViewsSample | None
+
+
+def measure_channel_activity(channel: Channel, previous_sample: ViewsSample | None, now: datetime) -> ChannelActivity:
+    """Two small aggregates on (channel_id, telegram_id) / date. Runs on the DB pool."""
+    recent = Post.objects.filter(channel=channel, date__gte=now - ACTIVITY_WINDOW).aggregate(
+        count=Count('id'), first=Min('telegram_id'), last=Max('telegram_id'), views=Sum('views'),
+    )
+    posts_per_hour = recent['count'] / (ACTIVITY_WINDOW.total_seconds() / 3600)
+    current_sample = None
+    if recent['count']:
+        current_sample = ViewsSample(recent['first'], recent['last'], recent['views'] or 0, now)
+    if previous_sample is None:
+        return ChannelActivity(posts_per_hour, None, current_sample)
+
+    views_now = Post.objects.filter(
+        channel=channel,
+        telegram_id__gte=previous_sample.first_telegram_id,
+        telegram_id__lte=previous_sample.last_telegram_id,
+    ).aggregate(views=Sum('views'))['views'] or 0
+    views_gained = views_now - previous_sample.views
+    elapsed = (now - previous_sample.taken_at).total_seconds()
+    # Views only move when a metrics refresh or full scan updated them; until then keep the old sample so the
+    # growth is measured over the whole span since the last refresh.
+    if views_gained <= 0 and elapsed < MAX_POLL_INTERVAL:
+        return ChannelActivity(posts_per_hour, None, previous_sample)
+    views_growth_per_hour = max(0, views_gained) / max(previous_sample.views, 1) / (elapsed / 3600)
+    return ChannelActivity(posts_per_hour, views_growth_per_hour, current_sample)
+
+
+def views_refresh_interval(views_growth_per_hour: float, metrics_refresh_interval: int) -> float:
+    """How often to refresh view counts over the window, in seconds."""
+    if views_growth_per_hour <= 0:
+        return metrics_refresh_interval
+    interval = 3600 * VIEWS_GROWTH_PER_POLL / views_growth_per_hour
+    return min(max(interval, MIN_METRICS_REFRESH_INTERVAL), metrics_refresh_interval)
+
+
+def next_poll_interval(posts_per_hour: float, refresh_interval: float, live: bool = False) -> float:
+    """
+    Seconds until the next poll: frequent posters and fast-moving views come back sooner.
+    Channels whose new posts arrive as update events (live) are only polled to refresh views.
+    """
+    if live:
+        interval = refresh_interval
+    elif posts_per_hour <= 0:
+        return MAX_POLL_INTERVAL  # nothing posted within ACTIVITY_WINDOW
+    else:
+        interval = min(refresh_interval, 3600 * NEW_POSTS_PER_POLL / posts_per_hour)
+    return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+@dataclass
+class ChannelState:
+    channel: Channel
+    metrics_refresh_interval: int
+    due_at: float = 0.0  # time.monotonic()
+    interval: float = MIN_POLL_INTERVAL
+    posts_per_hour: float = 0.0
+    views_growth_per_hour: float = 0.0
+    views_sample: ViewsSample | None = None
+    live: bool = False  # an update event arrived within LIVE_IDLE_TIMEOUT, so new posts are pushed
+    event_at: float = 0.0  # time.monotonic() of the last update event
+
+
+@dataclass
+class ChannelScheduler:
+    metrics_refresh_interval: int
+    states: dict[int, ChannelState] = field(default_factory=dict)
+    queue: list[tuple[float, int]] = field(default_factory=list)  # (due_at, channel_id) heap
+    in_flight: set[int] = field(default_factory=set)
+    peers: dict[int, int] = field(default_factory=dict)  # telegram_peer_id -> channel_id, for update events
+
+    def sync(self, channels: list[Channel], now: float):
+        """Add channels new in the DB (due immediately), drop deleted ones, refresh the rest."""
+        current_ids = {channel.pk for channel in channels}
+        for channel_id in set(self.states) - current_ids:
+            del self.states[channel_id]
+        self.peers = {}
+        for channel in channels:
+            self.index_peer(channel)
+            state = self.states.get(channel.pk)
+            if state is None:
+                self.add(channel, now)
+            elif channel.pk not in self.in_flight:
+                if state.channel.fetch_blocked_until and not channel.fetch_blocked_until:
+                    # Unblocked by hand (admin "Retry now"): poll without waiting out the old block.
+                    state.due_at = now
+                    heapq.heappush(self.queue, (now, channel.pk))
+                state.channel = channel
+
+    def add(self, channel: Channel, now: float) -> ChannelState:
+        """Queue a channel, due now unless its circuit breaker blocks it."""
+        due_at = now + blocked_seconds(channel, datetime.now(timezone.utc))
+        state = self.states[channel.pk] = ChannelState(channel, self.metrics_refresh_interval, due_at=due_at)
+        heapq.heappush(self.queue, (due_at, channel.pk))
+        self.index_peer(channel)
+        return state
+
+    def start(self, state: ChannelState) -> bool:
+        """Claim a channel for an immediate poll outside pop_due; False when it is already being polled."""
+        if state.channel.pk in self.in_flight:
+            return False
+        self.in_flight.add(state.channel.pk)
+        return True
+
+    def index_peer(self, channel: Channel):
+        if channel.telegram_peer_id is not None:
+            self.peers[channel.telegram_peer_id] = channel.pk
+
+    def state_for_peer(self, peer_id: int) -> ChannelState | None:
+        state = self.states.get(self.peers.get(peer_id))
+        # A poll may have re-resolved the peer since it was indexed.
+        return state if state is not None and state.channel.telegram_peer_id == peer_id else None
+
+    def mark_live(self, state: ChannelState, now: float):
+        """An update event arrived for the channel: its new posts are pushed."""
+        state.live = True
+        state.event_at = now
+
+    def pop_due(self, now: float, limit: int) -> list[ChannelState]:
+        due = []
+        while self.queue and len(due) < limit and self.queue[0][0] <= now:
+            due_at, channel_id = heapq.heappop(self.queue)
+            state = self.states.get(channel_id)
+            # Skip entries for deleted channels or superseded by a reschedule
+            if state is None or state.due_at != due_at or channel_id in self.in_flight:
+                continue
+            self.in_flight.add(channel_id)
+            due.append(state)
+        return due
+
+    def reschedule(self, state: ChannelState, activity: ChannelActivity | None, now: float):
+        self.in_flight.discard(state.channel.pk)
+        self.index_peer(state.channel)  # a first poll resolves the peer
+        if state.live and now - state.event_at > LIVE_IDLE_TIMEOUT:
+            state.live = False
+        if activity is not None:
+            state.posts_per_hour = activity.posts_per_hour
+            if activity.views_growth_per_hour is not None:
+                state.views_growth_per_hour = activity.views_growth_per_hour
+            state.views_sample = activity.views_sample
+        state.metrics_refresh_interval = views_refresh_interval(state.views_growth_per_hour, self.metrics_refresh_interval)
+        state.interval = max(
+            next_poll_interval(state.posts_per_hour, state.metrics_refresh_interval, state.live),
+            blocked_seconds(state.channel, datetime.now(timezone.utc)),
+        )
+        state.due_at = now + state.interval
+        if state.channel.pk in self.states:
+            heapq.heappush(self.queue, (state.due_at, state.channel.pk))
+
+    def describe(self, now: float, budget: RequestBudget, top: int = 5) -> str:
+        waiting = sorted(
+            (state for channel_id, state in self.states.items() if channel_id not in self.in_flight),
+            key=lambda state: state.due_at,
+        )
+        overdue = sum(1 for state in waiting if state.due_at <= now)
+        budget.refill()
+        upcoming = ', '.join(
+            f"{state.channel.username} in {max(0, state.due_at - now):.0f}s (every {state.interval:.0f}s)"
+            for state in waiting[:top]
+        )
+        return (
+            f"🗓️  Queue: {len(self.states)} channels | in flight {len(self.in_flight)} | overdue {overdue} | "
+            f"live {sum(1 for state in self.states.values() if state.live)} | "
+            f"failing {sum(1 for state in self.states.values() if state.channel.fetch_status != 'ok')} | "
+            f"budget {budget.tokens:.0f}/{budget.per_minute} req/min | next: {upcoming or '-'}"
+        )
@@ -0,0 +1,225 @@
+"""
+Offline stand-in for Telethon's TelegramClient, serving fixture messages.
+
+FakeTelegramClient implements the subset of the async client API used by
+videos/fetcher.py, backed by in-memory channels of real Telethon Message objects.
+Channels come from synthetic_channel() or from recorded JSON fixtures
+(message_to_fixture / load_fixture_file), and simulate_activity() applies new posts,
+edits and view growth between fetch cycles. Used by the bench_ingest command and tests.
+"""
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from telethon.tl.functions.messages import GetMessagesViewsRequest
+from telethon.tl.types import (
+    Document, DocumentAttributeVideo, InputPeerChannel, Message, MessageMediaDocument,
+    MessageMediaPhoto, MessageReplies, MessageViews, PeerChannel, Photo, messages,
+)
+
+ALBUM_SIZE_RANGE = (2, 6)
+
+
+def make_media(kind: str | None, size: int = 0, duration: float = 0.0):
+    now = datetime.now(timezone.utc)
+    if kind == 'video':
+        attributes = [DocumentAttributeVideo(duration=duration, w=1280, h=720)]
+        document = Document(
+            id=random.getrandbits(62), access_hash=0, file_reference=b'', date=now,
+            mime_type='video/mp4', size=size, dc_id=2, attributes=attributes,
+        )
+        return MessageMediaDocument(document=document)
+    if kind == 'photo':
+        return MessageMediaPhoto(photo=Photo(
+            id=random.getrandbits(62), access_hash=0, file_reference=b'', date=now, sizes=[], dc_id=2,
+        ))
+    return None
+
+
+def make_message(peer_id: int, telegram_id: int, date: datetime, text: str, *, views: int = 0,
+                 forwards: int = 0, replies: int = 0, grouped_id: int | None = None,
+                 media_kind: str | None = None, size: int = 0, duration: float = 0.0) -> Message:
+    msg = Message(
+        id=telegram_id,
+        peer_id=PeerChannel(peer_id),
+        date=date,
+        message=text,
+        views=views,
+        forwards=forwards,
+        replies=MessageReplies(replies=replies, replies_pts=0) if replies else None,
+        media=make_media(media_kind, size, duration),
+        grouped_id=grouped_id,
+        post=True,
+    )
+    msg.text = text  # without a client, Message.text is whatever was last assigned
+    return msg
+
+
+def media_kind_of(msg: Message) -> str | None:
+    if isinstance(msg.media, MessageMediaDocument):
+        return 'video'
+    if isinstance(msg.media, MessageMediaPhoto):
+        return 'photo'
+    return None
+
+
+def message_to_fixture(msg: Message) -> dict:
+    """JSON-able record of the fields the fetcher reads; use it to record live channels."""
+    document = getattr(msg.media, 'document', None)
+    return {
+        'id': msg.id,
+        'date': msg.date.isoformat(),
+        'text': msg.message or '',
+        'views': msg.views or 0,
+        'forwards': msg.forwards or 0,
+        'replies': msg.replies.replies if msg.replies else 0,
+        'grouped_id': msg.grouped_id,
+        'media': media_kind_of(msg),
+        'size': getattr(document, 'size', 0) or 0,
+    }
+
+
+def message_from_fixture(peer_id: int, record: dict) -> Message:
+    return make_message(
+        peer_id, record['id'], datetime.fromisoformat(record['date']), record['text'],
+        views=record['views'], forwards=record['forwards'], replies=record['replies'],
+        grouped_id=record['grouped_id'], media_kind=record['media'], size=record['size'],
+    )
+
+
+class FakeChannel:
+    """Messages of one channel, kept sorted newest first like Telegram returns them."""
+
+    def __init__(self, username: str, peer_id: int, messages: list[Message]):
+        self.username = username
+        self.peer_id = peer_id
+        self.access_hash = peer_id * 7919
+        self.messages = sorted(messages, key=lambda msg: msg.id, reverse=True)
+
+    def next_id(self) -> int:
+        return self.messages[0].id + 1 if self.messages else 1
+
+
+def synthetic_messages(peer_id: int, count: int, *, start_id: int = 1, newest: datetime | None = None,
+                       spacing: timedelta = timedelta(minutes=20), album_ratio: float = 0.15,
+                       photo_ratio: float = 0.3, seed: int = 0) -> list[Message]:
+    """count messages ending at newest: text posts, videos, photos and albums of mixed media."""
+    rng = random.Random(seed + peer_id)
+    newest = newest or datetime.now(timezone.utc)
+    messages = []
+    telegram_id = start_id
+    while len(messages) < count:
+        date = newest - spacing * (count - len(messages))
+        views = rng.randint(50, 50000)
+        text = f"Post {telegram_id} " + ' '.join(rng.choice(['news', 'video', 'update', 'clip', 'report']) for _ in range(rng.randint(0, 40)))
+        if rng.random() < album_ratio and count - len(messages) >= ALBUM_SIZE_RANGE[0]:
+            album_size = min(rng.randint(*ALBUM_SIZE_RANGE), count - len(messages))
+            grouped_id = peer_id * 10 ** 6 + telegram_id
+            for index in range(album_size):
+                kind = 'photo' if rng.random() < 0.5 else 'video'
+                messages.append(make_message(
+                    peer_id, telegram_id, date, text if index == 0 else '', views=views + rng.randint(0, 100),
+                    forwards=rng.randint(0, 200), grouped_id=grouped_id, media_kind=kind,
+                    size=rng.randint(10 ** 5, 10 ** 8), duration=rng.randint(5, 600),
+                ))
+                telegram_id += 1
+            continue
+        roll = rng.random()
+        kind = 'photo' if roll < photo_ratio else ('video' if roll < 0.8 else None)
+        messages.append(make_message(
+            peer_id, telegram_id, date, text, views=views, forwards=rng.randint(0, 200),
+            replies=rng.randint(0, 50), media_kind=kind, size=rng.randint(10 ** 5, 10 ** 8),
+            duration=rng.randint(5, 600),
+        ))
+        telegram_id += 1
+    return messages
+
+
+def synthetic_channel(username: str, peer_id: int, count: int, **kwargs) -> FakeChannel:
+    return FakeChannel(username, peer_id, synthetic_messages(peer_id, count, **kwargs))
+
+
+def load_fixture_file(path: str) -> list[FakeChannel]:
+    """Read {"username": [message_to_fixture records]} into fake channels."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    channels = []
+    for index, (username, records) in enumerate(sorted(data.items()), start=1):
+        peer_id = 10 ** 9 + index
+        channels.append(FakeChannel(username, peer_id, [message_from_fixture(peer_id, record) for record in records]))
+    return channels
+
+
+def simulate_activity(channel: FakeChannel, *, new_posts: int = 1, edits: int = 1, view_growth: float = 0.05,
+                      seed: int = 0):
+    """Advance a channel between cycles: grow views on recent posts, edit some texts, append new posts."""
+    rng = random.Random(seed + channel.peer_id)
+    for msg in channel.messages[:50]:
+        msg.views = int((msg.views or 0) * (1 + view_growth)) + 1
+    for msg in rng.sample(channel.messages, min(edits, len(channel.messages))):
+        msg.text = (msg.message or '') + ' (edited)'
+        msg.edit_date = datetime.now(timezone.utc)
+    channel.messages = sorted(
+        synthetic_messages(channel.peer_id, new_posts, start_id=channel.next_id(), spacing=timedelta(seconds=1), seed=seed)
+        + channel.messages,
+        key=lambda msg: msg.id, reverse=True,
+    )
+
+
+class FakeTelegramClient:
+    """Async TelegramClient look-alike over FakeChannel fixtures. Counts every request in calls."""
+
+    def __init__(self, channels: list[FakeChannel]):
+        self.channels_by_username = {channel.username: channel for channel in channels}
+        self.channels_by_peer_id = {channel.peer_id: channel for channel in channels}
+        self.calls: dict[str, int] = {}
+        self.event_handlers: list[tuple] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def count_call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def channel_for(self, entity) -> FakeChannel:
+        if isinstance(entity, InputPeerChannel):
+            return self.channels_by_peer_id[entity.channel_id]
+        return self.channels_by_username[entity]
+
+    async def get_input_entity(self, username: str) -> InputPeerChannel:
+        self.count_call('get_input_entity')
+        if username not in self.channels_by_username:
+            raise ValueError(f'No user has "{username}" as username')  # as Telethon reports UsernameNotOccupiedError
+        channel = self.channels_by_username[username]
+        return InputPeerChannel(channel_id=channel.peer_id, access_hash=channel.access_hash)
+
+    def add_event_handler(self, callback, event=None):
+        self.event_handlers.append((callback, event))
+
+    async def get_messages(self, entity, limit: int = 100, offset_id: int = 0, min_id: int = 0,
+                           ids: list[int] | None = None) -> list[Message]:
+        self.count_call('get_messages')
+        channel = self.channel_for(entity)
+        if ids is not None:
+            by_id = {msg.id: msg for msg in channel.messages}
+            return [by_id.get(message_id) for message_id in ids]
+        page = [
+            msg for msg in channel.messages
+            if msg.id > min_id and (offset_id == 0 or msg.id < offset_id)
+        ][:limit]
+        return page
+
+    async def __call__(self, request):
+        """Raw API requests; only messages.getMessagesViews is supported."""
+        if not isinstance(request, GetMessagesViewsRequest):
+            raise NotImplementedError(type(request).__name__)
+        self.count_call('get_messages_views')
+        by_id = {msg.id: msg for msg in self.channel_for(request.peer).messages}
+        views = []
+        for message_id in request.id:
+            msg = by_id.get(message_id)
+            views.append(MessageViews(views=msg.views, forwards=msg.forwards, replies=msg.replies) if msg else MessageViews())
+        return messages.MessageViews(views=views, chats=[], users=[])
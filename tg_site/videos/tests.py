@@ -1,18 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from telethon.errors import ChannelPrivateError
+from telethon.tl.types import InputPeerChannel
 
-from .models import Channel, Post
+from . import fetcher
+from .fetcher import (
+    POST_FINGERPRINTS, LiveIngest, backfill_channel, cached_peer, check_channel, contiguous_high_water_mark, is_full_scan_due,
+    iter_complete_posts, mark_channel_synced, save_channel_messages, save_channel_peer, select_new_messages,
+    update_post_counters,
+)
+from . import embeddings
+from .circuit import BACKOFF_MAX, ERROR_BUDGET, backoff_seconds, record_failure
+from .embedding_queue import (
+    EMBED_QUEUE_MAX_ATTEMPTS, claim_embedding_jobs, embed_queued, set_embed_on_ingest, start_embedding_worker,
+)
+from .embedding_stub import StubEmbeddingServer, stub_vector
+from .jobs import PRIORITY_NEW_CHANNEL, claim_jobs, enqueue_fetch
+from .leasing import LEASE_TTL, claim_channel, retire_worker, sync_leases
+from .metrics import Metrics
+from .ratelimit import AIMDLimit, EmbeddingRateLimiter, parse_duration
+from .models import (
+    EMBEDDING_DIMENSIONS, QUERY_EMBEDDING_TTL, QUERY_EMBEDDINGS, Channel, EmbeddingCheckpoint, EmbeddingGenerator,
+    EmbeddingJob, FetchJob, Post, QueryEmbedding, TextEmbedding, configure_vector_search,
+)
+from .telegram_replay import FakeTelegramClient, make_message as make_telethon_message, simulate_activity, synthetic_channel
+from .scheduler import (
+    LIVE_IDLE_TIMEOUT, MAX_POLL_INTERVAL, MIN_POLL_INTERVAL, ChannelActivity, ChannelScheduler, RequestBudget,
+    measure_channel_activity, next_poll_interval,
+)
 from .views import DEFAULT_SORT, apply_sort
 
 
-def make_post(channel, telegram_id, *, views=0, forwards=0, replies=0, when=None, media_type='MessageMediaDocument', has_media=True):
+def make_post(channel, telegram_id, *, views=0, forwards=0, replies=0, when=None, media_type='MessageMediaDocument', has_media=True, text='x'):
     return Post.objects.create(
         channel=channel,
         telegram_id=telegram_id,
         date=when or timezone.now(),
-        text='x',
+        text=text,
         link='https://t.me/x/1',
         views=views,
         forwards=forwards,
@@ -93,3 +130,993 @@ class HomeDefaultFiltersTests(TestCase):
         ordered_ids = [p.id for p in response.context['page_obj']]
         self.assertEqual(ordered_ids[0], high_ratio.id)
         self.assertIn(low_ratio.id, ordered_ids)
+
+
+def make_message(telegram_id, *, grouped_id=None, views=100, forwards=0, text='msg', video=True):
+    media = SimpleNamespace(document=SimpleNamespace(duration=10, size=1000)) if video else None
+    return SimpleNamespace(
+        id=telegram_id, grouped_id=grouped_id, date=timezone.now(), text=text,
+        views=views, forwards=forwards, replies=None, media=media,
+    )
+
+
+def unit_vector(*weights):
+    return list(weights) + [0.0] * (EMBEDDING_DIMENSIONS - len(weights))
+
+
+class SemanticSearchTests(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(username='sem_ch', title='sem_ch')
+        self.other = Channel.objects.create(username='sem_other', title='sem_other')
+        self.close = make_post(self.channel, 1)
+        self.far = make_post(self.channel, 2)
+        self.other_close = make_post(self.other, 3)
+        make_post(self.channel, 4)  # not embedded yet
+        Post.objects.filter(pk=self.close.pk).update(embedding=unit_vector(1.0, 0.1))
+        Post.objects.filter(pk=self.far.pk).update(embedding=unit_vector(0.0, 1.0))
+        Post.objects.filter(pk=self.other_close.pk).update(embedding=unit_vector(1.0, 0.0))
+        QUERY_EMBEDDINGS.clear()
+
+    def search(self, **kwargs):
+        with mock.patch.object(EmbeddingGenerator, 'generate_embedding', return_value=unit_vector(1.0, 0.0)):
+            return list(Post.semantic_search('query', **kwargs))
+
+    def test_results_in_similarity_order_within_filters(self):
+        self.assertEqual(self.search(limit=10), [self.other_close, self.close, self.far])
+        self.assertEqual(self.search(limit=10, filters=Q(channel=self.channel)), [self.close, self.far])
+        self.assertEqual(self.search(limit=1), [self.other_close])
+
+    def test_ef_search_covers_the_limit(self):
+        with connection.cursor() as cursor:
+            configure_vector_search(cursor, 500)
+            cursor.execute("SELECT current_setting('hnsw.ef_search')")
+            self.assertEqual(cursor.fetchone()[0], '500')
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = 'post_embedding_hnsw_idx'")
+            self.assertIn('hnsw (embedding vector_cosine_ops)', cursor.fetchone()[0])
+
+
+class KeywordSearchTests(TestCase):
+    def setUp(self):
+        self.english = Channel.objects.create(username='kw_en', title='kw_en', search_config='english')
+        self.russian = Channel.objects.create(username='kw_ru', title='kw_ru', search_config='russian')
+
+    def search(self, query, **kwargs):
+        return set(Post.keyword_search(query, **kwargs))
+
+    def test_stemmed_matches_in_each_channel_language(self):
+        cats = make_post(self.english, 1, text='Two cats running across the road')
+        koshki = make_post(self.russian, 2, text='Кошки бегают по дороге')
+        make_post(self.english, 3, text='Dogs sleeping')
+        self.assertEqual(self.search('cat run'), {cats})
+        self.assertEqual(self.search('кошка'), {koshki})
+        self.assertEqual(self.search('cat', filters=Q(channel=self.russian)), set())
+
+    def test_substring_fallback_needs_trigram_length(self):
+        post = make_post(self.english, 1, text='foobarbaz')
+        self.assertEqual(self.search('barb'), {post})
+        self.assertEqual(self.search('ba'), set())
+
+    def test_search_vector_follows_text_and_channel_config(self):
+        post = make_post(self.english, 1, text='nothing yet')
+        Post.objects.filter(pk=post.pk).update(text='Parrots talking')  # raw UPDATE, like the fetcher's upserts
+        self.assertEqual(self.search('parrot'), {post})
+        self.english.search_config = 'simple'
+        self.english.save()
+        post.refresh_from_db()
+        self.assertEqual(post.search_vector, "'parrots':1 'talking':2")
+
+    def test_relevance_sort_orders_by_rank(self):
+        once = make_post(self.english, 1, text='a cat and a dog', when=timezone.now())
+        often = make_post(self.english, 2, text='cat cat cat', when=timezone.now() - timedelta(days=1))
+        response = Client().get('/?q=cat&sort=-relevance&date_from=&date_to=')
+        self.assertEqual(list(response.context['page_obj']), [often, once])
+
+
+class HybridSearchTests(TestCase):
+    def setUp(self):
+        QUERY_EMBEDDINGS.clear()
+        self.addCleanup(QUERY_EMBEDDINGS.clear)
+        channel = Channel.objects.create(username='hy_ch', title='hy_ch', search_config='english')
+        self.semantic_only = make_post(channel, 1, text='feline pictures')
+        self.both = make_post(channel, 2, text='cat pictures')
+        self.keyword_only = make_post(channel, 3, text='cat cat cat')
+        Post.objects.filter(pk=self.semantic_only.pk).update(embedding=unit_vector(1.0, 0.0))
+        Post.objects.filter(pk=self.both.pk).update(embedding=unit_vector(1.0, 0.2))
+
+    def search(self, **kwargs):
+        with mock.patch.object(EmbeddingGenerator, 'generate_embedding', return_value=unit_vector(1.0, 0.0)):
+            return Post.hybrid_search('cat', limit=10, **kwargs)
+
+    def test_reciprocal_rank_fusion_order(self):
+        results = self.search()
+        # both: semantic #2 + keyword #2 beats semantic #1 alone and keyword #1 alone (tied; newer id first)
+        self.assertEqual(list(results), [self.both, self.keyword_only, self.semantic_only])
+        self.assertAlmostEqual(results[0].rank, 1 / 62 + 1 / 62)
+
+    def test_weights_and_filters(self):
+        self.assertEqual(list(self.search(semantic_weight=0))[:2], [self.keyword_only, self.both])
+        self.assertAlmostEqual(self.search(semantic_weight=2, keyword_weight=1)[0].rank, 2 / 62 + 1 / 62)  # not integer division
+        self.assertEqual(list(self.search(filters=~Q(pk=self.both.pk))), [self.keyword_only, self.semantic_only])
+
+    def test_results_paginate_lazily(self):
+        results = self.search()
+        with CaptureQueriesContext(connection) as queries:
+            page = Paginator(results, 2).page(2)
+            self.assertEqual(list(page), [self.semantic_only])
+        statements = [query['sql'] for query in queries if 'videos_post' in query['sql']]
+        self.assertEqual(len(statements), 2)  # count and page, each fusing the rankings itself
+        self.assertTrue(all(sql.count('row_number()') == 2 for sql in statements))  # once per ranking
+        self.assertFalse(any('ARRAY[' in sql for sql in statements))
+        self.assertEqual(sum('hnsw.ef_search' in query['sql'] for query in queries), 2)
+
+    def test_relevance_sort_keeps_fused_order(self):
+        self.assertEqual(list(apply_sort(self.search(), '-relevance')), list(self.search()))
+
+
+class QueryEmbeddingCacheTests(TestCase):
+    def setUp(self):
+        QUERY_EMBEDDINGS.clear()
+        patcher = mock.patch.object(EmbeddingGenerator, 'generate_embedding', return_value=unit_vector(1.0, 0.0))
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(QUERY_EMBEDDINGS.clear)
+
+    def test_repeated_and_paginated_queries_embed_once(self):
+        for query in ['cat videos', '  cat   videos ', 'cat\tvideos']:
+            list(Post.semantic_search(query, limit=10))
+        self.assertEqual(self.generate.call_count, 1)
+        self.generate.assert_called_with('cat videos')
+        self.assertEqual(QueryEmbedding.objects.count(), 1)
+
+    def test_persistent_tier_survives_process_cache(self):
+        EmbeddingGenerator.generate_query_embedding('cat videos')
+        QUERY_EMBEDDINGS.clear()
+        embedding = EmbeddingGenerator.generate_query_embedding('cat videos')
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(len(embedding), EMBEDDING_DIMENSIONS)
+        self.assertIsInstance(embedding[0], float)
+
+    def test_expired_entries_are_regenerated(self):
+        EmbeddingGenerator.generate_query_embedding('cat videos')
+        QueryEmbedding.objects.update(created_at=timezone.now() - QUERY_EMBEDDING_TTL - timedelta(minutes=1))
+        QUERY_EMBEDDINGS.clear()
+        EmbeddingGenerator.generate_query_embedding('cat videos')
+        self.assertEqual(self.generate.call_count, 2)
+        self.assertEqual(QueryEmbedding.objects.count(), 1)
+
+
+class ToyBackend(embeddings.EmbeddingBackend):
+    name = 'toy'
+    default_model = 'toy-2d'
+    dimensions = 2
+
+    def __init__(self, model=''):
+        super().__init__(model)
+        self.batches = []
+
+    def embed(self, texts, tokens=0):
+        self.batches.append(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class ToyBackendMixin:
+    """Selects ToyBackend as the embedding backend for each test."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(embeddings.BACKENDS, {'toy': ToyBackend})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name, value in [('EMBEDDING_BACKEND', 'toy'), ('_backend', None)]:
+            patcher = mock.patch.object(embeddings, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class EmbeddingBackendTests(ToyBackendMixin, SimpleTestCase):
+    def test_backend_selected_by_setting_and_batched(self):
+        backend = embeddings.get_backend()
+        self.assertIsInstance(backend, ToyBackend)
+        self.assertEqual(backend.model, 'toy-2d')
+        vectors = backend.encode(['abc', '  ', 'de'])
+        self.assertEqual(backend.batches, [['abc', 'de']])
+        self.assertIsNone(vectors[1])
+        self.assertEqual(len(vectors[0]), EMBEDDING_DIMENSIONS)
+        self.assertEqual(vectors[2][:3], [2.0, 1.0, 0.0])
+
+    def test_unknown_backend_is_a_configuration_error(self):
+        with mock.patch.object(embeddings, 'EMBEDDING_BACKEND', 'nope'):
+            with self.assertRaises(ImproperlyConfigured):
+                embeddings.get_backend()
+
+    def test_requests_are_packed_to_the_token_budget(self):
+        self.assertEqual(embeddings.pack_requests([4, 4, 3, 9, 1], budget=8, max_items=0), [[0, 1], [2], [3], [4]])
+        self.assertEqual(embeddings.pack_requests([1, 1, 1], budget=0, max_items=2), [[0, 1], [2]])
+        backend = ToyBackend()
+        backend.prepare = lambda texts: [(text, len(text)) for text in texts]
+        backend.request_tokens = 5
+        vectors = backend.encode(['abc', '', 'de', 'fghij'])
+        self.assertEqual(backend.batches, [['abc', 'de'], ['fghij']])
+        self.assertEqual([vector and vector[0] for vector in vectors], [3.0, None, 2.0, 5.0])
+
+    def test_embedding_worker_refuses_to_start_unconfigured(self):
+        with mock.patch.object(embeddings, 'EMBEDDING_BACKEND', 'openai'), mock.patch.dict('os.environ', {'OPENAI_API_KEY': ''}):
+            with self.assertRaises(ImproperlyConfigured):
+                start_embedding_worker('w1')
+
+    def test_openai_packs_by_real_token_counts(self):
+        backend = embeddings.OpenAIBackend()
+        backend.max_tokens = 10
+        encoding = mock.Mock()
+        encoding.encode_batch.return_value = [list(range(2)), list(range(12)), list(range(5))]
+        encoding.decode.return_value = 'truncated'
+        backend._encoding = encoding
+        prepared = backend.prepare(['short', ' ', 'x' * 40, 'é' * 6])
+        encoding.encode_batch.assert_called_once_with(['short', 'x' * 40, 'é' * 6], disallowed_special=())
+        self.assertEqual(prepared, [('short', 2), (' ', 0), ('truncated', 10), ('é' * 6, 5)])
+        backend.request_tokens = 12
+        self.assertEqual(backend.pack(prepared), [[0, 2], [3]])
+
+    def test_prepared_texts_are_not_tokenized_again(self):
+        backend = ToyBackend()
+        backend.prepare = mock.Mock(side_effect=AssertionError('tokenized twice'))
+        backend.embed = mock.Mock(return_value=[[1.0]])
+        backend.encode(['abc'], [('abc', 7)])
+        backend.embed.assert_called_once_with(['abc'], 7)
+
+    def test_wider_vectors_than_the_column_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            embeddings.pad_embedding([0.0] * (EMBEDDING_DIMENSIONS + 1))
+
+
+class IncrementalFetchTests(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(username='inc_ch', title='inc_ch')
+
+    def test_new_channel_needs_full_scan(self):
+        self.assertTrue(is_full_scan_due(self.channel, timezone.now()))
+
+    def test_recent_full_scan_is_not_repeated(self):
+        now = timezone.now()
+        self.channel.last_seen_telegram_id = 10
+        self.channel.last_full_scan_at = now - timedelta(minutes=1)
+        self.assertFalse(is_full_scan_due(self.channel, now))
+        self.assertTrue(is_full_scan_due(self.channel, now + timedelta(days=1)))
+
+    def test_pushed_ids_only_advance_mark_without_holes(self):
+        self.assertEqual(contiguous_high_water_mark(10, [12, 11, 13]), 13)
+        self.assertEqual(contiguous_high_water_mark(10, [11, 13]), 11)  # 12 never arrived
+        self.assertEqual(contiguous_high_water_mark(10, [5, 14]), 10)
+
+    def test_select_new_messages_keeps_album_straddling_high_water_mark(self):
+        fetched = [make_message(12), make_message(11, grouped_id=5), make_message(10, grouped_id=5), make_message(9)]
+        selected_ids = [msg.id for msg in select_new_messages(fetched, last_seen_telegram_id=10)]
+        self.assertEqual(selected_ids, [12, 11, 10])
+
+    def test_albums_are_not_split_across_pages(self):
+        pages = [
+            [make_message(12), make_message(11, grouped_id=5)],
+            [make_message(10, grouped_id=5), make_message(9, grouped_id=5), make_message(8)],
+            [make_message(7, grouped_id=6)],
+        ]
+
+        async def chunks():
+            async def iter_pages():
+                for page in pages:
+                    yield page
+            return [[msg.id for msg in chunk] async for chunk in iter_complete_posts(iter_pages())]
+
+        self.assertEqual(asyncio.run(chunks()), [[12], [11, 10, 9, 8], [7]])
+
+    def test_mark_channel_synced_never_lowers_high_water_mark(self):
+        now = timezone.now()
+        self.channel.last_seen_telegram_id = 50
+        mark_channel_synced(self.channel, 40, now, full_scan=True)
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.last_seen_telegram_id, 50)
+        self.assertEqual(self.channel.last_full_scan_at, now)
+
+
+class BulkUpsertTests(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(username='bulk_ch', title='bulk_ch')
+
+    def test_counts_inserts_then_updates(self):
+        messages = [make_message(1), make_message(2)]
+        self.assertEqual(save_channel_messages(self.channel, messages), (2, 0, 0))
+        messages = [make_message(1, views=500), make_message(2, views=600), make_message(3)]
+        self.assertEqual(save_channel_messages(self.channel, messages), (1, 2, 0))
+        post = Post.objects.get(channel=self.channel, telegram_id=1)
+        self.assertEqual(post.views, 500)
+        self.assertIsNotNone(post.when_updated)
+        self.assertIsNone(Post.objects.get(channel=self.channel, telegram_id=3).when_updated)
+
+    def test_album_collapses_into_primary_and_deletes_secondaries(self):
+        save_channel_messages(self.channel, [make_message(11), make_message(12)])
+        album = [make_message(11, grouped_id=9, views=10), make_message(12, grouped_id=9, views=70)]
+        save_channel_messages(self.channel, album)
+        self.assertEqual(list(Post.objects.filter(channel=self.channel).values_list('telegram_id', flat=True)), [11])
+        primary = Post.objects.get(channel=self.channel, telegram_id=11)
+        self.assertEqual(primary.views, 70)
+        self.assertEqual(primary.video_data['album_ids'], [11, 12])
+
+    def test_single_view_messages_are_skipped(self):
+        self.assertEqual(save_channel_messages(self.channel, [make_message(1, views=1)]), (0, 0, 0))
+        self.assertFalse(Post.objects.filter(channel=self.channel).exists())
+
+
+class ChangeDetectionTests(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(username='change_ch', title='change_ch')
+        self.first = make_message(1)
+        self.second = make_message(2)
+        save_channel_messages(self.channel, [self.first, self.second])
+
+    def test_unchanged_rows_are_skipped_and_keep_when_updated(self):
+        self.first.views = 999
+        self.assertEqual(save_channel_messages(self.channel, [self.first, self.second]), (0, 1, 1))
+        self.assertIsNone(Post.objects.get(channel=self.channel, telegram_id=2).when_updated)
+
+    def test_sql_comparison_skips_identical_rows_with_cold_cache(self):
+        POST_FINGERPRINTS.pop(self.channel.pk)
+        self.assertEqual(save_channel_messages(self.channel, [self.first, self.second]), (0, 0, 2))
+        self.assertFalse(Post.objects.filter(channel=self.channel, when_updated__isnull=False).exists())
+
+    def test_counter_refresh_writes_only_counters(self):
+        self.assertEqual(update_post_counters(self.channel, [(1, 500, 3, 2), (2, 100, 0, 0)]), (1, 1))
+        post = Post.objects.get(channel=self.channel, telegram_id=1)
+        self.assertEqual((post.views, post.forwards, post.replies), (500, 3, 2))
+        self.assertIsNone(post.when_updated)
+
+
+class ChannelPeerCacheTests(TestCase):
+    def test_peer_round_trips_through_channel_row(self):
+        channel = Channel.objects.create(username='peer_ch', title='peer_ch')
+        self.assertIsNone(cached_peer(channel))
+        save_channel_peer(channel, InputPeerChannel(channel_id=1234567890123, access_hash=-987654321987654321))
+        channel = Channel.objects.get(pk=channel.pk)
+        self.assertEqual(cached_peer(channel), InputPeerChannel(channel_id=1234567890123, access_hash=-987654321987654321))
+        save_channel_peer(channel, None)
+        self.assertIsNone(cached_peer(Channel.objects.get(pk=channel.pk)))
+
+
+class SchedulerTests(TestCase):
+    def setUp(self):
+        self.busy = Channel.objects.create(username='busy_ch', title='busy_ch')
+        self.quiet = Channel.objects.create(username='quiet_ch', title='quiet_ch')
+
+    def test_poll_interval_follows_posting_rate_within_bounds(self):
+        self.assertEqual(next_poll_interval(0, refresh_interval=1800), MAX_POLL_INTERVAL)
+        self.assertEqual(next_poll_interval(2, refresh_interval=1800), 1800)
+        self.assertEqual(next_poll_interval(6, refresh_interval=1800), 600)
+        self.assertEqual(next_poll_interval(1000, refresh_interval=1800), MIN_POLL_INTERVAL)
+        self.assertEqual(next_poll_interval(0.5, refresh_interval=10 ** 6), MAX_POLL_INTERVAL)
+        self.assertEqual(next_poll_interval(30, refresh_interval=1800, live=True), 1800)
+
+    def test_busy_channel_comes_back_before_quiet_one(self):
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        scheduler.sync([self.busy, self.quiet], now=0)
+        due = scheduler.pop_due(now=0, limit=10)
+        self.assertEqual({state.channel.pk for state in due}, {self.busy.pk, self.quiet.pk})
+        self.assertEqual(scheduler.pop_due(now=0, limit=10), [])
+        for state in due:
+            posts_per_hour = 30 if state.channel == self.busy else 0
+            scheduler.reschedule(state, ChannelActivity(posts_per_hour, None, None), now=0)
+        self.assertEqual([state.channel for state in scheduler.pop_due(now=200, limit=10)], [self.busy])
+
+    def test_deleted_channel_leaves_queue(self):
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        scheduler.sync([self.busy, self.quiet], now=0)
+        scheduler.sync([self.busy], now=0)
+        self.assertEqual([state.channel for state in scheduler.pop_due(now=0, limit=10)], [self.busy])
+
+    def test_update_events_find_channels_by_peer(self):
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        self.busy.telegram_peer_id = 111
+        scheduler.sync([self.busy, self.quiet], now=0)
+        self.assertEqual(scheduler.state_for_peer(111).channel, self.busy)
+        self.assertIsNone(scheduler.state_for_peer(222))
+        [state] = [state for state in scheduler.pop_due(now=0, limit=10) if state.channel == self.quiet]
+        state.channel.telegram_peer_id = 222  # resolved by its first poll
+        scheduler.reschedule(state, None, now=0)
+        self.assertEqual(scheduler.state_for_peer(222).channel, self.quiet)
+        scheduler.sync([self.quiet], now=0)
+        self.assertIsNone(scheduler.state_for_peer(111))
+
+    def test_live_flag_expires_without_update_events(self):
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        scheduler.sync([self.busy], now=0)
+        [state] = scheduler.pop_due(now=0, limit=10)
+        scheduler.mark_live(state, now=0)
+        scheduler.reschedule(state, ChannelActivity(30, None, None), now=LIVE_IDLE_TIMEOUT)
+        self.assertTrue(state.live)
+        self.assertEqual(state.interval, 1800)
+        scheduler.reschedule(state, ChannelActivity(30, None, None), now=LIVE_IDLE_TIMEOUT + 1)
+        self.assertFalse(state.live)
+        self.assertEqual(state.interval, 120)
+
+    def test_views_growth_is_measured_on_the_same_posts(self):
+        now = timezone.now()
+        post = make_post(self.busy, 1, views=1000, when=now - timedelta(hours=1))
+        first = measure_channel_activity(self.busy, None, now - timedelta(hours=1))
+        self.assertIsNone(first.views_growth_per_hour)
+        Post.objects.filter(pk=post.pk).update(views=1100)
+        make_post(self.busy, 2, views=5000, when=now)
+        second = measure_channel_activity(self.busy, first.views_sample, now)
+        self.assertAlmostEqual(second.views_growth_per_hour, 0.1)
+        self.assertEqual(second.views_sample.views, 6100)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.channel = Channel.objects.create(username='flaky_ch', title='flaky_ch')
+        self.now = timezone.now()
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([backoff_seconds(n) for n in (1, 2, 3)], [60, 120, 240])
+        self.assertEqual(backoff_seconds(100), BACKOFF_MAX)
+
+    def test_circuit_opens_after_error_budget_and_closes_on_success(self):
+        for _ in range(ERROR_BUDGET - 1):
+            self.assertEqual(record_failure(self.channel, ConnectionError('reset'), self.now), 'backoff')
+        self.assertEqual(record_failure(self.channel, ConnectionError('reset'), self.now), 'open')
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.fetch_failures, ERROR_BUDGET)
+        self.assertEqual(self.channel.last_fetch_error, 'ConnectionError: reset')
+
+        mark_channel_synced(self.channel, None, self.now, full_scan=False)
+        self.channel.refresh_from_db()
+        self.assertEqual((self.channel.fetch_status, self.channel.fetch_failures), ('ok', 0))
+        self.assertIsNone(self.channel.fetch_blocked_until)
+
+    def test_private_channel_opens_circuit_immediately(self):
+        self.assertEqual(record_failure(self.channel, ChannelPrivateError(request=None), self.now), 'open')
+
+    def test_unresolvable_username_opens_circuit_immediately(self):
+        client = FakeTelegramClient([])
+        self.assertEqual(asyncio.run(check_channel(client, self.channel, self.now - timedelta(days=7))), (0, 0, 0))
+        self.assertEqual((self.channel.fetch_status, self.channel.fetch_failures), ('open', 1))
+        self.assertEqual(self.channel.last_fetch_error, 'UsernameUnresolvedError: No user has "flaky_ch" as username')
+
+    def test_blocked_channel_is_not_polled(self):
+        record_failure(self.channel, ConnectionError('reset'), timezone.now())
+        client = FakeTelegramClient([])
+        self.assertEqual(asyncio.run(check_channel(client, self.channel, self.now - timedelta(days=7))), (0, 0, 0))
+        self.assertEqual(client.calls, {})
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        scheduler.sync([self.channel], now=0)
+        self.assertEqual(scheduler.pop_due(now=1, limit=10), [])
+        self.assertEqual(len(scheduler.pop_due(now=120, limit=10)), 1)
+
+
+class BackfillCommandTests(TestCase):
+    def test_marks_channels_and_reports_progress(self):
+        Channel.objects.create(username='a_ch', title='a_ch', backfill_oldest_telegram_id=500)
+        Channel.objects.create(username='b_ch', title='b_ch')
+        call_command('backfill_channels', '@a_ch', stdout=StringIO())
+        self.assertIsNotNone(Channel.objects.get(username='a_ch').backfill_requested_at)
+        self.assertIsNone(Channel.objects.get(username='b_ch').backfill_requested_at)
+        out = StringIO()
+        call_command('backfill_channels', stdout=out)
+        self.assertEqual(out.getvalue(), 'a_ch: in progress, down to id 500\n')
+
+
+class FetchJobQueueTests(TestCase):
+    def test_add_channel_enqueues_priority_fetch(self):
+        response = Client().post('/api/channel/add/', {'username': '@fresh_ch'})
+        self.assertTrue(response.json()['success'])
+        job = FetchJob.objects.get(channel__username='fresh_ch')
+        self.assertEqual(job.priority, PRIORITY_NEW_CHANNEL)
+
+    def test_jobs_are_claimed_by_priority_once(self):
+        now = timezone.now()
+        low = enqueue_fetch(Channel.objects.create(username='low_ch', title='low_ch'))
+        high_channel = Channel.objects.create(username='high_ch', title='high_ch')
+        high = enqueue_fetch(high_channel, 10)
+        self.assertEqual(enqueue_fetch(high_channel, 50).pk, high.pk)  # no duplicate, priority raised
+        self.assertEqual([job.pk for job in claim_jobs('w1', 1, now)], [high.pk])
+        self.assertEqual([job.pk for job in claim_jobs('w2', 5, now)], [low.pk])
+        self.assertEqual(claim_jobs('w3', 5, now), [])
+        # Claims of a worker that died expire with its leases.
+        self.assertEqual(len(claim_jobs('w3', 5, now + timedelta(seconds=LEASE_TTL + 1))), 2)
+
+    def test_jobs_of_channels_leased_elsewhere_are_left_to_the_lessee(self):
+        now = timezone.now()
+        channel = Channel.objects.create(username='leased_ch', title='leased_ch')
+        job = enqueue_fetch(channel)
+        self.assertTrue(claim_channel('w2', channel.pk, now))
+        self.assertEqual(claim_jobs('w1', 5, now), [])
+        self.assertEqual([claimed.pk for claimed in claim_jobs('w2', 5, now)], [job.pk])
+
+
+class ChannelLeaseTests(TestCase):
+    def setUp(self):
+        self.channels = [Channel.objects.create(username=f'lease_{i}', title=f'lease_{i}') for i in range(5)]
+        self.now = timezone.now()
+
+    def test_workers_split_channels_without_overlap(self):
+        first = sync_leases('worker-a', set(), self.now)
+        self.assertEqual(len(first), 5)
+        sync_leases('worker-b', set(), self.now)  # joins: no free channels yet
+        first = sync_leases('worker-a', set(), self.now)  # releases down to its share
+        second = sync_leases('worker-b', set(), self.now)
+        self.assertEqual((len(first), len(second)), (3, 2))
+        self.assertFalse({c.pk for c in first} & {c.pk for c in second})
+
+    def test_busy_channels_are_not_released(self):
+        owned = sync_leases('worker-a', set(), self.now)
+        sync_leases('worker-b', set(), self.now)
+        busy = {channel.pk for channel in owned}
+        self.assertEqual(len(sync_leases('worker-a', busy, self.now)), 5)
+
+    def test_expired_leases_of_crashed_worker_are_taken_over(self):
+        sync_leases('worker-a', set(), self.now)
+        later = self.now + timedelta(seconds=LEASE_TTL + 1)
+        self.assertEqual(len(sync_leases('worker-b', set(), later)), 5)
+
+    def test_retired_worker_frees_its_channels(self):
+        sync_leases('worker-a', set(), self.now)
+        retire_worker('worker-a')
+        self.assertFalse(Channel.objects.filter(leased_by__isnull=False).exists())
+
+
+class FetchMetricsTests(SimpleTestCase):
+    def test_prometheus_rendering_of_counters_and_histograms(self):
+        metrics = Metrics()
+        metrics.inc('tg_fetch_telegram_calls_total', method='get_messages')
+        metrics.inc('tg_fetch_telegram_calls_total', 2, method='get_messages')
+        metrics.observe('tg_fetch_channel_seconds', 0.3)
+        metrics.observe('tg_fetch_channel_seconds', 7)
+        text = metrics.render_prometheus()
+        self.assertIn('tg_fetch_telegram_calls_total{method="get_messages"} 3', text)
+        self.assertIn('tg_fetch_channel_seconds_bucket{le="0.5"} 1', text)
+        self.assertIn('tg_fetch_channel_seconds_bucket{le="+Inf"} 2', text)
+        self.assertIn('tg_fetch_channel_seconds_count 2', text)
+
+    def test_totals_sum_over_labels_and_percentiles_use_bucket_bounds(self):
+        metrics = Metrics()
+        metrics.inc('tg_fetch_db_seconds_total', 1.5, function='a')
+        metrics.inc('tg_fetch_db_seconds_total', 0.5, function='b')
+        self.assertEqual(metrics.totals(), {'tg_fetch_db_seconds_total': 2.0})
+        for seconds in [0.2, 0.2, 0.2, 20]:
+            metrics.observe('tg_fetch_channel_seconds', seconds)
+        self.assertEqual(metrics.histograms['tg_fetch_channel_seconds'].percentile(0.5), 0.25)
+        self.assertEqual(metrics.histograms['tg_fetch_channel_seconds'].percentile(0.95), 30)
+
+
+class ReplayIngestTests(TransactionTestCase):
+    """check_channel runs its DB work on the fetcher's thread pool, so data must be committed."""
+
+    def test_check_channel_against_fake_client(self):
+        fake_channel = synthetic_channel('replay_ch', 4242, 120, album_ratio=0.3)
+        client = FakeTelegramClient([fake_channel])
+        channel = Channel.objects.create(username='replay_ch', title='replay_ch')
+        since_date = timezone.now() - timedelta(days=7)
+
+        new_posts, _, _ = asyncio.run(check_channel(client, channel, since_date))
+        grouped_ids = {msg.grouped_id for msg in fake_channel.messages if msg.grouped_id}
+        standalone = sum(1 for msg in fake_channel.messages if not msg.grouped_id)
+        self.assertEqual(new_posts, standalone + len(grouped_ids))
+        self.assertEqual(Post.objects.filter(channel=channel).count(), new_posts)
+        self.assertEqual(Channel.objects.get(pk=channel.pk).telegram_peer_id, 4242)
+
+        simulate_activity(fake_channel, new_posts=3, edits=0)
+        client.calls.clear()
+        new_posts, _, _ = asyncio.run(check_channel(client, channel, since_date))
+        self.assertEqual(client.calls, {'get_messages': 1})
+        self.assertGreater(new_posts, 0)
+
+    def test_post_skipped_for_views_is_polled_again(self):
+        fake_channel = synthetic_channel('unseen_ch', 4646, 5, album_ratio=0)
+        fresh = fake_channel.messages[1]  # the second newest
+        fresh.views = 1
+        client = FakeTelegramClient([fake_channel])
+        channel = Channel.objects.create(username='unseen_ch', title='unseen_ch')
+        since_date = timezone.now() - timedelta(days=7)
+        asyncio.run(check_channel(client, channel, since_date))
+        self.assertFalse(Post.objects.filter(channel=channel, telegram_id=fresh.id).exists())
+        self.assertEqual(channel.last_seen_telegram_id, fresh.id - 1)
+
+        fresh.views = 40
+        new_posts, _, _ = asyncio.run(check_channel(client, channel, since_date))
+        self.assertEqual(new_posts, 1)
+        self.assertEqual(Post.objects.get(channel=channel, telegram_id=fresh.id).views, 40)
+        self.assertEqual(channel.last_seen_telegram_id, fake_channel.messages[0].id)
+
+    def test_metrics_refresh_updates_counters_only(self):
+        fake_channel = synthetic_channel('refresh_ch', 4343, 150, album_ratio=0.3)
+        client = FakeTelegramClient([fake_channel])
+        channel = Channel.objects.create(username='refresh_ch', title='refresh_ch')
+        since_date = timezone.now() - timedelta(days=7)
+        asyncio.run(check_channel(client, channel, since_date))
+        texts_before = dict(Post.objects.filter(channel=channel).values_list('telegram_id', 'text'))
+
+        simulate_activity(fake_channel, new_posts=0, edits=5, view_growth=0.5)
+        client.calls.clear()
+        _, updated, _ = asyncio.run(check_channel(client, channel, since_date, metrics_refresh_interval=0))
+        self.assertEqual(client.calls, {'get_messages': 1, 'get_messages_views': 2})  # 150 ids, 100 per call
+        self.assertGreater(updated, 0)
+
+        posts = {}  # grouped_id or telegram_id -> (primary telegram_id, max views), like album_post_row
+        for msg in fake_channel.messages:
+            primary_id, views = posts.get(msg.grouped_id or msg.id, (msg.id, 0))
+            posts[msg.grouped_id or msg.id] = (min(primary_id, msg.id), max(views, msg.views))
+        stored = dict(Post.objects.filter(channel=channel).values_list('telegram_id', 'views'))
+        self.assertEqual(stored, dict(posts.values()))
+        self.assertEqual(dict(Post.objects.filter(channel=channel).values_list('telegram_id', 'text')), texts_before)
+
+    def test_pushed_album_is_completed_and_written(self):
+        fake_channel = synthetic_channel('live_ch', 4444, 30, album_ratio=0)
+        client = FakeTelegramClient([fake_channel])
+        channel = Channel.objects.create(username='live_ch', title='live_ch')
+        asyncio.run(check_channel(client, channel, timezone.now() - timedelta(days=7)))
+        first_id = fake_channel.next_id()
+        now = timezone.now()
+        album = [
+            make_telethon_message(4444, first_id + index, now, 'album' if index == 0 else '', views=50,
+                                  grouped_id=99, media_kind='video', size=1000)
+            for index in range(3)
+        ]
+        single = make_telethon_message(4444, first_id + 3, now, 'single', views=50)
+        fake_channel.messages = [single] + album[::-1] + fake_channel.messages
+
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        scheduler.sync([channel], now=0)
+        live = LiveIngest(client, scheduler, flush_delay=0)
+        client.calls.clear()
+
+        async def push():
+            for msg in [album[1], single, album[2]]:  # the album's first update was missed
+                await live.on_message(SimpleNamespace(message=msg))
+            await asyncio.gather(*live.flushes.values())
+
+        asyncio.run(push())
+        self.assertEqual(client.calls, {'get_messages': 1})
+        primary = Post.objects.get(channel=channel, telegram_id=first_id)
+        self.assertEqual(primary.video_data['album_ids'], [first_id, first_id + 1, first_id + 2])
+        self.assertEqual(primary.text, 'album')
+        self.assertTrue(Post.objects.filter(channel=channel, telegram_id=first_id + 3).exists())
+        self.assertEqual(Channel.objects.get(pk=channel.pk).last_seen_telegram_id, first_id + 3)
+        self.assertTrue(scheduler.states[channel.pk].live)
+
+    def test_failing_channel_is_backed_off(self):
+        client = FakeTelegramClient([])
+        channel = Channel.objects.create(username='flaky_ch', title='flaky_ch')
+        with mock.patch.object(client, 'get_input_entity', side_effect=ConnectionError('reset')):
+            asyncio.run(check_channel(client, channel, timezone.now() - timedelta(days=7)))
+        channel.refresh_from_db()
+        self.assertEqual((channel.fetch_status, channel.fetch_failures), ('backoff', 1))
+        self.assertEqual(channel.last_fetch_error, 'ConnectionError: reset')
+        self.assertGreater(channel.fetch_blocked_until, timezone.now())
+
+    @mock.patch.object(fetcher, 'REQUEST_BUDGET', RequestBudget(10 ** 9))
+    @mock.patch.object(fetcher, 'BACKFILL_WRITE_SIZE', 300)
+    def test_backfill_resumes_from_checkpoint(self):
+        fake_channel = synthetic_channel('history_ch', 4545, 2000, spacing=timedelta(hours=6), album_ratio=0.2)
+        channel = Channel.objects.create(username='history_ch', title='history_ch')
+
+        class CrashingClient(FakeTelegramClient):
+            async def get_messages(self, *args, **kwargs):
+                if self.calls.get('get_messages', 0) >= 10:
+                    raise ConnectionError('connection lost')
+                return await super().get_messages(*args, **kwargs)
+
+        with self.assertRaises(ConnectionError):
+            asyncio.run(backfill_channel(CrashingClient([fake_channel]), channel, 0))
+        channel.refresh_from_db()
+        self.assertIsNotNone(channel.backfill_oldest_telegram_id)
+        self.assertIsNone(channel.backfill_completed_at)
+
+        client = FakeTelegramClient([fake_channel])
+        asyncio.run(backfill_channel(client, channel, 0))
+        self.assertLess(client.calls['get_messages'], 21)  # 2000 messages, 100 per page
+        posts = len({msg.grouped_id or msg.id for msg in fake_channel.messages})
+        self.assertEqual(Post.objects.filter(channel=channel).count(), posts)
+        channel.refresh_from_db()
+        self.assertIsNotNone(channel.backfill_completed_at)
+        self.assertFalse(POST_FINGERPRINTS[channel.pk])
+
+    def test_fetch_job_polls_new_channel_immediately(self):
+        fake_channel = synthetic_channel('queued_ch', 4646, 50)
+        client = FakeTelegramClient([fake_channel])
+        channel = Channel.objects.create(username='queued_ch', title='queued_ch')
+        enqueue_fetch(channel, PRIORITY_NEW_CHANNEL)
+        scheduler = ChannelScheduler(metrics_refresh_interval=1800)
+        job = claim_jobs('w1', 1, timezone.now())[0]
+
+        asyncio.run(fetcher.run_fetch_job(client, scheduler, job, 'w1'))
+        self.assertGreater(Post.objects.filter(channel=channel).count(), 0)
+        self.assertEqual(Channel.objects.get(pk=channel.pk).leased_by, 'w1')
+        self.assertFalse(FetchJob.objects.exists())
+        self.assertGreater(scheduler.states[channel.pk].due_at, 0)  # rescheduled, not polled again at once
+        self.assertEqual(scheduler.in_flight, set())
+
+    def test_fetch_job_for_channel_leased_elsewhere_is_handed_back(self):
+        client = FakeTelegramClient([synthetic_channel('taken_ch', 4747, 10)])
+        channel = Channel.objects.create(username='taken_ch', title='taken_ch')
+        enqueue_fetch(channel, PRIORITY_NEW_CHANNEL)
+        job = claim_jobs('w1', 1, timezone.now())[0]
+        self.assertTrue(claim_channel('w2', channel.pk, timezone.now()))  # leased after the job was claimed
+
+        asyncio.run(fetcher.run_fetch_job(client, ChannelScheduler(metrics_refresh_interval=1800), job, 'w1'))
+        self.assertFalse(Post.objects.filter(channel=channel).exists())
+        self.assertEqual([claimed.pk for claimed in claim_jobs('w2', 1, timezone.now())], [job.pk])
+
+    def test_bench_ingest_reports_throughput_and_cleans_up(self):
+        out = StringIO()
+        request_budget = fetcher.REQUEST_BUDGET
+        call_command('bench_ingest', channels=2, messages=40, cycles=2, stdout=out)
+        self.assertIn('msgs/sec', out.getvalue())
+        self.assertIn('DB statements/msg', out.getvalue())
+        self.assertFalse(Channel.objects.filter(username__startswith='bench_').exists())
+        self.assertIs(fetcher.REQUEST_BUDGET, request_budget)
+
+    def test_bench_ingest_refuses_a_remote_db(self):
+        with mock.patch.dict(connection.settings_dict, {'HOST': 'db.example.com'}):
+            with self.assertRaisesMessage(CommandError, '--i-know-this-is-prod'):
+                call_command('bench_ingest', channels=1, messages=10, cycles=1, stdout=StringIO())
+        self.assertFalse(Channel.objects.filter(username__startswith='bench_').exists())
+
+
+class TextEmbeddingStoreTests(ToyBackendMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = embeddings.get_backend()
+
+    def test_each_distinct_text_is_embedded_once(self):
+        vectors = EmbeddingGenerator.generate_embeddings_batch(['cat video', ' ', 'cat  video\n', 'dog'])
+        self.assertEqual(self.backend.batches, [['cat video', 'dog']])
+        self.assertIsNone(vectors[1])
+        self.assertEqual(vectors[2], vectors[0])
+        vectors = EmbeddingGenerator.generate_embeddings_batch(['dog', 'bird'])
+        self.assertEqual(self.backend.batches[1:], [['bird']])
+        self.assertEqual(vectors[0][:2], [3.0, 1.0])
+        self.assertEqual(self.backend.reused, 2)
+        self.assertEqual(TextEmbedding.objects.filter(model='toy-2d').count(), 3)
+
+    def test_store_is_keyed_by_model(self):
+        EmbeddingGenerator.generate_embeddings_batch(['dog'])
+        self.backend.model = 'toy-other'
+        EmbeddingGenerator.generate_embeddings_batch(['dog'])
+        self.assertEqual(self.backend.batches, [['dog'], ['dog']])
+
+
+class EmbeddingRateLimiterTests(SimpleTestCase):
+    def start_stub(self, **options):
+        server = StubEmbeddingServer(**options)
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def openai_backend(self, server, limiter):
+        from openai import OpenAI
+        backend = embeddings.OpenAIBackend()
+        backend._client = OpenAI(base_url=server.base_url, api_key='stub', max_retries=0)
+        backend.limiter = limiter
+        return backend
+
+    def test_reset_durations(self):
+        self.assertEqual(parse_duration('20ms'), 0.02)
+        self.assertEqual(parse_duration('6m0s'), 360)
+        self.assertEqual(parse_duration('1.5'), 1.5)
+        self.assertIsNone(parse_duration(None))
+
+    def test_aimd_halves_once_per_wave_and_recovers_additively(self):
+        limit = AIMDLimit(8)
+        first, second = limit.acquire(), limit.acquire()
+        limit.release(first, throttled=True)
+        limit.release(second, throttled=True)  # started before the cut: same wave
+        self.assertEqual(limit.limit, 4)
+        limit.release(limit.acquire())
+        self.assertEqual(limit.limit, 4.25)
+
+    def test_buckets_follow_rate_limit_headers(self):
+        limiter = EmbeddingRateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+        limiter.reserve(10)
+        limiter.settle(10, 40, {
+            'x-ratelimit-limit-requests': '50', 'x-ratelimit-remaining-requests': '20',
+            'x-ratelimit-limit-tokens': '900', 'x-ratelimit-remaining-tokens': '500',
+        })
+        self.assertEqual(limiter.requests.per_minute, 50)
+        self.assertLessEqual(limiter.requests.level, 20)
+        self.assertEqual(limiter.tokens.per_minute, 900)
+        self.assertLessEqual(limiter.tokens.level, 500)
+
+    def test_throttled_requests_are_retried_until_served(self):
+        # The stub admits 3 requests per 0.3s and sends no headers, so only its 429s slow the limiter down.
+        server = self.start_stub(rpm=3, window=0.3, rate_headers=False)
+        backend = self.openai_backend(server, EmbeddingRateLimiter(max_concurrency=6, max_retries=20))
+        texts = [f'text {number}' for number in range(12)]
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            vectors = list(pool.map(lambda text: backend.embed([text])[0], texts))
+        self.assertEqual(server.served, 12)
+        self.assertGreater(backend.limiter.throttled, 0)
+        self.assertLess(backend.limiter.concurrency.limit, 6)
+        for text, vector in zip(texts, vectors):
+            self.assertAlmostEqual(vector[0], stub_vector(text)[0], places=5)  # sent as base64 float32
+
+    def test_fatal_errors_are_not_retried(self):
+        server = self.start_stub()
+        backend = self.openai_backend(server, EmbeddingRateLimiter())
+        backend.get_client().base_url = server.base_url + '/missing/'
+        with self.assertRaises(Exception):
+            backend.embed(['text'])
+        self.assertEqual(backend.limiter.retried, 0)
+
+
+class EmbeddingQueueTests(TestCase):
+    def setUp(self):
+        set_embed_on_ingest(True)
+        self.channel = Channel.objects.create(username='queue_ch', title='queue_ch')
+        save_channel_messages(self.channel, [make_message(1, text='first'), make_message(2, text='')])
+        self.post = Post.objects.get(channel=self.channel, telegram_id=1)
+
+    def embed(self, texts):
+        return [unit_vector(float(len(text)), 1.0) if text else None for text in texts]
+
+    def test_fetcher_writes_queue_new_and_edited_texts_once(self):
+        self.assertEqual(list(EmbeddingJob.objects.values_list('post_id', flat=True)), [self.post.pk])  # blank text skipped
+        EmbeddingJob.objects.all().delete()
+        save_channel_messages(self.channel, [make_message(1, text='first', views=500)])
+        self.assertFalse(EmbeddingJob.objects.exists())  # counters only
+        save_channel_messages(self.channel, [make_message(1, text='edited')])
+        save_channel_messages(self.channel, [make_message(1, text='edited again')])
+        self.assertEqual(list(EmbeddingJob.objects.values_list('post_id', flat=True)), [self.post.pk])
+
+    def test_nothing_is_queued_while_disabled(self):
+        call_command('embed_queue', '--disable', stdout=StringIO())
+        self.assertFalse(EmbeddingJob.objects.exists())
+        save_channel_messages(self.channel, [make_message(1, text='edited'), make_message(3, text='third')])
+        self.assertFalse(EmbeddingJob.objects.exists())
+        set_embed_on_ingest(True)
+        save_channel_messages(self.channel, [make_message(1, text='edited twice')])
+        self.assertEqual(list(EmbeddingJob.objects.values_list('post_id', flat=True)), [self.post.pk])
+
+    def test_queued_posts_are_embedded_and_dequeued(self):
+        self.assertEqual(embed_queued('w1'), 0)  # not settled yet
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=self.embed):
+            call_command('embed_queue', '--once', stdout=StringIO())
+        self.assertEqual(list(Post.objects.get(pk=self.post.pk).embedding[:2]), [5.0, 1.0])
+        self.assertFalse(EmbeddingJob.objects.exists())
+
+    def test_edit_during_embedding_requeues_without_stale_vector(self):
+        def edit_while_embedding(texts):
+            save_channel_messages(self.channel, [make_message(1, text='second version')])
+            return self.embed(texts)
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=edit_while_embedding):
+            embed_queued('w1', settle=0)
+        self.assertIsNone(Post.objects.get(pk=self.post.pk).embedding)
+        job = EmbeddingJob.objects.get()
+        self.assertIsNone(job.claimed_at)
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=self.embed):
+            embed_queued('w1', settle=0)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).embedding[0], len('second version'))
+
+    def test_post_failing_on_its_own_is_isolated_then_parked(self):
+        save_channel_messages(self.channel, [make_message(3, text='third'), make_message(4, text='poison')])
+        poison = Post.objects.get(channel=self.channel, telegram_id=4)
+
+        def embed(texts):
+            if 'poison' in texts:
+                raise ValueError('input rejected')
+            return self.embed(texts)
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=embed) as generate:
+            embed_queued('w1', settle=0)
+            self.assertFalse(Post.objects.filter(channel=self.channel, text__in=['first', 'third'], embedding__isnull=True).exists())
+            job = EmbeddingJob.objects.get()
+            self.assertEqual((job.post_id, job.attempts), (poison.pk, 1))
+            for _ in range(EMBED_QUEUE_MAX_ATTEMPTS - 1):
+                EmbeddingJob.objects.update(claimed_at=None)  # the claim expired
+                embed_queued('w1', settle=0)
+            self.assertIsNotNone(EmbeddingJob.objects.get().parked_at)
+            calls = generate.call_count
+            EmbeddingJob.objects.update(claimed_at=None)
+            self.assertEqual(embed_queued('w1', settle=0), 0)
+            self.assertEqual(generate.call_count, calls)
+        save_channel_messages(self.channel, [make_message(4, text='fixed')])
+        job = EmbeddingJob.objects.get()
+        self.assertEqual((job.attempts, job.parked_at), (0, None))
+
+    def test_once_reports_embedded_failed_and_parked_posts(self):
+        save_channel_messages(self.channel, [make_message(3, text='third'), make_message(4, text='poison')])
+
+        def embed(texts):
+            if 'poison' in texts:
+                raise ValueError('input rejected')
+            return self.embed(texts)
+        out = StringIO()
+        with mock.patch('videos.embedding_queue.EMBED_QUEUE_MAX_ATTEMPTS', 1):
+            with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=embed):
+                call_command('embed_queue', '--once', stdout=out)
+        self.assertIn('Embedded 2 queued posts (1 failed, 1 parked)', out.getvalue())
+
+    def test_failed_batch_is_retried_after_claim_expires(self):
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=RuntimeError('down')):
+            self.assertEqual(embed_queued('w1', settle=0), 0)
+        now = timezone.now()
+        self.assertEqual(claim_embedding_jobs('w2', 10, now, settle=0), [])
+        self.assertEqual(len(claim_embedding_jobs('w2', 10, now + timedelta(seconds=LEASE_TTL + 1), settle=0)), 1)
+
+
+class GenerateEmbeddingsCommandTests(ToyBackendMixin, TransactionTestCase):
+    """The command writes from its own thread, so data must be committed."""
+
+    def setUp(self):
+        super().setUp()
+        channel = Channel.objects.create(username='emb_ch', title='emb_ch')
+        self.posts = [make_post(channel, telegram_id, text=f'post {telegram_id}') for telegram_id in range(1, 8)]
+        self.embedded_texts = []
+
+    def fake_batch(self, texts, fail_on=None):
+        if fail_on in texts:
+            raise RuntimeError('embedding service unavailable')
+        self.embedded_texts += texts
+        return [unit_vector(1.0) for _ in texts]
+
+    def run_command(self, *args, fail_on=None):
+        def embed(texts, prepared=None):
+            return self.fake_batch(texts, fail_on)
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=embed):
+            call_command('generate_embeddings', '--batch_size', '2', '--threads', '2', *args, stdout=StringIO())
+
+    def test_missing_embeddings_are_all_filled(self):
+        # Keyset paging: rows that get an embedding mid-run must not shift later batches.
+        Post.objects.filter(pk=self.posts[0].pk).update(embedding=unit_vector(0.0, 1.0))
+        self.run_command()
+        self.assertFalse(Post.objects.filter(embedding__isnull=True).exists())
+        self.assertEqual(sorted(self.embedded_texts), sorted(post.text for post in self.posts[1:]))
+
+    def test_interrupted_force_run_resumes_from_checkpoint(self):
+        self.run_command('--force', fail_on='post 5')
+        checkpoint = EmbeddingCheckpoint.objects.get()
+        self.assertEqual(checkpoint.last_post_id, self.posts[3].pk)  # batches are [1,2] [3,4] [5,6] [7]
+        self.embedded_texts = []
+        self.run_command('--force')
+        self.assertEqual(self.embedded_texts, ['post 5', 'post 6'])  # post 7 was written after the failure
+        self.assertFalse(EmbeddingCheckpoint.objects.exists())
+
+    def test_writer_error_stops_the_run(self):
+        # 7 posts in pages of 2 fill the queue (2 threads x 2) before the producer is done.
+        with mock.patch('django.db.models.query.QuerySet.bulk_update', side_effect=DatabaseError('disk full')):
+            with self.assertRaisesMessage(DatabaseError, 'disk full'):
+                self.run_command('--force')
+        self.assertEqual(EmbeddingCheckpoint.objects.get().last_post_id, 0)
+
+    def test_queued_jobs_are_dropped_for_the_texts_embedded(self):
+        set_embed_on_ingest(True)
+        for post in self.posts[:3]:
+            Post.objects.filter(pk=post.pk).update(text=f'{post.text}, edited')
+
+        def embed(texts, prepared=None):
+            if 'post 3, edited' in texts:
+                Post.objects.filter(pk=self.posts[2].pk).update(text='post 3, edited twice')
+                connection.close()  # opened by this embedding thread
+            return self.fake_batch(texts)
+        with mock.patch.object(EmbeddingGenerator, 'generate_embeddings_batch', side_effect=embed):
+            call_command('generate_embeddings', '--force', '--batch_size', '2', '--threads', '2', stdout=StringIO())
+        self.assertEqual(list(EmbeddingJob.objects.values_list('post_id', flat=True)), [self.posts[2].pk])
+
+    def test_force_run_skips_posts_embedded_from_the_same_text(self):
+        self.run_command('--force')
+        self.embedded_texts = []
+        Post.objects.filter(pk=self.posts[2].pk).update(text='post 3, edited')
+        self.run_command('--force')
+        self.assertEqual(self.embedded_texts, ['post 3, edited'])
+
+    def test_pages_are_tokenized_once_and_packed_by_tokens(self):
+        backend = embeddings.get_backend()
+        backend.request_tokens = 12
+        prepare = mock.Mock(side_effect=lambda texts: [(text, len(text)) for text in texts])
+        with mock.patch.object(backend, 'prepare', prepare):
+            call_command('generate_embeddings', '--batch_size', '7', '--threads', '2', stdout=StringIO())
+        prepare.assert_called_once()
+        # 'post N' counts 6 tokens, so two fit each request.
+        self.assertEqual(sorted(backend.batches), [['post 1', 'post 2'], ['post 3', 'post 4'], ['post 5', 'post 6'], ['post 7']])
+        self.assertFalse(Post.objects.filter(embedding__isnull=True).exists())
+
+    def test_limit_keeps_checkpoint(self):
+        self.run_command('--force', '--limit', '3')
+        self.assertEqual(EmbeddingCheckpoint.objects.get().last_post_id, self.posts[2].pk)
+        self.run_command('--force', '--restart', '--limit', '1')
+        self.assertEqual(EmbeddingCheckpoint.objects.get().last_post_id, self.posts[0].pk)
@@ -8,6 +8,7 @@ from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.db.models import ExpressionWrapper, FloatField, F
 from django.db.models.expressions import RawSQL
+from .jobs import PRIORITY_NEW_CHANNEL, enqueue_fetch
 from .models import Channel, Post
 import urllib.request
 import re
@@ -18,7 +19,7 @@ DEFAULT_SORT = '-trending'
 ALLOWED_SORTS = [
     'date', '-date', 'views', '-views',
     'forwards', '-forwards', 'replies', '-replies',
-    '-popular', '-trending', '-viral',
+    '-popular', '-trending', '-viral', '-relevance',
 ]
 
 
@@ -33,6 +34,14 @@ def apply_sort(posts, sort_by):
             "(views + forwards*30 + replies*5)::float / POWER(EXTRACT(EPOCH FROM (NOW() - date))/3600.0 + 2, 1.5)",
             []
         )).order_by('-trending_score')
+    elif sort_by == '-relevance':
+        # rank from Post.*_search (ts_rank, similarity or the fused score); semantic and hybrid
+        # results already come in rank order. Other result sets have no relevance, so newest first.
+        if 'rank' not in posts.query.annotations:
+            return posts.order_by('-date')
+        if posts.query.order_by[:1] == ('-rank',):
+            return posts
+        return posts.order_by('-rank', '-date')
     elif sort_by == '-viral':
         return posts.annotate(viral_score=ExpressionWrapper(
             F('forwards') * 1.0 / (F('views') + 1),
@@ -94,29 +103,29 @@ def home(request):
             # Hybrid search: both semantic and keyword
             posts = Post.hybrid_search(
                 query_text=search_query,
-                keyword_filters=Q(text__icontains=search_query) & additional_filters,
+                filters=additional_filters,
                 limit=1000
-            )
+            ).select_related('channel')
         elif search_semantic:
             # Semantic search only
             posts = Post.semantic_search(
                 query_text=search_query,
                 filters=additional_filters,
                 limit=1000
-            )
+            ).select_related('channel')
         else:
             # Keywords search only (default)
-            posts = Post.objects.select_related('channel').filter(
-                Q(text__icontains=search_query) & additional_filters
-            )
+            posts = Post.keyword_search(search_query, additional_filters).select_related('channel')
     else:
         # No search query - apply filters to all posts
         posts = Post.objects.select_related('channel').filter(additional_filters)
     
     implicit_sort = 'sort' not in request.GET
-    # Pure semantic (keywords off): keep embedding relevance order. Keywords or hybrid: honor sort.
+    # Pure semantic (keywords off): keep embedding relevance order. Hybrid: keep the fused
+    # relevance order unless a sort was picked. Keywords only: honor sort.
     semantic_only = search_semantic and not search_keywords
-    if not semantic_only:
+    hybrid_ranked = bool(search_query) and search_semantic and search_keywords and implicit_sort
+    if not semantic_only and not hybrid_ranked:
         sort_by = request.GET.get('sort', DEFAULT_SORT)
         if sort_by in ALLOWED_SORTS:
             posts = apply_sort(posts, sort_by)
@@ -194,11 +203,11 @@ def post_detail(request, username, post_id):
     post = get_object_or_404(Post, channel=channel, telegram_id=post_id)
     
     # Get filters from query params to maintain context
-    posts = Post.objects.select_related('channel').all()
-    
     search_query = request.GET.get('q', '').strip()
     if search_query:
-        posts = posts.filter(text__icontains=search_query)
+        posts = Post.keyword_search(search_query).select_related('channel')
+    else:
+        posts = Post.objects.select_related('channel').all()
     
     channel_filter = request.GET.get('channel', '').strip()
     if channel_filter:
@@ -355,12 +364,14 @@ def add_channel(request):
         if Channel.objects.filter(username=username).exists():
             return JsonResponse({'success': False, 'error': 'Channel already exists'}, status=400)
         
-        # Create channel with username as title (fetcher will update it later)
-        Channel.objects.create(username=username, title=username)
+        # Create channel with username as title (fetcher will update it later). The first fetch
+        # jumps the fetch queue; the history is backfilled in the background.
+        channel = Channel.objects.create(username=username, title=username, backfill_requested_at=timezone.now())
+        enqueue_fetch(channel, PRIORITY_NEW_CHANNEL)
         
         return JsonResponse({
             'success': True,
-            'message': f'Channel "@{username}" added successfully! Posts will appear within 1 minute.',
+            'message': f'Channel "@{username}" added successfully! Posts will appear within a few seconds.',
             'channel': {
                 'username': username,
                 'title': username